@@ -1,5 +1,5 @@
 import ELK from "elkjs/lib/elk.bundled.js";
-import React, { useCallback, useEffect, useState } from "react";
+import React, { useCallback, useEffect, useRef, useState } from "react";
 import ReactFlow, {
   ReactFlowProvider,
   Panel,
@@ -106,24 +106,53 @@ const LayoutFlow = () => {
 
   }, [setNodes, setEdges]);
 
+  // Last graph version received from the backend, only changed nodes are fetched after it
+  const versionRef = useRef(0);
+  // Versions count per run, so the cursor is sent together with its run
+  const runRef = useRef<string | null>(null);
+
   useEffect(() => {
     const intervalId = setInterval(() => {
-      fetch("http://localhost:8000/graph")
+      const sinceRun = runRef.current ? `&since_run=${runRef.current}` : "";
+      fetch(`http://localhost:8000/graph?since=${versionRef.current}${sinceRun}`)
         .then((response) => response.json())
         .then((data) => {
-          const currentLength = nodes.length;
-          const newNodes = data.node.filter((node: { id: number }) => node.id > currentLength);
+          const runChanged = runRef.current !== null && data.run_id !== runRef.current;
+          runRef.current = data.run_id;
+          versionRef.current = data.version;
+          if (data.node.length === 0 && !data.full) {
+            return;
+          }
+
+          const knownIds = new Set(runChanged ? [] : nodes.map((node) => node.id));
+          const newNodes = data.node.filter((node: { id: number }) => !knownIds.has(String(node.id)));
           const formattedNewNodes = newNodes.map((node: { id: any; name: any }) => ({
             id: String(node.id),
             data: { label: node.name },
             position: { x: 0, y: 0 },
             style: nodeStyles[node.type] || {},
           }));
-          setData(data);
+          setData((prevData) => {
+            if (data.full) {
+              return { node: data.node };
+            }
+            const changed = new Map(data.node.map((node: { id: number }) => [node.id, node]));
+            const updated = prevData.node.map((node: { id: number }) => changed.get(node.id) || node);
+            const added = data.node.filter(
+              (node: { id: number }) => !prevData.node.some((prev: { id: number }) => prev.id === node.id)
+            );
+            return { node: [...updated, ...added] };
+          });
           //console.log(data);
 
           let updatesMade = false; // Flag to check if any updates were made
 
+          // A new run starts with an empty graph
+          if (runChanged) {
+            setNodes([]);
+            setEdges([]);
+          }
+
           // Update nodes if new ones are found
           if (formattedNewNodes.length > 0) {
             setNodes((currentNodes) => [...currentNodes, ...formattedNewNodes]);
@@ -0,0 +1,114 @@
+import argparse
+import json
+import platform
+import subprocess
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from benchmarks.suite import BENCHMARKS
+
+# Timings depend on the machine, so the results file is not tracked
+RESULTS = Path(__file__).parent / "results.jsonl"
+THRESHOLD = 0.2
+
+
+def git_commit() -> Dict:
+    def git(*args: str) -> str:
+        return subprocess.run(
+            ["git", *args], capture_output=True, text=True, cwd=Path(__file__).parent
+        ).stdout.strip()
+
+    return {
+        "commit": git("rev-parse", "--short", "HEAD"),
+        "dirty": bool(git("status", "--porcelain")),
+    }
+
+
+def load(path: Path) -> List[Dict]:
+    if not path.exists():
+        return []
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def compare(current: Dict, previous: Dict, threshold: float = THRESHOLD) -> List[str]:
+    """
+    The metrics that got worse by more than `threshold` since a previous run.
+
+    Latencies (_ms, _us) are worse when they grow, throughputs (_per_s) when
+    they shrink.
+    """
+    regressions = []
+    for key, metrics in current["results"].items():
+        before = previous["results"].get(key, {})
+        for metric, value in metrics.items():
+            old = before.get(metric)
+            if not old or value is None:
+                continue
+
+            change = (value - old) / old
+            if metric.endswith("_per_s"):
+                change = -change
+            elif not metric.endswith(("_ms", "_us")):
+                continue
+
+            if change > threshold:
+                regressions.append(
+                    f"{key} {metric}: {old} -> {value} ({change:+.0%} worse)"
+                )
+
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark the hot paths with stand-in LLM and embedding backends."
+    )
+    parser.add_argument("names", nargs="*", help=f"A subset of {list(BENCHMARKS)}")
+    parser.add_argument("--quick", action="store_true", help="Smaller sizes.")
+    parser.add_argument("--output", type=Path, default=RESULTS)
+    parser.add_argument(
+        "--save", action="store_true", help="Append the run to the results file."
+    )
+    args = parser.parse_args()
+
+    unknown = set(args.names) - set(BENCHMARKS)
+    if unknown:
+        parser.error(f"Unknown benchmarks {sorted(unknown)}.")
+
+    results = {}
+    for name in args.names or BENCHMARKS:
+        for key, metrics in BENCHMARKS[name](args.quick):
+            print(key, metrics)
+            results[key] = metrics
+
+    run = dict(
+        git_commit(),
+        timestamp=time.strftime("%Y-%m-%dT%H:%M:%S"),
+        python=platform.python_version(),
+        machine=platform.machine(),
+        quick=args.quick,
+        results=results,
+    )
+
+    previous: Optional[Dict] = next(
+        (
+            entry
+            for entry in reversed(load(args.output))
+            if entry["quick"] == args.quick
+        ),
+        None,
+    )
+    if previous:
+        regressions = compare(run, previous)
+        print(f"\nCompared to {previous['commit']} ({previous['timestamp']}):")
+        print("\n".join(regressions) or "No regressions.")
+
+    if args.save:
+        with open(args.output, "a") as f:
+            f.write(json.dumps(run) + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+import contextlib
+import json
+import random
+import time
+from pathlib import Path
+from test.conftest import isolated_runs
+from typing import Any, Iterator, List, Optional
+from unittest import mock
+
+from langchain_core.documents import Document
+from langchain_core.language_models import SimpleChatModel
+from langchain_core.messages import BaseMessage
+
+from src.data import loader, wrapper
+from src.data.corpus import CORPUS_FILE, Corpus
+from src.utils import utils
+
+PROVIDER = "hashing:384"
+WORDS = (
+    "carbon emissions energy heat pump electric car solar wind grid policy tax "
+    "transport building insulation diet meat forest steel cement hydrogen "
+    "battery storage efficiency subsidy aviation shipping rail bicycle city "
+    "methane agriculture fertilizer renewable coal gas nuclear price market"
+).split()
+
+
+class FakeChatModel(SimpleChatModel):
+    """A chat model that answers every generate_metadata stage instantly."""
+
+    latency: float = 0.0
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-benchmark"
+
+    def _call(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Any = None,
+        **kwargs: Any,
+    ) -> str:
+        time.sleep(self.latency)
+        prompt = messages[-1].content
+
+        if "JSON" in prompt:
+            return json.dumps(
+                {"effectiveness": 3, "scientific_concensus": 4, "realization_speed": 2}
+            )
+        if "search query" in prompt:
+            return "electric cars emissions"
+        return text(random.Random(len(prompt)), 60)
+
+
+def text(rng: random.Random, words: int) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(words))
+
+
+def documents(count: int, words: int = 120, seed: int = 0) -> List[Document]:
+    """Synthetic documents that fit into one chunk each."""
+    rng = random.Random(seed)
+    return [
+        Document(
+            page_content=text(rng, words),
+            metadata={"title": f"Paper {i}", "source": f"synthetic:{i}"},
+        )
+        for i in range(count)
+    ]
+
+
+@contextlib.contextmanager
+def knowledge_base(root: Path, chunks: int) -> Iterator[wrapper.KnowledgeBase]:
+    """A knowledge base over synthetic documents with local embeddings."""
+    with mock.patch.object(loader, "ROOT", root):
+        Corpus(root / CORPUS_FILE).add(documents(chunks))
+        loader.Database(name=wrapper.DATABASE_NAME, from_corpus=True, provider=PROVIDER)
+        yield wrapper.KnowledgeBase()
+
+
+@contextlib.contextmanager
+def graph_run(root: Path, generate_metadata=None) -> Iterator[str]:
+    """An isolated graph run whose metadata is generated by `generate_metadata`."""
+    if generate_metadata is None:
+        generate_metadata = lambda *args, **kwargs: {"description": ""}
+
+    with isolated_runs(root), mock.patch.object(
+        utils, "generate_metadata", generate_metadata
+    ):
+
+        run_id = utils.create_run()
+        try:
+            yield run_id
+        finally:
+            utils.wait_for_metadata(run_id)
+
+
+def fill_graph(run_id: str, nodes: int) -> None:
+    """Add roots with 10 areas of 10 actions each until the graph has `nodes` nodes."""
+    count = 0
+    for root in range(nodes):
+        utils.update_graph(f"Root {root}", run_id)
+        count += 1
+        for area in range(10):
+            if count >= nodes:
+                return
+            utils.update_graph(f"Root {root}/Area {area}", run_id)
+            count += 1
+            for action in range(10):
+                if count >= nodes:
+                    return
+                utils.update_graph(f"Root {root}/Area {area}/Action {action}", run_id)
+                count += 1
@@ -0,0 +1,195 @@
+import statistics
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Tuple
+from unittest import mock
+
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+from benchmarks import fakes
+from src.utils import utils
+from src.utils.tracing import recent_spans
+
+Row = Tuple[str, Dict[str, float]]
+
+BENCHMARKS: Dict[str, Callable[[bool], Iterator[Row]]] = {}
+
+
+def benchmark(fn: Callable[[bool], Iterator[Row]]) -> Callable[[bool], Iterator[Row]]:
+    BENCHMARKS[fn.__name__] = fn
+    return fn
+
+
+def timings(seconds: List[float], unit: str = "ms") -> Dict[str, float]:
+    """Mean, median and 95th percentile of several measurements."""
+    scale = 1000 if unit == "ms" else 1_000_000
+    values = sorted(s * scale for s in seconds)
+    p95 = values[min(len(values) - 1, int(len(values) * 0.95))]
+    return {
+        f"mean_{unit}": round(statistics.fmean(values), 3),
+        f"p50_{unit}": round(statistics.median(values), 3),
+        f"p95_{unit}": round(p95, 3),
+    }
+
+
+def measure(fn: Callable[[], object], repeat: int) -> List[float]:
+    seconds = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        seconds.append(time.perf_counter() - start)
+    return seconds
+
+
+@benchmark
+def graph_insert(quick: bool) -> Iterator[Row]:
+    """update_graph cost of one action node against the graph size."""
+    for size in [100, 1000] if quick else [100, 1000, 5000]:
+        with tempfile.TemporaryDirectory() as tmp, fakes.graph_run(Path(tmp)) as run:
+            fakes.fill_graph(run, size)
+            utils.update_graph("Extra", run)
+            utils.update_graph("Extra/Area", run)
+
+            names = iter(range(1_000_000))
+            seconds = measure(
+                lambda: utils.update_graph(f"Extra/Area/Action {next(names)}", run),
+                repeat=200,
+            )
+            yield f"graph_insert/nodes={size}", timings(seconds, "us")
+
+
+@benchmark
+def generate_metadata(quick: bool) -> Iterator[Row]:
+    """Latency of every generate_metadata stage, with an instant and a slow LLM."""
+    stages = ["description", "keywords", "retrieval", "science", "evaluation"]
+    repeat = 5 if quick else 20
+    action = ["Transport", "Cars", "Speed Limit"]
+
+    with tempfile.TemporaryDirectory() as tmp, fakes.knowledge_base(
+        Path(tmp), chunks=1000
+    ) as kb:
+        llm = fakes.FakeChatModel()
+
+        with mock.patch.object(
+            utils, "get_chat_model", lambda *args, **kwargs: llm
+        ), mock.patch.object(utils, "get_knowledge_base", lambda: kb):
+            for type, path in [
+                ("root", ["Transport"]),
+                ("area", ["Transport", "Cars"]),
+            ]:
+                seconds = measure(lambda: utils.generate_metadata(path, type), repeat)
+                yield f"generate_metadata/{type}", timings(seconds)
+
+            seconds = measure(lambda: utils.generate_metadata(action, "action"), repeat)
+            for stage in stages:
+                spans = recent_spans(limit=repeat, name=f"metadata.{stage}")
+                yield f"generate_metadata/action/{stage}", timings(
+                    [span["duration_ms"] / 1000 for span in spans]
+                )
+            yield "generate_metadata/action/total", timings(seconds)
+
+            # With real round trips the total is the critical path, not the sum
+            llm.latency = 0.05
+            seconds = measure(lambda: utils.generate_metadata(action, "action"), 3)
+            yield "generate_metadata/action/total_llm_50ms", timings(seconds)
+
+
+@benchmark
+def knowledge_base_query(quick: bool) -> Iterator[Row]:
+    """KnowledgeBase.query latency against corpus size, k and mode."""
+    rng = fakes.random.Random(1)
+    queries = [fakes.text(rng, 8) for _ in range(50)]
+
+    for chunks in [1000] if quick else [1000, 10000]:
+        with tempfile.TemporaryDirectory() as tmp, fakes.knowledge_base(
+            Path(tmp), chunks=chunks
+        ) as kb:
+            for mode in ["vector", "keyword", "hybrid"]:
+                for k in [1, 5, 20]:
+                    queue = iter(queries * 10)
+
+                    def query():
+                        text = next(queue)
+                        kb.query(text, text, k=k, mode=mode)
+
+                    seconds = measure(query, repeat=len(queries))
+                    yield f"query/chunks={chunks}/mode={mode}/k={k}", timings(seconds)
+
+            start = time.perf_counter()
+            kb.query_many(queries, k=5)
+            seconds = time.perf_counter() - start
+            yield f"query_many/chunks={chunks}", {
+                "queries_per_s": round(len(queries) / seconds, 1)
+            }
+
+
+@benchmark
+def splitter(quick: bool) -> Iterator[Row]:
+    """Throughput of the chunking used by Database."""
+    docs = fakes.documents(200 if quick else 1000, words=2000)
+    splitter = RecursiveCharacterTextSplitter(
+        chunk_size=1000, chunk_overlap=200, add_start_index=True
+    )
+
+    start = time.perf_counter()
+    chunks = splitter.split_documents(docs)
+    seconds = time.perf_counter() - start
+
+    size = sum(len(doc.page_content) for doc in docs)
+    yield "splitter", {
+        "mb_per_s": round(size / seconds / 1_000_000, 3),
+        "chunks_per_s": round(len(chunks) / seconds, 1),
+    }
+
+
+@benchmark
+def pdf_extraction(quick: bool) -> Iterator[Row]:
+    """Pages per second of every extraction backend."""
+    import fitz
+
+    from src.data.extract import benchmark as extract_benchmark
+
+    rng = fakes.random.Random(2)
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = []
+        for i in range(4 if quick else 16):
+            pdf = fitz.open()
+            for _ in range(10):
+                page = pdf.new_page()
+                page.insert_textbox(
+                    page.rect + (72, 72, -72, -72), fakes.text(rng, 400)
+                )
+            path = Path(tmp) / f"paper_{i}.pdf"
+            pdf.save(path)
+            paths.append(str(path))
+
+        for backend, result in extract_benchmark(paths).items():
+            yield f"pdf_extraction/{backend}", {
+                "pages_per_s": result["pages_per_second"]
+            }
+
+
+@benchmark
+def graph_endpoint(quick: bool) -> Iterator[Row]:
+    """/graph response time and size, full and as a delta."""
+    from fastapi.testclient import TestClient
+
+    from run import app
+
+    client = TestClient(app)
+    for size in [100, 1000] if quick else [100, 1000, 5000]:
+        with tempfile.TemporaryDirectory() as tmp, fakes.graph_run(Path(tmp)) as run:
+            fakes.fill_graph(run, size)
+            utils.wait_for_metadata(run)
+            version = utils.get_store(run).version
+
+            for name, params in [
+                ("full", {"run_id": run}),
+                ("delta", {"run_id": run, "since": version - 10}),
+            ]:
+                response = client.get("/graph", params=params)
+                seconds = measure(lambda: client.get("/graph", params=params), 20)
+                yield f"graph_endpoint/nodes={size}/{name}", dict(
+                    timings(seconds), kilobytes=round(len(response.content) / 1000, 1)
+                )
@@ -1,22 +1,162 @@
+import threading
+import time
+from typing import Dict, NamedTuple, Optional
+
 from langchain.agents import AgentExecutor
 from langchain.agents.format_scratchpad.openai_tools import \
     format_to_openai_tool_messages
 from langchain.agents.output_parsers.openai_tools import \
     OpenAIToolsAgentOutputParser
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
-from langchain_openai import ChatOpenAI
 
 from src.agent.prompts import system_prompt, user_prompt
+from src.utils.llm import get_chat_model
+from src.utils.scheduler import Priority
+from src.utils.tracing import count_tokens, span, traced, tracing_callback
+from src.utils.utils import get_store
+
+MAX_STEPS = 15
+MAX_TOKENS = 150_000
+MAX_SECONDS = 600
+
+
+class RunBudget(NamedTuple):
+    """
+    Limits of a graph generation run.
+
+    Args:
+        max_steps (int): Agent iterations, each one LLM call and its tool calls.
+        max_tokens (int): Prompt and completion tokens of all LLM calls.
+        max_seconds (float): Wall-clock time.
+    """
+
+    max_steps: int = MAX_STEPS
+    max_tokens: int = MAX_TOKENS
+    max_seconds: float = MAX_SECONDS
+
+
+class RunStopped(Exception):
+    """A run was cancelled or ran out of budget."""
+
+    def __init__(self, status: str, reason: str):
+        super().__init__(reason)
+        self.status = status
+        self.reason = reason
+
+
+class RunControl(BaseCallbackHandler):
+    """
+    Enforces the budget of a run and lets other threads cancel it.
+
+    The checks run before every LLM and tool call, so a run stops at the
+    next call instead of after the whole stream.
+    """
+
+    raise_error = True
+
+    def __init__(self, budget: RunBudget, model: str):
+        self.budget = budget
+        self.model = model
+        self.steps = 0
+        self.tokens = 0
+        self.started = time.monotonic()
+        self.cancelled = threading.Event()
+
+    def cancel(self) -> None:
+        self.cancelled.set()
+
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started
+
+    def check(self) -> None:
+        """
+        Raises:
+            RunStopped: If the run was cancelled or exceeded its budget.
+        """
+        if self.cancelled.is_set():
+            raise RunStopped("cancelled", "Cancelled by the user.")
+        if self.tokens >= self.budget.max_tokens:
+            raise RunStopped("budget_exceeded", f"Used {self.tokens} tokens.")
+        if self.elapsed() >= self.budget.max_seconds:
+            raise RunStopped("budget_exceeded", f"Ran {self.elapsed():.0f} seconds.")
+
+    def progress(self) -> Dict:
+        return {
+            "steps": self.steps,
+            "tokens": self.tokens,
+            "elapsed_seconds": round(self.elapsed(), 1),
+            "budget": self.budget._asdict(),
+        }
+
+    def on_chat_model_start(self, serialized, messages, **kwargs) -> None:
+        # Every step starts with an LLM call, so the steps are checked here
+        # and the tool calls of the last allowed step still run
+        if self.steps >= self.budget.max_steps:
+            raise RunStopped("budget_exceeded", f"Reached {self.steps} steps.")
+        self.check()
+        text = "\n".join(str(m.content) for batch in messages for m in batch)
+        self.tokens += count_tokens(text, self.model)
+
+    def on_llm_end(self, response: LLMResult, **kwargs) -> None:
+        text = "".join(g.text for batch in response.generations for g in batch)
+        self.tokens += count_tokens(text, self.model)
+
+    def on_tool_start(self, serialized, input_str, **kwargs) -> None:
+        self.check()
+
+
+_controls: Dict[str, RunControl] = {}
+_controls_lock = threading.Lock()
+
+
+def cancel_run(run_id: str) -> bool:
+    """
+    Cancel a running graph generation.
+
+    Args:
+        run_id (str): The run id.
+
+    Returns:
+        bool: Whether the run was running.
+    """
+    with _controls_lock:
+        control = _controls.get(run_id)
+
+    if control is None:
+        return False
+
+    control.cancel()
+    return True
 
 
 class Agent:
-    def __init__(self, tools: list[callable], power: bool = False):
+    def __init__(
+        self,
+        tools: list[callable],
+        power: bool = False,
+        run_id: Optional[str] = None,
+        budget: Optional[RunBudget] = None,
+    ):
         self.tools = tools
+        self.run_id = run_id
+        self.budget = budget or RunBudget()
         self.system_prompt = system_prompt
         self.user_prompt = user_prompt
 
-        model = "gpt-4-turbo-preview" if power else "gpt-3.5-turbo"
-        self.llm = ChatOpenAI(model_name=model, temperature=0)
+        self.model = "gpt-4-turbo-preview" if power else "gpt-3.5-turbo"
+        self.llm = get_chat_model(
+            self.model, temperature=0, priority=Priority.BACKGROUND
+        )
+
+        # Registered before the run starts, so a cancel that arrives while
+        # the run is queued stops it at its first check
+        self.control = RunControl(self.budget, self.model)
+        if self.run_id is not None:
+            with _controls_lock:
+                _controls[self.run_id] = self.control
+        self.__progress(self.control, status="queued")
 
     def create_graph(self, dropdown_choice: str):
         system_prompt = self.system_prompt.format(dropdown_choice=dropdown_choice)
@@ -44,12 +184,45 @@ class Agent:
             | OpenAIToolsAgentOutputParser()
         )
 
+        control = self.control
         agent_executor = AgentExecutor(
             agent=agent,
             tools=self.tools,
             verbose=True,
             early_stopping_method="generate",
+            # The budget limits the steps
+            max_iterations=None,
         )
 
-        # Execute and print the last output
-        output_list = list(agent_executor.stream({"input": user_prompt}))
+        # The time budget counts from the start of the run, not of the queue
+        control.started = time.monotonic()
+        self.__progress(control, status="running")
+
+        try:
+            with span("agent", sector=dropdown_choice):
+                # Callbacks of the config, unlike those of the executor, also
+                # reach the LLM and tool calls
+                stream = agent_executor.stream(
+                    {"input": user_prompt},
+                    {"callbacks": [tracing_callback, control]},
+                )
+                for chunk in traced(stream, "agent.step"):
+                    if "actions" in chunk:
+                        control.steps += 1
+                        tools = [action.tool for action in chunk["actions"]]
+                        self.__progress(control, last_step=", ".join(tools))
+        except RunStopped as e:
+            self.__progress(control, status=e.status, reason=e.reason)
+        except Exception as e:
+            print(e)
+            self.__progress(control, status="failed", reason=str(e))
+        else:
+            self.__progress(control, status="done")
+        finally:
+            with _controls_lock:
+                _controls.pop(self.run_id, None)
+
+    def __progress(self, control: RunControl, **fields) -> None:
+        """Write the progress of the run to its graph store."""
+        if self.run_id is not None:
+            get_store(self.run_id).set_progress(**control.progress(), **fields)
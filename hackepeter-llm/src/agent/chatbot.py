@@ -1,11 +1,12 @@
-from typing import List
+from typing import AsyncIterator, List, Optional
 
 from dotenv import load_dotenv
-from langchain.chains import ConversationChain
-from langchain.chains.conversation.memory import ConversationBufferMemory
-from langchain.memory import ChatMessageHistory
-from langchain_openai import ChatOpenAI
-from pydantic import BaseModel
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage
+from pydantic import BaseModel, field_validator
+
+from src.utils.llm import get_chat_model
+from src.utils.scheduler import Priority
 
 load_dotenv()
 
@@ -15,14 +16,35 @@ class ChatInput(BaseModel):
     sources: List[str]
     history: List[dict]
 
+    @field_validator("history")
+    @classmethod
+    def ends_with_user(cls, history: List[dict]) -> List[dict]:
+        # Rejected with a 422 by FastAPI instead of failing in the chatbot
+        if not history or "user" not in history[-1]:
+            raise ValueError("The last message of the history must be from the user.")
+        return history
 
-class ActionChatbot:
-    def __init__(self):
-        self.llm = ChatOpenAI(model="gpt-3.5-turbo", temperature=0.5)
 
-    def predict(self, chat_input: ChatInput):
-        history = ChatMessageHistory()
+_llm: Optional[BaseChatModel] = None
+
+
+def get_chat_llm() -> BaseChatModel:
+    """Return the long-lived chat model shared by all chat requests."""
+    global _llm
+
+    if _llm is None:
+        _llm = get_chat_model(
+            "gpt-3.5-turbo", temperature=0.5, priority=Priority.INTERACTIVE
+        )
+
+    return _llm
 
+
+class ActionChatbot:
+    def __init__(self, llm: Optional[BaseChatModel] = None):
+        self.llm = llm or get_chat_llm()
+
+    def messages(self, chat_input: ChatInput) -> List[BaseMessage]:
         initial_message = f"""
         You are an expert AI model capable of answering questions about evidence-based questions.
 
@@ -34,19 +56,29 @@ class ActionChatbot:
         Always provide a source for your answer, doesnt matter if it is a real source or not. Try to use every source once.
         """
 
-        history.add_user_message(initial_message)
+        messages = [HumanMessage(content=initial_message)]
 
         for entity in chat_input.history:
             if "user" in entity.keys():
-                history.add_user_message(entity["user"])
+                messages.append(HumanMessage(content=entity["user"]))
             elif "model" in entity.keys():
-                history.add_ai_message(entity["model"])
+                messages.append(AIMessage(content=entity["model"]))
             else:
                 raise ValueError("FUCK YOU")
 
-        conversation = ConversationChain(
-            llm=self.llm, memory=ConversationBufferMemory(chat_memory=history)
-        )
+        return messages
+
+    def predict(self, chat_input: ChatInput) -> str:
+        response = self.llm.invoke(self.messages(chat_input))
+        return response.content
+
+    async def apredict(self, chat_input: ChatInput) -> str:
+        """Answer without blocking the event loop."""
+        response = await self.llm.ainvoke(self.messages(chat_input))
+        return response.content
 
-        response = conversation(chat_input.history[-1]["user"])
-        return response["response"]
+    async def astream(self, chat_input: ChatInput) -> AsyncIterator[str]:
+        """Yield the answer token by token as the model produces it."""
+        async for chunk in self.llm.astream(self.messages(chat_input)):
+            if chunk.content:
+                yield chunk.content
@@ -7,8 +7,9 @@ Then you need to dentify different actions for reducing carbon emissions within
 
 user_prompt = """
 You may now start adding nodes to the graph.
-You have two tools at your disposal: one to get the current state of the graph and one to add a new node to the graph.
+You have three tools at your disposal: one to get the current state of the graph, one to add a new node to the graph and one to add many nodes at once.
 When adding a node you must specify the path of the node with its parent nodes and the node name divided by /.
+Prefer adding many nodes at once, e.g. an area together with all of its actions.
 
 Remember your task is to first identify different areas within the sector and then identify different actions for reducing carbon emissions within each area.
 For example the 'building' sector could be divided into the areas 'Energy Efficiency', 'Building Materials', 'Logistics'.
@@ -1,39 +1,77 @@
+from typing import List, Optional
+
 from langchain.agents import tool
 from langchain_core.output_parsers import StrOutputParser
 from langchain_core.prompts import ChatPromptTemplate
 
-from src.utils.utils import read_graph, update_graph
+from src.utils.utils import read_tree, update_graph, update_graph_many
 
 # wir geben englische keywords - eric returned referencen (json mit name, content etc)
 
 done = False
 
 
-@tool
-def get_nodes():
+def make_tools(run_id: Optional[str] = None) -> list:
     """
-    Returns the graph nodes.
+    Create the graph tools for one generation run.
+
+    Args:
+        run_id (str, optional): The run whose graph the tools read and extend.
+            Defaults to the latest run.
 
     Returns:
-        list: A list of dictionaries representing the nodes in the graph.
+        list: The create_node, create_nodes and get_nodes tools.
     """
-    graph = read_graph()
-    return graph
 
+    @tool
+    def get_nodes(path: str = "", offset: int = 0, depth: Optional[int] = None):
+        """
+        Returns the paths of the graph nodes, one per line with the node id and
+        the number of children. Long graphs are returned in pages.
 
-@tool
-def create_node(node_path: str) -> str:
-    """
-    Create a new node in the graph based on the given node path.
-    The path consists of the node names separated by slashes (e.g. "Transportation/Cars/Speed Limit")
-    The first part is the root node, the second part is a section, and the third part is an action.
-    The node path must have a depth of 1 to 3.
+        Args:
+            path (str): Only return the nodes below this node path, e.g. "Transportation".
+            offset (int): The number of nodes to skip, to read the next page.
+            depth (int, optional): The number of levels to return below the path.
 
-    Args:
-        node_path (str): The path of the node.
+        Returns:
+            str: The node paths.
+        """
+        return read_tree(run_id, path=path, offset=offset, depth=depth)
 
-    Returns:
-        str
-    """
-    message = update_graph(node_path)
-    return message
+    @tool
+    def create_node(node_path: str) -> str:
+        """
+        Create a new node in the graph based on the given node path.
+        The path consists of the node names separated by slashes (e.g. "Transportation/Cars/Speed Limit")
+        The first part is the root node, the second part is a section, and the third part is an action.
+        The node path must have a depth of 1 to 3.
+
+        Args:
+            node_path (str): The path of the node.
+
+        Returns:
+            str
+        """
+        message = update_graph(node_path, run_id)
+        return message
+
+    @tool
+    def create_nodes(node_paths: List[str]) -> str:
+        """
+        Create many nodes in the graph at once, e.g. a whole area with all its actions.
+        Each path consists of the node names separated by slashes (e.g. "Transportation/Cars/Speed Limit").
+        Parents may be created in the same call, they are added before their children.
+
+        Args:
+            node_paths (List[str]): The paths of the nodes.
+
+        Returns:
+            str
+        """
+        return update_graph_many(node_paths, run_id)
+
+    return [create_node, create_nodes, get_nodes]
+
+
+create_node, create_nodes, get_nodes = make_tools()
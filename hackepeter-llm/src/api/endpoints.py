@@ -1,16 +1,24 @@
+import asyncio
 import json
 from copy import deepcopy
 from datetime import datetime
 from pathlib import Path
-from typing import List
+from typing import List, Optional, Tuple
 
-from fastapi import APIRouter, BackgroundTasks
-from pydantic import BaseModel
+from fastapi import APIRouter, BackgroundTasks, HTTPException, Request, Response
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
 
-from src.agent.agent import Agent
+from src.agent.agent import Agent, RunBudget, cancel_run
 from src.agent.chatbot import ActionChatbot, ChatInput
-from src.agent.tools import create_node, get_nodes
-from src.utils.utils import read_graph
+from src.agent.tools import make_tools
+from src.data.embeddings import get_embedding_cache
+from src.data.graph import GraphStore
+from src.data.wrapper import knowledge_base_stats, reload_knowledge_base
+from src.utils.cache import get_llm_cache
+from src.utils.llm import llm_stats
+from src.utils.tracing import recent_spans, render_metrics
+from src.utils.utils import create_run, resolve_run
 
 router = APIRouter()
 
@@ -21,20 +29,156 @@ with open(ROOT / "src/data/demo_api.json", "r") as f:
 
 class StartData(BaseModel):
     sector: str
+    max_steps: Optional[int] = Field(default=None, gt=0)
+    max_tokens: Optional[int] = Field(default=None, gt=0)
+    max_seconds: Optional[float] = Field(default=None, gt=0)
 
 
 @router.post("/start")
 async def start_process(dropdown_choice: StartData, background_tasks: BackgroundTasks):
-    tools = [create_node, get_nodes]
-    agent = Agent(tools=tools, power=False)
+    limits = dropdown_choice.model_dump(exclude={"sector"}, exclude_none=True)
+    run_id = create_run()
+    tools = make_tools(run_id)
+    agent = Agent(tools=tools, power=False, run_id=run_id, budget=RunBudget(**limits))
     background_tasks.add_task(agent.create_graph, dropdown_choice.sector)
-    return {"status": "success"}
+    return {"status": "success", "run_id": run_id}
+
+
+@router.get("/runs/{run_id}")
+async def get_run(run_id: str):
+    """The progress of a run: status, steps, tokens and elapsed time."""
+    return _get_store(run_id).progress
+
+
+@router.post("/runs/{run_id}/cancel")
+async def cancel(run_id: str):
+    """Stop a run before its next LLM or tool call."""
+    if not cancel_run(run_id):
+        raise HTTPException(status_code=404, detail=f"Run '{run_id}' is not running.")
+    return {"status": "cancelling", "run_id": run_id}
+
+
+def _get_store(run_id: Optional[str]) -> GraphStore:
+    return _get_run(run_id)[1]
+
+
+def _get_run(run_id: Optional[str]) -> Tuple[str, GraphStore]:
+    try:
+        return resolve_run(run_id)
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=str(e))
 
 
 @router.get("/graph")
-async def get_graph():
-    graph = read_graph()
-    return {"node": graph}
+async def get_graph(
+    request: Request,
+    response: Response,
+    since: Optional[int] = None,
+    since_run: Optional[str] = None,
+    run_id: Optional[str] = None,
+):
+    """
+    The graph of a run, the latest run if no run id is given.
+
+    Versions count per run, so `since` is only used as a cursor if it belongs
+    to the returned run: if `run_id` is given or `since_run` names that run.
+    Otherwise the full graph is returned.
+    """
+    pinned = run_id is not None
+    run_id, store = _get_run(run_id)
+    with store.lock:
+        etag = f'"{run_id}:{store.version}"'
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+
+    if since is None or not (pinned or since_run == run_id):
+        with store.lock:
+            version, graph, full = store.version, store.nodes(), True
+    else:
+        version, graph, full = store.changes_since(since)
+
+    response.headers["ETag"] = f'"{run_id}:{version}"'
+    return {"node": graph, "version": version, "full": full, "run_id": run_id}
+
+
+@router.get("/graph/stream")
+async def stream_graph(
+    request: Request, since: Optional[int] = None, run_id: Optional[str] = None
+):
+    """Server-Sent Events with node inserts, metadata updates and resets."""
+    store = _get_store(run_id)
+    last_event_id = request.headers.get("last-event-id")
+    if since is None and last_event_id and last_event_id.isdigit():
+        since = int(last_event_id)
+
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+
+    def notify(event):
+        loop.call_soon_threadsafe(queue.put_nowait, event)
+
+    async def events():
+        # Subscribe before taking the snapshot so no change falls in between
+        unsubscribe = store.subscribe(notify)
+        try:
+            version, graph, full = store.changes_since(since or 0)
+            snapshot = {"node": graph, "version": version, "full": full}
+            yield _sse("snapshot", version, snapshot)
+
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=15)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+
+                if event["version"] > version:
+                    yield _sse(event["event"], event["version"], event)
+        finally:
+            unsubscribe()
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+def _sse(event: str, version: int, data: dict) -> str:
+    return f"id: {version}\nevent: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@router.get("/knowledge-base")
+async def get_knowledge_base_stats():
+    return knowledge_base_stats()
+
+
+@router.post("/knowledge-base/reload")
+def reload_knowledge(force: bool = False):
+    reload_knowledge_base(force=force)
+    return knowledge_base_stats()
+
+
+@router.get("/cache")
+async def get_cache_stats():
+    return {
+        "responses": get_llm_cache().cache.stats(),
+        "embeddings": get_embedding_cache().stats(),
+    }
+
+
+@router.get("/llm")
+async def get_llm_stats():
+    """LLM requests in flight and waiting, and the rate budget of every model."""
+    return llm_stats()
+
+
+@router.get("/metrics")
+async def get_metrics():
+    """Span latencies, errors and LLM tokens in the Prometheus text format."""
+    return Response(render_metrics(), media_type="text/plain; version=0.0.4")
+
+
+@router.get("/traces")
+async def get_traces(limit: int = 100, name: Optional[str] = None):
+    """The most recent spans, newest first."""
+    return recent_spans(limit=limit, name=name)
 
 
 @router.get("/demo")
@@ -48,7 +192,29 @@ async def demo_nodes():
 @router.post("/converse")
 async def chat_about_action(chat_input: ChatInput):
     chatbot = ActionChatbot()
-    return chatbot.predict(chat_input)
+    return await chatbot.apredict(chat_input)
+
+
+@router.post("/converse/stream")
+async def stream_chat_about_action(chat_input: ChatInput):
+    """Server-Sent Events with one "token" event per chunk and a final "done"."""
+    chatbot = ActionChatbot()
+    # Validate the history before the response starts
+    chatbot.messages(chat_input)
+
+    async def events():
+        index = 0
+        try:
+            async for token in chatbot.astream(chat_input):
+                yield _sse("token", index, {"token": token})
+                index += 1
+        except Exception as e:
+            yield _sse("error", index, {"error": str(e)})
+            return
+
+        yield _sse("done", index, {})
+
+    return StreamingResponse(events(), media_type="text/event-stream")
 
 
 # @router.post("/items")
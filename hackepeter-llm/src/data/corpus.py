@@ -0,0 +1,167 @@
+import argparse
+import hashlib
+import json
+import pickle
+import sqlite3
+import threading
+import time
+import zlib
+from pathlib import Path
+from typing import Iterable, Iterator, List, Optional
+
+from langchain_core.documents import Document
+
+CORPUS_FILE = "database/docs/corpus.sqlite"
+BATCH_SIZE = 200
+
+
+class Corpus:
+    """
+    An append-only snapshot of all crawled documents.
+
+    Documents are stored in sqlite with zlib compressed text and identified by
+    the hash of their content, so adding a document twice keeps one copy. The
+    corpus is read as a stream in insertion order, so re-splitting and
+    re-embedding never has to hold more than one batch of raw documents.
+
+    The database file is only created when the corpus is first used.
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._connection: Optional[sqlite3.Connection] = None
+
+    def add(self, docs: Iterable[Document]) -> int:
+        """
+        Append documents that are not in the corpus yet.
+
+        Args:
+            docs (Iterable[Document]): The documents.
+
+        Returns:
+            int: The number of documents that were added.
+        """
+        now = time.time()
+        rows = [
+            (
+                hashlib.sha256(doc.page_content.encode("utf-8")).hexdigest(),
+                now,
+                json.dumps(doc.metadata, default=str),
+                zlib.compress(doc.page_content.encode("utf-8")),
+            )
+            for doc in docs
+        ]
+
+        with self._lock, self.__connect() as connection:
+            before = connection.total_changes
+            connection.executemany(
+                "INSERT OR IGNORE INTO documents (id, added, metadata, text) "
+                "VALUES (?, ?, ?, ?)",
+                rows,
+            )
+            return connection.total_changes - before
+
+    def __len__(self) -> int:
+        with self._lock:
+            row = self.__connect().execute("SELECT COUNT(*) FROM documents").fetchone()
+        return row[0]
+
+    def __iter__(self) -> Iterator[Document]:
+        for batch in self.batches():
+            yield from batch
+
+    def batches(self, size: int = BATCH_SIZE) -> Iterator[List[Document]]:
+        """
+        Stream the corpus in batches of documents, oldest first.
+
+        Each stream reads through its own connection, so documents can be
+        added while the corpus is being read.
+        """
+        self.__connect()
+        connection = sqlite3.connect(self.path)
+        try:
+            cursor = connection.execute(
+                "SELECT metadata, text FROM documents ORDER BY rowid"
+            )
+            while rows := cursor.fetchmany(size):
+                yield [
+                    Document(
+                        page_content=zlib.decompress(text).decode("utf-8"),
+                        metadata=json.loads(metadata),
+                    )
+                    for metadata, text in rows
+                ]
+        finally:
+            connection.close()
+
+    def import_pickles(self, directory: Path) -> int:
+        """
+        Add the documents of the timestamped pickles written by older versions.
+
+        Only import pickles this project wrote itself, unpickling runs code.
+
+        Args:
+            directory (Path): The directory holding the .pkl files.
+
+        Returns:
+            int: The number of documents that were added.
+        """
+        added = 0
+        for path in sorted(Path(directory).glob("*.pkl")):
+            with open(path, "rb") as f:
+                added += self.add(pickle.load(f))
+
+        return added
+
+    def __connect(self) -> sqlite3.Connection:
+        if self._connection is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._connection = sqlite3.connect(self.path, check_same_thread=False)
+            with self._connection:
+                self._connection.execute("PRAGMA journal_mode=WAL")
+                self._connection.execute(
+                    "CREATE TABLE IF NOT EXISTS documents ("
+                    "id TEXT PRIMARY KEY, added REAL, metadata TEXT, text BLOB)"
+                )
+
+        return self._connection
+
+
+def main():
+    from src.data.loader import ROOT, Database
+
+    parser = argparse.ArgumentParser(description="Manage the corpus snapshot.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    rebuild = commands.add_parser(
+        "rebuild", help="Rebuild a vector database from the corpus without crawling."
+    )
+    rebuild.add_argument("name", nargs="?", default="vector_db")
+    rebuild.add_argument("--index-type", default="flat")
+    rebuild.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    rebuild.add_argument("--provider", help="e.g. openai:text-embedding-3-small")
+
+    migrate = commands.add_parser(
+        "import", help="Add the documents of legacy pickles to the corpus."
+    )
+    migrate.add_argument("directory", nargs="?", default=str(ROOT / "database/docs"))
+
+    args = parser.parse_args()
+    corpus = Corpus(ROOT / CORPUS_FILE)
+
+    if args.command == "import":
+        print(f"Imported {corpus.import_pickles(args.directory)} documents.")
+    else:
+        database = Database(
+            name=args.name,
+            from_corpus=True,
+            index_type=args.index_type,
+            batch_size=args.batch_size,
+            provider=args.provider,
+        )
+        print(f"Rebuilt {args.name} with {database.vector.index.ntotal} chunks.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+
+MAX_WORKERS = 8
+MAX_BYTES = 50 * 1024 * 1024
+CHUNK_SIZE = 64 * 1024
+
+
+class DownloadTooLarge(Exception):
+    pass
+
+
+class PdfDownloader:
+    """
+    Downloads files over a shared connection pool, streaming them to disk.
+
+    A download is written to `<file>.part` and renamed once it is complete,
+    so an existing target file is always complete and is skipped. An existing
+    `.part` file is resumed with an HTTP range request. At most `max_workers`
+    downloads run at the same time, across all callers.
+    """
+
+    def __init__(
+        self,
+        max_workers: int = MAX_WORKERS,
+        max_bytes: int = MAX_BYTES,
+        timeout: float = 30,
+        chunk_size: int = CHUNK_SIZE,
+    ) -> None:
+        self.max_workers = max_workers
+        self.max_bytes = max_bytes
+        self.timeout = timeout
+        self.chunk_size = chunk_size
+        self._slots = threading.BoundedSemaphore(max_workers)
+
+        self.session = requests.Session()
+        self.session.headers.update({"User-Agent": "Mozilla/5.0"})
+        adapter = HTTPAdapter(pool_connections=16, pool_maxsize=max_workers)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def download(self, url: str, file_path: Path) -> Path:
+        """
+        Download `url` to `file_path` unless the file already exists.
+
+        Args:
+            url (str): The file url.
+            file_path (Path): The target path.
+
+        Returns:
+            Path: The target path.
+        """
+        file_path = Path(file_path)
+        if file_path.exists():
+            return file_path
+
+        with self._slots:
+            return self.__download(url, file_path)
+
+    def __download(self, url: str, file_path: Path) -> Path:
+        file_path.parent.mkdir(parents=True, exist_ok=True)
+        part_path = file_path.with_name(file_path.name + ".part")
+        offset = part_path.stat().st_size if part_path.exists() else 0
+        headers = {"Range": f"bytes={offset}-"} if offset else {}
+
+        with self.session.get(
+            url, headers=headers, stream=True, timeout=self.timeout
+        ) as response:
+            if offset and response.status_code == 416:
+                # The partial file already holds everything
+                os.replace(part_path, file_path)
+                return file_path
+
+            response.raise_for_status()
+            if response.status_code != 206:
+                # The server ignored the range, start from scratch
+                offset = 0
+
+            # With a content encoding the decoded size differs from the header
+            length = response.headers.get("Content-Length")
+            encoded = response.headers.get("Content-Encoding", "identity")
+            if length and encoded == "identity":
+                expected = offset + int(length)
+            else:
+                expected = None
+            if expected is not None and expected > self.max_bytes:
+                part_path.unlink(missing_ok=True)
+                raise DownloadTooLarge(f"{url} has {expected} bytes.")
+
+            written = offset
+            with open(part_path, "ab" if offset else "wb") as f:
+                for chunk in response.iter_content(chunk_size=self.chunk_size):
+                    written += len(chunk)
+                    if written > self.max_bytes:
+                        f.close()
+                        part_path.unlink(missing_ok=True)
+                        raise DownloadTooLarge(f"{url} exceeds {self.max_bytes} bytes.")
+                    f.write(chunk)
+
+        if expected is not None and written != expected:
+            # Keep the partial file so the next attempt resumes it
+            raise IOError(f"{url} ended after {written} of {expected} bytes.")
+
+        os.replace(part_path, file_path)
+        return file_path
+
+    def download_many(self, items: List[Tuple[str, Path]]) -> List[Optional[Path]]:
+        """
+        Download several files concurrently.
+
+        Args:
+            items (List[Tuple[str, Path]]): Pairs of url and target path.
+
+        Returns:
+            List[Optional[Path]]: The target paths, None for failed downloads.
+        """
+
+        def download(item: Tuple[str, Path]) -> Optional[Path]:
+            url, file_path = item
+            try:
+                return self.download(url, file_path)
+            except Exception as e:
+                print(f"Could not download {url}: {e}")
+                return None
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            return list(pool.map(download, items))
+
+
+_downloader: Optional[PdfDownloader] = None
+_lock = threading.Lock()
+
+
+def get_downloader() -> PdfDownloader:
+    """Return the process-wide downloader, so all loaders share one connection pool."""
+    global _downloader
+
+    with _lock:
+        if _downloader is None:
+            _downloader = PdfDownloader()
+
+    return _downloader
@@ -0,0 +1,207 @@
+import hashlib
+import os
+import zlib
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langchain_openai import OpenAIEmbeddings
+
+from src.data.lexical import tokenize
+from src.utils.cache import DiskCache
+
+ROOT = Path(__file__).parent.parent.parent
+CACHE_PATH = ROOT / "database/cache/embeddings.sqlite"
+CACHE_MAX_ENTRIES = 200_000
+EMBEDDING_MODEL = "text-embedding-3-small"
+DEFAULT_PROVIDER = f"openai:{EMBEDDING_MODEL}"
+HASHING_DIMENSION = 384
+
+
+class HashingEmbeddings(Embeddings):
+    """
+    Local embeddings from hashed word unigrams and bigrams.
+
+    Every feature is hashed to a signed column of a fixed-size vector and the
+    vectors are L2 normalized, so texts sharing many words are close. A batch
+    is encoded with one scatter-add into a NumPy matrix, which needs neither a
+    network round trip nor a model download.
+
+    Args:
+        dimension (int): The vector dimension.
+    """
+
+    def __init__(self, dimension: int = HASHING_DIMENSION) -> None:
+        self.dimension = dimension
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.encode(texts).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.encode([text])[0].tolist()
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        """The normalized vectors of several texts as a float32 matrix."""
+        hashes: Dict[str, int] = {}
+        rows, features = [], []
+
+        for row, text in enumerate(texts):
+            tokens = tokenize(text)
+            for feature in tokens + [
+                " ".join(pair) for pair in zip(tokens, tokens[1:])
+            ]:
+                if feature not in hashes:
+                    hashes[feature] = zlib.crc32(feature.encode("utf-8"))
+                rows.append(row)
+                features.append(hashes[feature])
+
+        features = np.asarray(features, dtype=np.int64)
+        signs = np.where(features & 1 << 31, -1.0, 1.0).astype(np.float32)
+
+        matrix = np.zeros((len(texts), self.dimension), dtype=np.float32)
+        np.add.at(
+            matrix, (np.asarray(rows, dtype=np.int64), features % self.dimension), signs
+        )
+
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        return matrix / np.where(norms == 0, 1, norms)
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Embeddings that are looked up by content hash before calling the wrapped model.
+
+    Documents and queries share one namespace, so a query that was embedded
+    before (or that equals an indexed chunk) never leaves the machine.
+    """
+
+    def __init__(self, embeddings: Embeddings, model: str, cache: DiskCache) -> None:
+        self.embeddings = embeddings
+        self.model = model
+        self.cache = cache
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys = [self.__key(text) for text in texts]
+        found = self.cache.get_many(keys)
+
+        missing = {key: text for key, text in zip(keys, texts) if key not in found}
+        if missing:
+            vectors = self.embeddings.embed_documents(list(missing.values()))
+            found.update(self.__store(list(missing.keys()), vectors))
+
+        return [np.frombuffer(found[key], dtype=np.float32).tolist() for key in keys]
+
+    def embed_query(self, text: str) -> List[float]:
+        key = self.__key(text)
+        value = self.cache.get(key)
+
+        if value is None:
+            vector = self.embeddings.embed_query(text)
+            value = self.__store([key], [vector])[key]
+
+        return np.frombuffer(value, dtype=np.float32).tolist()
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys = [self.__key(text) for text in texts]
+        found = self.cache.get_many(keys)
+
+        missing = {key: text for key, text in zip(keys, texts) if key not in found}
+        if missing:
+            vectors = await self.embeddings.aembed_documents(list(missing.values()))
+            found.update(self.__store(list(missing.keys()), vectors))
+
+        return [np.frombuffer(found[key], dtype=np.float32).tolist() for key in keys]
+
+    async def aembed_query(self, text: str) -> List[float]:
+        key = self.__key(text)
+        value = self.cache.get(key)
+
+        if value is None:
+            vector = await self.embeddings.aembed_query(text)
+            value = self.__store([key], [vector])[key]
+
+        return np.frombuffer(value, dtype=np.float32).tolist()
+
+    def __key(self, text: str) -> str:
+        return hashlib.sha256(f"{self.model}\n{text}".encode("utf-8")).hexdigest()
+
+    def __store(self, keys: List[str], vectors: List[List[float]]) -> dict:
+        self.__check_dimension(len(vectors[0]))
+
+        values = {
+            key: np.asarray(vector, dtype=np.float32).tobytes()
+            for key, vector in zip(keys, vectors)
+        }
+        self.cache.set_many(values.items())
+        return values
+
+    def __check_dimension(self, dimension: int) -> None:
+        meta_key = f"dimension:{self.model}"
+        stored = self.cache.get_meta(meta_key)
+
+        if stored is None:
+            self.cache.set_meta(meta_key, str(dimension))
+        elif int(stored) != dimension:
+            raise ValueError(
+                f"Embedding cache at {self.cache.path} holds {stored}-dimensional "
+                f"vectors for {self.model}, but the model returned {dimension}."
+            )
+
+
+_cache: Optional[DiskCache] = None
+
+
+def get_embedding_cache() -> DiskCache:
+    """Return the process-wide on-disk embedding cache."""
+    global _cache
+
+    if _cache is None:
+        _cache = DiskCache(CACHE_PATH, max_entries=CACHE_MAX_ENTRIES)
+
+    return _cache
+
+
+def _openai(model: str) -> Embeddings:
+    model = model or EMBEDDING_MODEL
+    return CachedEmbeddings(
+        OpenAIEmbeddings(model=model), model=model, cache=get_embedding_cache()
+    )
+
+
+def _hashing(model: str) -> Embeddings:
+    return HashingEmbeddings(dimension=int(model or HASHING_DIMENSION))
+
+
+PROVIDERS: Dict[str, Callable[[str], Embeddings]] = {
+    "openai": _openai,
+    "hashing": _hashing,
+}
+
+
+def default_provider() -> str:
+    """The provider named by the EMBEDDING_PROVIDER environment variable, else OpenAI."""
+    return os.getenv("EMBEDDING_PROVIDER", DEFAULT_PROVIDER)
+
+
+def get_embeddings(provider: Optional[str] = None) -> Embeddings:
+    """
+    Create the embeddings of a provider.
+
+    Args:
+        provider (str, optional): "<name>:<model>", e.g. "openai:text-embedding-3-small"
+            or "hashing:384". Defaults to the EMBEDDING_PROVIDER environment
+            variable, or OpenAI embeddings backed by the on-disk cache.
+
+    Returns:
+        Embeddings: The embeddings.
+    """
+    provider = provider or default_provider()
+    name, _, model = provider.partition(":")
+
+    if name not in PROVIDERS:
+        raise ValueError(
+            f"Unknown embedding provider '{name}', use one of {list(PROVIDERS)}."
+        )
+
+    return PROVIDERS[name](model)
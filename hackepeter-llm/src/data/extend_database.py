@@ -1,5 +1,3 @@
-from tqdm import tqdm
-
 from src.data.loader import Database
 
 
@@ -22,8 +20,7 @@ def main():
         "Port Electrification carbon emissions reduction",
     ]
 
-    for query in tqdm(data, desc="Processing keywords", total=len(data)):
-        database.extend(query)
+    database.extend_many(data)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,158 @@
+import argparse
+import multiprocessing
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from langchain_core.documents import Document
+
+DEFAULT_BACKEND = "pymupdf"
+TIMEOUT = 60
+
+
+def extract_pymupdf(path: str) -> Tuple[str, int]:
+    import fitz
+
+    with fitz.open(path) as pdf:
+        text = "".join(page.get_text() for page in pdf)
+        return text, pdf.page_count
+
+
+def extract_pdfminer(path: str) -> Tuple[str, int]:
+    from pdfminer.high_level import extract_text
+    from pdfminer.pdfpage import PDFPage
+
+    with open(path, "rb") as f:
+        pages = sum(1 for _ in PDFPage.get_pages(f))
+
+    return extract_text(path), pages
+
+
+BACKENDS = {
+    "pymupdf": extract_pymupdf,
+    "pdfminer": extract_pdfminer,
+}
+
+
+def _extract(backend: str, path: str) -> Tuple[str, int]:
+    return BACKENDS[backend](path)
+
+
+_pool = None
+_lock = threading.Lock()
+
+
+def _get_pool():
+    global _pool
+
+    if _pool is None:
+        # Spawned workers do not inherit locks held by the crawler's threads
+        context = multiprocessing.get_context("spawn")
+        _pool = context.Pool(processes=os.cpu_count())
+
+    return _pool
+
+
+def _terminate_pool():
+    global _pool
+
+    if _pool is not None:
+        _pool.terminate()
+        _pool = None
+
+
+def extract_many(
+    paths: List[str], backend: str = DEFAULT_BACKEND, timeout: float = TIMEOUT
+) -> List[Optional[Document]]:
+    """
+    Extract the text of several PDFs in parallel, one process per core.
+
+    A file that fails or takes longer than `timeout` seconds yields None. If a
+    file times out, the worker pool is terminated so the stuck process does not
+    block later batches.
+
+    Args:
+        paths (List[str]): The PDF files.
+        backend (str): The extraction backend, see `BACKENDS`.
+        timeout (float): Seconds to wait for each file.
+
+    Returns:
+        List[Optional[Document]]: One document per file, with the number of
+            pages in its metadata.
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown extraction backend '{backend}'.")
+
+    if not paths:
+        return []
+
+    with _lock:
+        pool = _get_pool()
+        jobs = [pool.apply_async(_extract, (backend, str(path))) for path in paths]
+
+        docs = []
+        timed_out = False
+        for path, job in zip(paths, jobs):
+            try:
+                text, pages = job.get(timeout=timeout)
+                metadata = {"source": str(path), "pages": pages}
+                docs.append(Document(page_content=text, metadata=metadata))
+            except multiprocessing.TimeoutError:
+                print(f"Extracting {path} took longer than {timeout}s.")
+                timed_out = True
+                docs.append(None)
+            except Exception as e:
+                print(f"Could not extract {path}: {e}")
+                docs.append(None)
+
+        if timed_out:
+            _terminate_pool()
+
+    return docs
+
+
+def benchmark(paths: List[str], backends: Optional[List[str]] = None) -> Dict:
+    """
+    Compare extraction backends on the same files.
+
+    Args:
+        paths (List[str]): The PDF files.
+        backends (List[str], optional): The backends to compare, all by default.
+
+    Returns:
+        dict: Files, pages, seconds and pages per second for each backend.
+    """
+    results = {}
+    for backend in backends or list(BACKENDS):
+        # Start every backend with warm worker processes
+        extract_many(paths[:1], backend=backend)
+
+        start = time.perf_counter()
+        docs = extract_many(paths, backend=backend)
+        seconds = time.perf_counter() - start
+
+        pages = sum(doc.metadata["pages"] for doc in docs if doc)
+        results[backend] = {
+            "files": sum(1 for doc in docs if doc),
+            "pages": pages,
+            "seconds": round(seconds, 3),
+            "pages_per_second": round(pages / seconds, 1) if seconds else None,
+        }
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark PDF extraction backends.")
+    parser.add_argument("directory", nargs="?", default="database/pdfs")
+    args = parser.parse_args()
+
+    paths = sorted(str(path) for path in Path(args.directory).glob("*.pdf"))
+    for backend, result in benchmark(paths).items():
+        print(backend, result)
+
+
+if __name__ == "__main__":
+    main()
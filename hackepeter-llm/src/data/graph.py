@@ -0,0 +1,335 @@
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+COMPACT_AFTER = 1000
+
+
+class GraphStore:
+    """
+    In-memory graph of nodes, indexed by id, by (parent id, name) and by path.
+
+    Every change is appended to a log next to the snapshot file, so inserts
+    and updates cost O(1) on disk. The log is folded into an atomically
+    replaced snapshot once it grows past `COMPACT_AFTER` entries. Reads never
+    touch disk.
+
+    Every change increments `version`, so clients can ask for the nodes that
+    changed since the version they last saw, or subscribe to change events.
+
+    Besides the nodes, the store keeps a `progress` dict of the run that
+    builds the graph, persisted next to the snapshot.
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.path = Path(path)
+        self.log_path = self.path.with_suffix(".log")
+        self.progress_path = self.path.with_suffix(".progress.json")
+        self.lock = threading.RLock()
+
+        self.version = 0
+        self._reset_version = 0
+        self._subscribers: List[Callable[[Dict], None]] = []
+
+        self.__clear()
+        self.__load()
+
+        # Nodes loaded from disk count as one change, so a client starting at
+        # version 0 receives all of them.
+        if self._nodes:
+            self.version = 1
+            self._versions = dict.fromkeys(self._nodes, 1)
+
+    def reset(self) -> None:
+        """Remove all nodes and persist the empty graph."""
+        with self.lock:
+            self.__clear()
+            self.snapshot()
+
+            self.version += 1
+            self._reset_version = self.version
+            self.__publish({"event": "reset", "version": self.version})
+
+    def add(self, name: str, parent_id: Optional[int], type: str, **fields) -> Dict:
+        """
+        Add a node below the given parent.
+
+        Args:
+            name (str): The node name, unique among its siblings.
+            parent_id (int, optional): The parent id, None for root nodes.
+            type (str): The node type (root, area or action).
+            **fields: Additional node fields, e.g. status and metadata.
+
+        Returns:
+            dict: A copy of the new node.
+        """
+        with self.lock:
+            if (parent_id, name) in self._by_parent_name:
+                raise KeyError(f"Node '{name}' already exists.")
+            if parent_id is not None and parent_id not in self._nodes:
+                raise KeyError(f"Parent node {parent_id} does not exist.")
+
+            node = {
+                "id": self._next_id,
+                "parent_id": parent_id,
+                "name": name,
+                "type": type,
+                **fields,
+            }
+            self.__put(node)
+            self.__append({"op": "add", "node": node})
+            self.__changed(node, "insert")
+
+            return dict(node)
+
+    def update(self, node_id: int, **fields) -> Dict:
+        """
+        Update fields of an existing node.
+
+        Args:
+            node_id (int): The node id.
+            **fields: The fields to overwrite.
+
+        Returns:
+            dict: A copy of the updated node.
+        """
+        with self.lock:
+            node = self._nodes[node_id]
+            node.update(fields)
+            self.__append({"op": "update", "id": node_id, "fields": fields})
+            self.__changed(node, "update")
+
+            return dict(node)
+
+    def set_progress(self, **fields) -> Dict:
+        """
+        Update the progress of the run that builds the graph.
+
+        Args:
+            **fields: The fields to overwrite, e.g. status and steps.
+
+        Returns:
+            dict: A copy of the progress.
+        """
+        with self.lock:
+            self.progress.update(fields)
+            self.__append({"op": "progress", "fields": fields})
+
+            self.version += 1
+            self.__publish(
+                {
+                    "event": "progress",
+                    "version": self.version,
+                    "progress": dict(self.progress),
+                }
+            )
+
+            return dict(self.progress)
+
+    def get(self, node_id: int) -> Optional[Dict]:
+        with self.lock:
+            node = self._nodes.get(node_id)
+            return dict(node) if node else None
+
+    def find(self, parent_id: Optional[int], name: str) -> Optional[Dict]:
+        with self.lock:
+            node_id = self._by_parent_name.get((parent_id, name))
+            return self.get(node_id) if node_id is not None else None
+
+    def find_path(self, node_path: str) -> Optional[Dict]:
+        with self.lock:
+            node_id = self._by_path.get(node_path)
+            return self.get(node_id) if node_id is not None else None
+
+    def path_of(self, node_id: int) -> str:
+        with self.lock:
+            return self._paths[node_id]
+
+    def children(self, node_id: Optional[int]) -> List[Dict]:
+        with self.lock:
+            return [self.get(child) for child in self._children.get(node_id, [])]
+
+    def walk(
+        self, node_id: Optional[int] = None, depth: Optional[int] = None
+    ) -> List[Tuple[int, str, int]]:
+        """
+        The nodes below a node, parents before their children.
+
+        Args:
+            node_id (int, optional): The node to start below, None for all roots.
+            depth (int, optional): The number of levels to descend, all by default.
+
+        Returns:
+            List[Tuple[int, str, int]]: Id, path and number of children of
+                every node.
+        """
+        with self.lock:
+            result = []
+            stack = [(child, 1) for child in reversed(self._children.get(node_id, []))]
+            while stack:
+                current, level = stack.pop()
+                children = self._children.get(current, [])
+                result.append((current, self._paths[current], len(children)))
+
+                if depth is None or level < depth:
+                    stack.extend((child, level + 1) for child in reversed(children))
+
+            return result
+
+    def nodes(self) -> List[Dict]:
+        """All nodes in insertion order."""
+        with self.lock:
+            return [dict(node) for node in self._nodes.values()]
+
+    def __len__(self) -> int:
+        return len(self._nodes)
+
+    def changes_since(self, version: int) -> Tuple[int, List[Dict], bool]:
+        """
+        Nodes that were added or changed after the given version.
+
+        Args:
+            version (int): The last version the caller has seen.
+
+        Returns:
+            tuple: The current version, the changed nodes in insertion order,
+                and whether the nodes are the full graph (because the graph was
+                reset or the version is unknown) rather than a delta.
+        """
+        with self.lock:
+            if version < self._reset_version or version > self.version:
+                return self.version, self.nodes(), True
+
+            nodes = [
+                dict(node)
+                for node_id, node in self._nodes.items()
+                if self._versions[node_id] > version
+            ]
+            return self.version, nodes, False
+
+    def subscribe(self, callback: Callable[[Dict], None]) -> Callable[[], None]:
+        """
+        Call `callback` with an event dict after every change.
+
+        Callbacks run on the writing thread while the store is locked and must
+        return quickly, e.g. by handing the event to a queue.
+
+        Args:
+            callback (callable): Receives {"event", "version", "node"}.
+
+        Returns:
+            callable: Removes the subscription.
+        """
+        with self.lock:
+            self._subscribers.append(callback)
+
+        def unsubscribe():
+            with self.lock:
+                if callback in self._subscribers:
+                    self._subscribers.remove(callback)
+
+        return unsubscribe
+
+    def snapshot(self) -> None:
+        """Write all nodes to the snapshot file atomically and truncate the log."""
+        with self.lock:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.path.with_suffix(".json.tmp")
+            with open(tmp_path, "w") as f:
+                json.dump(list(self._nodes.values()), f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+
+            tmp_path = self.progress_path.with_suffix(".tmp")
+            with open(tmp_path, "w") as f:
+                json.dump(self.progress, f)
+            os.replace(tmp_path, self.progress_path)
+
+            open(self.log_path, "w").close()
+            self._log_entries = 0
+
+    def __clear(self) -> None:
+        self._nodes: Dict[int, Dict] = {}
+        self._by_parent_name: Dict[Tuple[Optional[int], str], int] = {}
+        self._by_path: Dict[str, int] = {}
+        self._paths: Dict[int, str] = {}
+        self._children: Dict[Optional[int], List[int]] = {}
+        self._versions: Dict[int, int] = {}
+        self._next_id = 1
+        self._log_entries = 0
+        self.progress: Dict = {}
+
+    def __put(self, node: Dict) -> None:
+        node_id = node["id"]
+        parent_id = node["parent_id"]
+
+        if node_id not in self._nodes:
+            self._children.setdefault(parent_id, []).append(node_id)
+
+        if parent_id is None:
+            node_path = node["name"]
+        else:
+            node_path = f"{self._paths[parent_id]}/{node['name']}"
+
+        self._nodes[node_id] = node
+        self._by_parent_name[(parent_id, node["name"])] = node_id
+        self._by_path[node_path] = node_id
+        self._paths[node_id] = node_path
+        self._versions.setdefault(node_id, self.version)
+        self._next_id = max(self._next_id, node_id + 1)
+
+    def __changed(self, node: Dict, event: str) -> None:
+        self.version += 1
+        self._versions[node["id"]] = self.version
+        self.__publish({"event": event, "version": self.version, "node": dict(node)})
+
+    def __publish(self, event: Dict) -> None:
+        for callback in list(self._subscribers):
+            try:
+                callback(event)
+            except Exception as e:
+                print(e)
+
+    def __append(self, entry: Dict) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.log_path, "a") as f:
+            f.write(json.dumps(entry) + "\n")
+
+        self._log_entries += 1
+        if self._log_entries >= COMPACT_AFTER:
+            self.snapshot()
+
+    def __load(self) -> None:
+        if self.path.exists():
+            with open(self.path, "r") as f:
+                for node in json.load(f):
+                    self.__put(node)
+
+        if self.progress_path.exists():
+            with open(self.progress_path, "r") as f:
+                self.progress = json.load(f)
+
+        if not self.log_path.exists():
+            return
+
+        # Replaying is idempotent, so a crash between writing the snapshot and
+        # truncating the log does not duplicate nodes.
+        with open(self.log_path, "r") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # Partially written last line
+                    break
+
+                if entry["op"] == "add":
+                    self.__put(entry["node"])
+                elif entry["op"] == "update" and entry["id"] in self._nodes:
+                    self._nodes[entry["id"]].update(entry["fields"])
+                elif entry["op"] == "progress":
+                    self.progress.update(entry["fields"])
+
+                self._log_entries += 1
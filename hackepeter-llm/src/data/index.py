@@ -0,0 +1,229 @@
+import argparse
+import math
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import faiss
+import numpy as np
+
+INDEX_TYPES = ["flat", "ivf", "hnsw", "ivfpq"]
+# faiss only memory-maps the inverted lists of IVF indexes
+MMAP_INDEX_TYPES = ["ivf", "ivfpq"]
+
+
+def index_spec(
+    kind: str, count: int, dimension: int, nlist: Optional[int] = None, m: int = 32
+) -> str:
+    """
+    The faiss index factory string for an index type.
+
+    Args:
+        kind (str): One of flat, ivf, hnsw or ivfpq.
+        count (int): The number of vectors the index is trained on.
+        dimension (int): The vector dimension.
+        nlist (int, optional): The number of IVF cells, 4 * sqrt(count) by default.
+        m (int): HNSW neighbours per node, or PQ sub-quantizers for ivfpq.
+
+    Returns:
+        str: The factory string.
+    """
+    if nlist is None:
+        nlist = max(1, min(int(4 * math.sqrt(count)), count // 39 or 1))
+
+    if kind == "flat":
+        return "Flat"
+    if kind == "ivf":
+        return f"IVF{nlist},Flat"
+    if kind == "hnsw":
+        return f"HNSW{m}"
+    if kind == "ivfpq":
+        if dimension % m:
+            raise ValueError(f"PQ size {m} must divide the dimension {dimension}.")
+        return f"IVF{nlist},PQ{m}"
+
+    raise ValueError(f"Unknown index type '{kind}', use one of {INDEX_TYPES}.")
+
+
+def build_index(kind: str, vectors: np.ndarray, **params) -> faiss.Index:
+    """
+    Create, train and fill an index of the given type.
+
+    Args:
+        kind (str): One of flat, ivf, hnsw or ivfpq.
+        vectors (np.ndarray): The vectors, also used for training.
+        **params: nlist and m, see `index_spec`.
+
+    Returns:
+        faiss.Index: The filled index.
+    """
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    count, dimension = vectors.shape
+
+    index = faiss.index_factory(dimension, index_spec(kind, count, dimension, **params))
+    if not index.is_trained:
+        index.train(vectors)
+    index.add(vectors)
+
+    return index
+
+
+def set_search_params(
+    index: faiss.Index, nprobe: Optional[int] = None, ef_search: Optional[int] = None
+) -> None:
+    """Set the search-time parameters that apply to the index type."""
+    parameters = faiss.ParameterSpace()
+
+    if nprobe is not None and faiss.try_extract_index_ivf(index) is not None:
+        parameters.set_index_parameter(index, "nprobe", nprobe)
+    if ef_search is not None and "HNSW" in type(index).__name__:
+        parameters.set_index_parameter(index, "efSearch", ef_search)
+
+
+def vectors_of(index: faiss.Index) -> np.ndarray:
+    """All vectors stored in an index, in id order."""
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        ivf.make_direct_map()
+
+    return index.reconstruct_n(0, index.ntotal)
+
+
+def index_type(index: faiss.Index) -> str:
+    """The type of an index, one of `INDEX_TYPES`."""
+    name = type(index).__name__
+    if "IVFPQ" in name:
+        return "ivfpq"
+    if faiss.try_extract_index_ivf(index) is not None:
+        return "ivf"
+    if "HNSW" in name:
+        return "hnsw"
+    return "flat"
+
+
+def read_index(path: Path, mmap: bool = False) -> faiss.Index:
+    """
+    Read an index file, optionally memory-mapped and read-only.
+
+    A memory-mapped index is paged in by the OS on demand instead of being
+    copied into RAM, and the pages are shared between worker processes.
+    Only the inverted lists of ivf and ivfpq indexes are memory-mapped,
+    flat and hnsw indexes are always read into RAM.
+    """
+    flags = faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY if mmap else 0
+    return faiss.read_index(str(path), flags)
+
+
+def evaluate(
+    index: faiss.Index,
+    baseline: faiss.Index,
+    queries: np.ndarray,
+    k: int = 5,
+) -> Dict:
+    """
+    Recall and latency of an index compared to an exact baseline.
+
+    Args:
+        index (faiss.Index): The index to evaluate.
+        baseline (faiss.Index): An exact (flat) index over the same vectors.
+        queries (np.ndarray): The query vectors.
+        k (int): The number of neighbours per query.
+
+    Returns:
+        dict: recall@k and mean / p95 latency per query in milliseconds.
+    """
+    queries = np.ascontiguousarray(queries, dtype=np.float32)
+    _, expected = baseline.search(queries, k)
+
+    latencies = []
+    found = []
+    for query in queries:
+        start = time.perf_counter()
+        _, ids = index.search(query[None, :], k)
+        latencies.append((time.perf_counter() - start) * 1000)
+        found.append(ids[0])
+
+    hits = sum(
+        len(set(row) & set(expected_row)) for row, expected_row in zip(found, expected)
+    )
+    return {
+        "recall": round(hits / (len(queries) * k), 4),
+        "latency_ms": round(float(np.mean(latencies)), 4),
+        "p95_ms": round(float(np.percentile(latencies, 95)), 4),
+    }
+
+
+def report(
+    vectors: np.ndarray,
+    kinds: List[str],
+    k: int = 5,
+    queries: int = 200,
+    nprobes: List[int] = (1, 8, 32),
+    ef_searches: List[int] = (16, 64, 128),
+) -> List[Dict]:
+    """
+    Build every index type over the same vectors and compare it to flat search.
+
+    Args:
+        vectors (np.ndarray): The corpus vectors.
+        kinds (List[str]): The index types to compare.
+        k (int): The number of neighbours per query.
+        queries (int): The number of corpus vectors used as queries.
+        nprobes (List[int]): The nprobe values tried for IVF indexes.
+        ef_searches (List[int]): The efSearch values tried for HNSW indexes.
+
+    Returns:
+        List[dict]: One row per index type and search setting.
+    """
+    rng = np.random.default_rng(0)
+    sample = vectors[rng.choice(len(vectors), min(queries, len(vectors)), False)]
+    baseline = build_index("flat", vectors)
+
+    rows = [dict(kind="flat", **evaluate(baseline, baseline, sample, k))]
+    for kind in kinds:
+        if kind == "flat":
+            continue
+
+        start = time.perf_counter()
+        index = build_index(kind, vectors)
+        build_seconds = round(time.perf_counter() - start, 3)
+
+        if kind == "hnsw":
+            settings = [{"ef_search": ef} for ef in ef_searches]
+        else:
+            settings = [{"nprobe": nprobe} for nprobe in nprobes]
+
+        for setting in settings:
+            set_search_params(index, **setting)
+            rows.append(
+                dict(
+                    kind=kind,
+                    build_seconds=build_seconds,
+                    **setting,
+                    **evaluate(index, baseline, sample, k),
+                )
+            )
+
+    return rows
+
+
+def main():
+    from src.data.loader import Database
+
+    parser = argparse.ArgumentParser(
+        description="Compare ANN index types against exact search on a database."
+    )
+    parser.add_argument("name", nargs="?", default="vector_db")
+    parser.add_argument("--kinds", nargs="+", default=INDEX_TYPES)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args()
+
+    database = Database(name=args.name)
+    vectors = vectors_of(database.vector.index)
+    for row in report(vectors, args.kinds, k=args.k, queries=args.queries):
+        print(row)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+import heapq
+import math
+import re
+import threading
+from collections import Counter, defaultdict
+from typing import Dict, Iterable, List, Tuple
+
+TOKEN = re.compile(r"[a-z0-9]+")
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "for", "from", "how",
+    "in", "is", "it", "of", "on", "or", "that", "the", "this", "to", "with",
+}  # fmt: skip
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase word tokens without stopwords and single characters."""
+    return [
+        token
+        for token in TOKEN.findall(text.lower())
+        if len(token) > 1 and token not in STOPWORDS
+    ]
+
+
+class BM25Index:
+    """
+    An in-memory BM25 inverted index over chunk texts.
+
+    Every term maps to the chunks containing it and the term frequency, so a
+    search only touches the postings of the query terms.
+
+    Args:
+        k1 (float): Term frequency saturation.
+        b (float): Document length normalization.
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75) -> None:
+        self.k1 = k1
+        self.b = b
+
+        self._postings: Dict[str, Dict[int, int]] = defaultdict(dict)
+        self._ids: List[str] = []
+        self._lengths: List[int] = []
+        self._total_length = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def add(self, items: Iterable[Tuple[str, str]]) -> None:
+        """
+        Add chunks to the index.
+
+        Args:
+            items (Iterable[Tuple[str, str]]): Pairs of chunk id and text.
+        """
+        with self._lock:
+            for id, text in items:
+                tokens = tokenize(text)
+                position = len(self._ids)
+
+                for term, count in Counter(tokens).items():
+                    self._postings[term][position] = count
+
+                self._ids.append(id)
+                self._lengths.append(len(tokens))
+                self._total_length += len(tokens)
+
+    def search(self, query: str, k: int) -> List[Tuple[str, float]]:
+        """
+        The best matching chunks for a query.
+
+        Args:
+            query (str): The query text.
+            k (int): The number of chunks.
+
+        Returns:
+            List[Tuple[str, float]]: Chunk ids and scores, best match first.
+                Chunks without any query term are not returned.
+        """
+        with self._lock:
+            if not self._ids:
+                return []
+
+            count = len(self._ids)
+            average_length = self._total_length / count or 1
+            scores: Dict[int, float] = defaultdict(float)
+
+            for term in set(tokenize(query)):
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+
+                idf = math.log(
+                    1 + (count - len(postings) + 0.5) / (len(postings) + 0.5)
+                )
+                for position, frequency in postings.items():
+                    norm = (
+                        1 - self.b + self.b * self._lengths[position] / average_length
+                    )
+                    scores[position] += (
+                        idf * frequency * (self.k1 + 1) / (frequency + self.k1 * norm)
+                    )
+
+            best = heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+            return [(self._ids[position], score) for position, score in best]
+
+
+def reciprocal_rank_fusion(
+    rankings: List[List[str]], k: int, constant: int = 60
+) -> List[str]:
+    """
+    Merge several rankings of ids into one.
+
+    Each id scores 1 / (constant + rank) in every ranking it appears in, so
+    the rankings are fused without comparing BM25 scores to vector distances.
+
+    Args:
+        rankings (List[List[str]]): The ranked ids, best first.
+        k (int): The number of ids to return.
+        constant (int): Dampens the weight of the top ranks.
+
+    Returns:
+        List[str]: The fused ranking.
+    """
+    scores: Dict[str, float] = defaultdict(float)
+    for ranking in rankings:
+        for rank, id in enumerate(ranking):
+            scores[id] += 1 / (constant + rank + 1)
+
+    return heapq.nlargest(k, scores, key=scores.get)
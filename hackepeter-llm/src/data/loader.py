@@ -1,26 +1,58 @@
+import hashlib
+import json
 import os
 import pickle
-from datetime import datetime
+import shutil
+import threading
+import time
+import uuid
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from pathlib import Path
-from typing import Dict, List, Optional
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
 
 import requests
-from langchain_community.document_loaders import (ArxivLoader, PDFMinerLoader,
-                                                  WikipediaLoader)
+from langchain_community.document_loaders import ArxivLoader, WikipediaLoader
 from langchain_community.vectorstores import FAISS
 from langchain_core.documents import Document
-from langchain_openai import OpenAIEmbeddings
 from langchain_text_splitters import RecursiveCharacterTextSplitter
-from tqdm import tqdm
+
+from src.data.corpus import BATCH_SIZE, CORPUS_FILE, Corpus
+from src.data.download import PdfDownloader, get_downloader
+from src.data.embeddings import DEFAULT_PROVIDER, default_provider, get_embeddings
+from src.data.extract import DEFAULT_BACKEND, extract_many
+from src.data.index import (
+    MMAP_INDEX_TYPES,
+    build_index,
+    index_type,
+    read_index,
+    set_search_params,
+    vectors_of,
+)
+from src.data.lexical import BM25Index
+from src.utils.ratelimit import RateLimiter
 
 ROOT = Path(__file__).parent.parent.parent
 LIMIT_PER_SOURCE = 10
+PROVIDER_FILE = "embeddings.json"
+SEMANTIC_SCHOLAR_ENDPOINT = "https://api.semanticscholar.org/graph/v1/paper/search"
 
 
 class SemanticScholarLoader:
-    def __init__(self, query: str, load_max_docs: int = LIMIT_PER_SOURCE) -> None:
+    def __init__(
+        self,
+        query: str,
+        load_max_docs: int = LIMIT_PER_SOURCE,
+        endpoint: str = SEMANTIC_SCHOLAR_ENDPOINT,
+        timeout: float = 30,
+        downloader: Optional[PdfDownloader] = None,
+        backend: str = DEFAULT_BACKEND,
+    ) -> None:
         self.query = query
         self.load_max_docs = load_max_docs
+        self.endpoint = endpoint
+        self.timeout = timeout
+        self.downloader = downloader or get_downloader()
+        self.backend = backend
 
         self.pdfs_dir = ROOT / "database/pdfs"
         self.pdfs_dir.mkdir(parents=True, exist_ok=True)
@@ -29,28 +61,28 @@ class SemanticScholarLoader:
         papers = self.__get_metadata()
         papers = self.__add_pdf(papers)
 
+        papers = [paper for paper in papers if paper["pdf_path"]]
+        extracted = extract_many(
+            [paper["pdf_path"] for paper in papers], backend=self.backend
+        )
+
         docs = []
-        for paper in papers:
-            try:
-                loader = PDFMinerLoader(paper["pdf_path"])
-                data = loader.load()
-            except Exception:
+        for paper, d in zip(papers, extracted):
+            if d is None:
                 continue
 
-            for d in data:
-                d.metadata.update(paper)
-                d.metadata["source"] = paper["openAccessPdf"]["url"]
-                if paper["abstract"]:
-                    d.metadata["summary"] = paper["abstract"]
-                else:
-                    d.metadata["summary"] = d.page_content[:500]
+            d.metadata.update(paper)
+            d.metadata["source"] = paper["openAccessPdf"]["url"]
+            if paper["abstract"]:
+                d.metadata["summary"] = paper["abstract"]
+            else:
+                d.metadata["summary"] = d.page_content[:500]
 
-            docs.extend(data)
+            docs.append(d)
 
         return docs
 
     def __get_metadata(self) -> List[Dict]:
-        endpoint = "https://api.semanticscholar.org/graph/v1/paper/search"
         params = {
             "query": self.query,
             "fields": "title,abstract,year,isOpenAccess,openAccessPdf,citationCount",
@@ -59,69 +91,227 @@ class SemanticScholarLoader:
         }
         headers = {"x-api-key": os.getenv("PAPERS_SEMANTIC_SCHOLAR")}
 
-        response = requests.get(endpoint, params=params, headers=headers)
+        response = requests.get(
+            self.endpoint, params=params, headers=headers, timeout=self.timeout
+        )
         if response.status_code == 200:
-            papers = response.json()["data"]
+            papers = response.json().get("data", [])
         else:
             print(f"Failed to fetch papers. Status code: {response.status_code}")
+            papers = []
 
         return papers
 
-    def __download_pdf(self, paper: Dict) -> str:
-        if paper["isOpenAccess"]:
-            safe_title = (
-                paper["title"].replace(" ", "_").replace("/", "_").replace("\\", "_")
-            )
-            file_name = f"{safe_title}_{paper['year']}.pdf"
-            file_path = self.pdfs_dir / file_name
+    def __pdf_path(self, paper: Dict) -> Path:
+        safe_title = (
+            paper["title"].replace(" ", "_").replace("/", "_").replace("\\", "_")
+        )
+        file_name = f"{safe_title}_{paper['year']}.pdf"
+        return self.pdfs_dir / file_name
+
+    def __add_pdf(self, papers: List[Dict]) -> List[Dict]:
+        downloadable = [
+            paper
+            for paper in papers
+            if paper.get("isOpenAccess")
+            and (paper.get("openAccessPdf") or {}).get("url")
+        ]
+        for paper in papers:
+            paper["pdf_path"] = None
 
-            with requests.Session() as session:
-                session.headers.update({"User-Agent": "Mozilla/5.0"})
-                response = session.get(paper["openAccessPdf"]["url"])
+        paths = self.downloader.download_many(
+            [
+                (paper["openAccessPdf"]["url"], self.__pdf_path(paper))
+                for paper in downloadable
+            ]
+        )
+        for paper, pdf_path in zip(downloadable, paths):
+            paper["pdf_path"] = str(pdf_path) if pdf_path else None
 
-            response.raise_for_status()
+        return papers
 
-            with open(file_path, "wb") as f:
-                f.write(response.content)
 
-            return file_path
+class Source:
+    """
+    A document source the crawler fans out to.
 
-    def __add_pdf(self, papers: List[Dict]) -> List[str]:
-        for paper in papers:
-            try:
-                pdf_path = self.__download_pdf(paper)
-                paper["pdf_path"] = str(pdf_path)
-            except Exception:
-                paper["pdf_path"] = None
+    Args:
+        name (str): Name used in logs and error reports.
+        load (callable): Returns the documents for a query.
+        max_concurrency (int): Maximum number of parallel loads.
+        rate (float, optional): Maximum number of loads started per second.
+        timeout (float): Seconds after which a running load is abandoned.
+    """
 
-        return papers
+    def __init__(
+        self,
+        name: str,
+        load: Callable[[str], List[Document]],
+        max_concurrency: int = 1,
+        rate: Optional[float] = None,
+        timeout: float = 120,
+    ) -> None:
+        self.name = name
+        self.load = load
+        self.max_concurrency = max_concurrency
+        self.limiter = RateLimiter(rate) if rate else None
+        self.timeout = timeout
 
 
 class DataCrawler:
+    def __init__(self, sources: Optional[List[Source]] = None) -> None:
+        if sources is None:
+            sources = [
+                # arXiv asks for at most one request every three seconds
+                Source("arxiv", self.__load_arxiv, rate=1 / 3),
+                Source("wikipedia", self.__load_wikipedia, max_concurrency=4, rate=5),
+                # Semantic Scholar allows one request per second with an API key
+                Source(
+                    "semantic_scholar",
+                    self.__load_semantic_scholar,
+                    rate=1,
+                    timeout=300,
+                ),
+            ]
+
+        self.sources = sources
+        self.errors: List[Dict] = []
+
     def crawl(self, query: str) -> List[Document]:
+        return self.crawl_many([query])
+
+    def crawl_many(self, queries: List[str], concurrent: bool = True) -> List[Document]:
+        """
+        Load the documents for all queries from all sources.
+
+        In concurrent mode every source gets its own worker pool, limited by
+        the source's concurrency and rate limit, so all sources and queries
+        are crawled in parallel. Failed or timed out loads are recorded in
+        `self.errors` and the documents of all other loads are returned.
+
+        Args:
+            queries (List[str]): The search queries.
+            concurrent (bool): Crawl in parallel instead of one after another.
+
+        Returns:
+            List[Document]: The documents, ordered by query and source.
+        """
+        self.errors = []
+        jobs = [
+            (query_index, source_index)
+            for query_index in range(len(queries))
+            for source_index in range(len(self.sources))
+        ]
+
+        if concurrent:
+            results = self.__crawl_concurrent(queries, jobs)
+        else:
+            results = {}
+            for query_index, source_index in jobs:
+                source = self.sources[source_index]
+                try:
+                    results[(query_index, source_index)] = self.__load(
+                        source, queries[query_index], {}, (query_index, source_index)
+                    )
+                except Exception as e:
+                    self.__failed(source, queries[query_index], e)
+
         docs = []
+        for job in sorted(results):
+            docs.extend(results[job])
+
+        return docs
+
+    def __crawl_concurrent(
+        self, queries: List[str], jobs: List[Tuple[int, int]]
+    ) -> Dict[Tuple[int, int], List[Document]]:
+        pools = [
+            ThreadPoolExecutor(
+                max_workers=source.max_concurrency,
+                thread_name_prefix=f"crawl-{source.name}",
+            )
+            for source in self.sources
+        ]
+        started: Dict[Tuple[int, int], float] = {}
+        futures = {
+            pools[source_index].submit(
+                self.__load,
+                self.sources[source_index],
+                queries[query_index],
+                started,
+                (query_index, source_index),
+            ): (query_index, source_index)
+            for query_index, source_index in jobs
+        }
+
+        results = {}
+        pending = set(futures)
+        try:
+            while pending:
+                done, pending = wait(pending, timeout=0.5, return_when=FIRST_COMPLETED)
+
+                for future in done:
+                    query_index, source_index = futures[future]
+                    try:
+                        results[futures[future]] = future.result()
+                    except Exception as e:
+                        self.__failed(
+                            self.sources[source_index], queries[query_index], e
+                        )
+
+                now = time.monotonic()
+                for future in list(pending):
+                    query_index, source_index = job = futures[future]
+                    source = self.sources[source_index]
+                    if job in started and now - started[job] > source.timeout:
+                        # The thread cannot be interrupted, its result is dropped
+                        pending.remove(future)
+                        self.__failed(
+                            source,
+                            queries[query_index],
+                            TimeoutError(f"No result after {source.timeout}s"),
+                        )
+        finally:
+            for pool in pools:
+                pool.shutdown(wait=False, cancel_futures=True)
+
+        return results
+
+    def __load(
+        self,
+        source: Source,
+        query: str,
+        started: Dict[Tuple[int, int], float],
+        job: Tuple[int, int],
+    ) -> List[Document]:
+        if source.limiter:
+            source.limiter.acquire()
+
+        started[job] = time.monotonic()
+        return source.load(query)
+
+    def __failed(self, source: Source, query: str, error: Exception) -> None:
+        print(f"Crawling {source.name} for '{query}' failed: {error!r}")
+        self.errors.append(
+            {"source": source.name, "query": query, "error": repr(error)}
+        )
+
+    def __load_arxiv(self, query: str) -> List[Document]:
+        docs = ArxivLoader(query=query, load_max_docs=LIMIT_PER_SOURCE).load()
+        self.__clean_metadata(docs, [])
+        return docs
 
-        loader_wikipedia = WikipediaLoader(
+    def __load_wikipedia(self, query: str) -> List[Document]:
+        loader = WikipediaLoader(
             query=query,
             load_max_docs=LIMIT_PER_SOURCE,
             doc_content_chars_max=1_000_000,
         )
-        loader_arxiv = ArxivLoader(query=query, load_max_docs=LIMIT_PER_SOURCE)
-        loader_semantic_scholar = SemanticScholarLoader(
-            query=query, load_max_docs=LIMIT_PER_SOURCE
-        )
+        return loader.load()
 
-        docs_arxiv = loader_arxiv.load()
-        docs_wikipedia = loader_wikipedia.load()
-        docs_semantic_scholar = loader_semantic_scholar.load()
-
-        self.__clean_metadata(docs_arxiv, [])
-
-        docs.extend(docs_arxiv)
-        docs.extend(docs_wikipedia)
-        docs.extend(docs_semantic_scholar)
-
-        return docs
+    def __load_semantic_scholar(self, query: str) -> List[Document]:
+        loader = SemanticScholarLoader(query=query, load_max_docs=LIMIT_PER_SOURCE)
+        return loader.load()
 
     def __clean_metadata(
         self, docs_arxiv: List[Document], docs_pubmed: List[Document]
@@ -138,17 +328,61 @@ class DataCrawler:
 
 
 class Database:
+    """
+    The FAISS vector store of crawled documents.
+
+    Args:
+        name (str): The directory name below database/.
+        initialize (bool): Crawl `queries` and build a new index.
+        queries (List[str], optional): The queries used for initialization.
+        from_corpus (bool): Build a new index from the corpus snapshot of all
+            previously crawled documents instead of crawling.
+        batch_size (int): Documents embedded at a time when building from
+            the corpus.
+        index_type (str): flat, ivf, hnsw or ivfpq, used when building the index.
+        nprobe (int, optional): IVF cells visited per search.
+        ef_search (int, optional): HNSW candidate list size per search.
+        mmap (bool): Memory-map the index read-only instead of loading it into
+            RAM. Requires a compacted ivf or ivfpq index and does not allow
+            adding documents.
+        provider (str, optional): The embedding provider, see
+            `src.data.embeddings.get_embeddings`. Defaults to the provider that
+            built the index.
+
+    Raises:
+        ValueError: If `provider` differs from the provider that built the index.
+    """
+
     def __init__(
-        self, name: str, initialize: bool = False, queries: Optional[List[str]] = None
+        self,
+        name: str,
+        initialize: bool = False,
+        queries: Optional[List[str]] = None,
+        from_corpus: bool = False,
+        batch_size: int = BATCH_SIZE,
+        index_type: str = "flat",
+        nprobe: Optional[int] = None,
+        ef_search: Optional[int] = None,
+        mmap: bool = False,
+        provider: Optional[str] = None,
     ) -> None:
         self.path = ROOT / f"database/{name}"
         self.splitter = RecursiveCharacterTextSplitter(
             chunk_size=1000, chunk_overlap=200, add_start_index=True
         )
-        self.embeddings = OpenAIEmbeddings(model="text-embedding-3-small")
+        self.provider = self.__provider(provider, rebuild=initialize or from_corpus)
+        self.embeddings = get_embeddings(self.provider)
         self.crawler = DataCrawler()
-
-        if initialize:
+        self.corpus = Corpus(ROOT / CORPUS_FILE)
+        self.index_type = index_type
+        self.mmap = mmap
+        self._known_ids: Optional[set] = None
+        self._lexical: Optional[BM25Index] = None
+        self._lexical_lock = threading.Lock()
+
+        if from_corpus:
+            self.vector: FAISS = self.__build(self.corpus.batches(batch_size))
+        elif initialize:
             if not queries:
                 raise ValueError("Queries must be provided for initialization.")
 
@@ -156,39 +390,290 @@ class Database:
         else:
             self.vector: FAISS = self.__load()
 
+        set_search_params(self.vector.index, nprobe=nprobe, ef_search=ef_search)
+
     def __initialize(self, queries: List[str]) -> FAISS:
         """Only run once to initialize the database."""
-        docs = []
-        for query in tqdm(queries, desc="Processing keywords", total=len(queries)):
-            docs.extend(self.crawler.crawl(query))
+        docs = self.crawler.crawl_many(queries)
+        self.corpus.add(docs)
 
-        self.__save_pickle(docs)
+        return self.__build([docs])
 
-        splits = self.splitter.split_documents(docs)
+    def __build(self, batches: Iterable[List[Document]]) -> FAISS:
+        """Split and embed batches of documents into a new index and write it."""
+        database = None
+        known = set()
+
+        for docs in batches:
+            splits = self.splitter.split_documents(docs)
+            splits, ids = self.__deduplicate(splits, known)
+            if not splits:
+                continue
+
+            if database is None:
+                database = FAISS.from_documents(splits, self.embeddings, ids=ids)
+            else:
+                database.add_documents(splits, ids=ids)
+            known.update(ids)
+
+        if database is None:
+            raise ValueError("There are no documents to build the database from.")
 
-        database = FAISS.from_documents(splits, self.embeddings)
-        database.save_local(self.path)
+        if self.index_type != "flat":
+            database.index = build_index(self.index_type, vectors_of(database.index))
+        self.__write(database)
+        self._known_ids = known
 
         return database
 
-    def __save_pickle(self, docs: List[Document]) -> None:
-        now = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-        file = f"{now}.pkl"
-        path = Path("database/docs") / file
-        path.parent.mkdir(parents=True, exist_ok=True)
+    def __provider(self, provider: Optional[str], rebuild: bool) -> str:
+        recorded = None
+        if not rebuild:
+            self.__recover()
+            recorded = self.__recorded_provider()
 
-        with open(path, "wb") as file:
-            pickle.dump(docs, file)
+        if provider and recorded and provider != recorded:
+            raise ValueError(
+                f"{self.path.name} was built with {recorded} embeddings and cannot "
+                f"be searched with {provider}. Rebuild it to change the provider."
+            )
+
+        return provider or recorded or default_provider()
+
+    def __recorded_provider(self) -> Optional[str]:
+        path = self.path / PROVIDER_FILE
+        if path.exists():
+            return json.loads(path.read_text())["provider"]
+
+        if (self.path / "index.faiss").exists():
+            # Indexes built before providers were recorded used OpenAI
+            return DEFAULT_PROVIDER
+
+        return None
 
     def __load(self):
         """Used for inference."""
-        return FAISS.load_local(
+        self.__recover()
+        segments = self.__segments()
+
+        if self.mmap and segments:
+            print(f"{self.path.name} has segments, compact it to memory-map it.")
+            self.mmap = False
+
+        if self.mmap:
+            index = read_index(self.path / "index.faiss", mmap=True)
+            kind = index_type(index)
+            if kind not in MMAP_INDEX_TYPES:
+                print(
+                    f"{self.path.name} is a {kind} index, which is read into RAM. "
+                    f"Reindex it as one of {MMAP_INDEX_TYPES} to memory-map it."
+                )
+                self.mmap = False
+
+            with open(self.path / "index.pkl", "rb") as f:
+                docstore, index_to_docstore_id = pickle.load(f)
+            return FAISS(self.embeddings, index, docstore, index_to_docstore_id)
+
+        vector = FAISS.load_local(
             self.path, self.embeddings, allow_dangerous_deserialization=True
         )
+        for segment in segments:
+            self.__append(
+                vector,
+                FAISS.load_local(
+                    segment, self.embeddings, allow_dangerous_deserialization=True
+                ),
+            )
+
+        return vector
+
+    def fingerprint(self) -> Tuple:
+        """Modification times of the index files on disk, used to detect changes."""
+        files = [self.path / "index.faiss", self.path / "index.pkl"]
+        mtimes = tuple(f.stat().st_mtime if f.exists() else 0.0 for f in files)
+        return mtimes + tuple(segment.name for segment in self.__segments())
+
+    def size_on_disk(self) -> int:
+        return sum(f.stat().st_size for f in self.path.rglob("*") if f.is_file())
 
     def extend(self, query: str):
         """Extend the database with new documents."""
-        docs = self.crawler.crawl(query)
+        self.extend_many([query])
+
+    def extend_many(self, queries: List[str]):
+        """Extend the database with the documents of several queries, crawled concurrently."""
+        self.__check_writable()
+        docs = self.crawler.crawl_many(queries)
+        self.corpus.add(docs)
+
+        added = self.add_documents(docs)
+        print(f"Added {added} new chunks to {self.path.name}.")
+
+    def add_documents(self, docs: List[Document]) -> int:
+        """
+        Split documents and add the chunks that are not indexed yet.
 
+        Chunks are identified by the hash of their content, so only new
+        chunks are embedded. They are appended to the in-memory index and
+        written to disk as a new segment next to the base index, which costs
+        O(new chunks) instead of rewriting the whole index.
+
+        Args:
+            docs (List[Document]): The documents.
+
+        Returns:
+            int: The number of chunks that were added.
+
+        Raises:
+            ValueError: If the index is memory-mapped.
+        """
+        self.__check_writable()
         splits = self.splitter.split_documents(docs)
-        self.vector.add_documents(splits)
+        splits, ids = self.__deduplicate(splits, self.__known())
+        if not splits:
+            return 0
+
+        segment = FAISS.from_documents(splits, self.embeddings, ids=ids)
+        self.__write_segment(segment)
+
+        self.__append(self.vector, segment)
+        self._known_ids.update(ids)
+        with self._lexical_lock:
+            if self._lexical is not None:
+                self._lexical.add(zip(ids, [split.page_content for split in splits]))
+
+        return len(splits)
+
+    @property
+    def lexical(self) -> BM25Index:
+        """The BM25 index over the chunk texts, built from the docstore on first use."""
+        with self._lexical_lock:
+            if self._lexical is None:
+                lexical = BM25Index()
+                lexical.add(
+                    (id, self.vector.docstore.search(id).page_content)
+                    for id in self.vector.index_to_docstore_id.values()
+                )
+                self._lexical = lexical
+
+            return self._lexical
+
+    def compact(self) -> None:
+        """
+        Fold all segments into the base index on disk.
+
+        Raises:
+            ValueError: If the index is memory-mapped.
+        """
+        self.__check_writable()
+        self.__write(self.vector)
+
+    def reindex(self, index_type: str, **params) -> None:
+        """
+        Rebuild the index as another index type and write it to disk.
+
+        Args:
+            index_type (str): flat, ivf, hnsw or ivfpq.
+            **params: nlist and m, see `src.data.index.index_spec`.
+
+        Raises:
+            ValueError: If the index is memory-mapped.
+        """
+        self.__check_writable()
+        self.vector.index = build_index(
+            index_type, vectors_of(self.vector.index), **params
+        )
+        self.index_type = index_type
+        self.compact()
+
+    def __check_writable(self) -> None:
+        # faiss aborts the process when a read-only memory-mapped index is
+        # written to, so this has to be checked before anything is written
+        if self.mmap:
+            raise ValueError(
+                f"{self.path.name} is memory-mapped read-only. Load it without "
+                "mmap to change it."
+            )
+
+    @staticmethod
+    def __append(vector: FAISS, segment: FAISS) -> None:
+        # Adding the vectors works for every index type, unlike merge_from
+        ids = [segment.index_to_docstore_id[i] for i in range(segment.index.ntotal)]
+        docs = [segment.docstore.search(id) for id in ids]
+        embeddings = vectors_of(segment.index).tolist()
+
+        vector.add_embeddings(
+            zip([doc.page_content for doc in docs], embeddings),
+            metadatas=[doc.metadata for doc in docs],
+            ids=ids,
+        )
+
+    @staticmethod
+    def chunk_id(doc: Document) -> str:
+        return hashlib.sha256(doc.page_content.encode("utf-8")).hexdigest()
+
+    def __known(self) -> set:
+        if self._known_ids is None:
+            # Indexes built before content hashes were used as ids have
+            # random ids, so the hashes of their texts are added as well
+            docstore = self.vector.docstore._dict
+            self._known_ids = set(docstore) | {
+                self.chunk_id(doc) for doc in docstore.values()
+            }
+
+        return self._known_ids
+
+    def __deduplicate(
+        self, splits: List[Document], known: set
+    ) -> Tuple[List[Document], List[str]]:
+        unique = {}
+        for split in splits:
+            id = self.chunk_id(split)
+            if id not in known and id not in unique:
+                unique[id] = split
+
+        return list(unique.values()), list(unique.keys())
+
+    def __segments(self) -> List[Path]:
+        segments_dir = self.path / "segments"
+        if not segments_dir.exists():
+            return []
+
+        return sorted(
+            d
+            for d in segments_dir.iterdir()
+            if d.is_dir() and not d.name.startswith(".")
+        )
+
+    def __write_segment(self, segment: FAISS) -> None:
+        segments_dir = self.path / "segments"
+        segments_dir.mkdir(parents=True, exist_ok=True)
+
+        existing = self.__segments()
+        number = int(existing[-1].name) + 1 if existing else 0
+
+        tmp_path = segments_dir / f".tmp-{uuid.uuid4().hex}"
+        segment.save_local(tmp_path)
+        os.replace(tmp_path, segments_dir / f"{number:06d}")
+
+    def __write(self, vector: FAISS) -> None:
+        """Replace the index on disk (including all segments) atomically."""
+        tmp_path = self.path.with_name(f".{self.path.name}.tmp")
+        old_path = self.path.with_name(f".{self.path.name}.old")
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        vector.save_local(tmp_path)
+        (tmp_path / PROVIDER_FILE).write_text(
+            json.dumps({"provider": self.provider, "dimension": vector.index.d})
+        )
+
+        if self.path.exists():
+            shutil.rmtree(old_path, ignore_errors=True)
+            os.replace(self.path, old_path)
+        os.replace(tmp_path, self.path)
+        shutil.rmtree(old_path, ignore_errors=True)
+
+    def __recover(self) -> None:
+        """Restore the previous index if a write was interrupted between renames."""
+        old_path = self.path.with_name(f".{self.path.name}.old")
+        if not self.path.exists() and old_path.exists():
+            os.replace(old_path, self.path)
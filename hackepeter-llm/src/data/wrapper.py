@@ -1,20 +1,248 @@
-from typing import List
+import os
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
 
+import faiss
+import numpy as np
+import psutil
 from langchain_core.documents import Document
 
+from src.data.lexical import reciprocal_rank_fusion
 from src.data.loader import Database
+from src.utils.batching import MicroBatcher
+from src.utils.tracing import span
+
+DATABASE_NAME = "vector_db"
+QUERY_MODES = ["vector", "keyword", "hybrid"]
+QUERY_MODE = "hybrid"
+HYBRID_CANDIDATES = 3
 
 
 class KnowledgeBase:
-    def __init__(self) -> None:
+    """
+    The searchable knowledge base of one database.
+
+    Args:
+        name (str): The directory name below database/.
+        index_type (str): flat, ivf, hnsw or ivfpq, used when the index is
+            rebuilt.
+        nprobe (int, optional): IVF cells visited per search.
+        ef_search (int, optional): HNSW candidate list size per search.
+        mmap (bool): Memory-map the index read-only, see `Database`.
+    """
+
+    def __init__(
+        self,
+        name: str = DATABASE_NAME,
+        index_type: str = "flat",
+        nprobe: Optional[int] = None,
+        ef_search: Optional[int] = None,
+        mmap: bool = False,
+    ) -> None:
+        process = psutil.Process()
+        rss_before = process.memory_info().rss
+        start = time.perf_counter()
+
+        self.options = dict(
+            name=name,
+            index_type=index_type,
+            nprobe=nprobe,
+            ef_search=ef_search,
+            mmap=mmap,
+        )
         self.database = Database(
-            name="vector_db",
+            name=name,
             initialize=False,
+            index_type=index_type,
+            nprobe=nprobe,
+            ef_search=ef_search,
+            mmap=mmap,
         )
 
-    def query(self, keywords: str, query: str, k: int) -> List[Document]:
-        # return list of documents, each document has .page_content and .metadata. Metadata has min. title, summary, source.
-        # 1000 characters for content
-        # self.database.extend(keywords)
+        self.fingerprint = self.database.fingerprint()
+        self.stats = {
+            "name": name,
+            "load_seconds": round(time.perf_counter() - start, 3),
+            "rss_delta_bytes": process.memory_info().rss - rss_before,
+            "index_bytes_on_disk": self.database.size_on_disk(),
+            "vectors": self.database.vector.index.ntotal,
+            "mmap": self.database.mmap,
+            "loaded_at": time.time(),
+        }
+        self.batcher = MicroBatcher(self.__search_batch)
+
+    def query(
+        self, keywords: str, query: str, k: int, mode: str = QUERY_MODE
+    ) -> List[Document]:
+        """
+        Search the knowledge base.
+
+        Args:
+            keywords (str): A short keyword query, used for lexical search.
+            query (str): The text used for vector search.
+            k (int): The number of documents.
+            mode (str): vector searches the embeddings, keyword only the BM25
+                index without an embedding call, and hybrid fuses the rankings
+                of both.
+
+        Returns:
+            List[Document]: The documents, best match first. Metadata has at
+                least title, summary and source.
+        """
+        if mode not in QUERY_MODES:
+            raise ValueError(f"Unknown query mode '{mode}', use one of {QUERY_MODES}.")
+
+        with span("retrieval", mode=mode, k=k) as attributes:
+            if mode == "vector":
+                ids = self.batcher((query, k))
+            elif mode == "keyword":
+                ids = self.__keyword_ids(keywords or query, k)
+            else:
+                candidates = k * HYBRID_CANDIDATES
+                ids = reciprocal_rank_fusion(
+                    [
+                        self.batcher((query, candidates)),
+                        self.__keyword_ids(keywords or query, candidates),
+                    ],
+                    k=k,
+                )
+            attributes["results"] = len(ids)
+
+            return self.__documents(ids)
+
+    def query_many(self, queries: List[str], k: int) -> List[List[Document]]:
+        """
+        Search several queries with one embedding call and one index search.
+
+        Args:
+            queries (List[str]): The query texts.
+            k (int): The number of documents per query.
+
+        Returns:
+            List[List[Document]]: The documents of each query, best match first.
+        """
+        return [self.__documents(ids) for ids in self.__search_ids(queries, k)]
+
+    def __search_ids(self, queries: List[str], k: int) -> List[List[str]]:
+        if not queries:
+            return []
+
+        vector = self.database.vector
+        matrix = np.asarray(
+            self.database.embeddings.embed_documents(queries), dtype=np.float32
+        )
+        if vector._normalize_L2:
+            faiss.normalize_L2(matrix)
+
+        _, indices = vector.index.search(matrix, k)
+
+        return [
+            [vector.index_to_docstore_id[i] for i in row if i != -1] for row in indices
+        ]
+
+    def __search_batch(self, items: List[Tuple[str, int]]) -> List[List[str]]:
+        # Concurrent callers may ask for different k, search for the largest
+        k = max(k for _, k in items)
+        results = self.__search_ids([query for query, _ in items], k=k)
+        return [ids[:k] for ids, (_, k) in zip(results, items)]
+
+    def __keyword_ids(self, keywords: str, k: int) -> List[str]:
+        return [id for id, _ in self.database.lexical.search(keywords, k)]
+
+    def __documents(self, ids: List[str]) -> List[Document]:
+        return [self.database.vector.docstore.search(id) for id in ids]
+
+    def is_stale(self) -> bool:
+        """Whether the index on disk changed since this instance was loaded."""
+        return self.database.fingerprint() != self.fingerprint
+
+
+_knowledge_base: Optional[KnowledgeBase] = None
+_lock = threading.Lock()
+
+
+def knowledge_base_options() -> Dict:
+    """
+    The options of the shared knowledge base, set with the environment
+    variables KNOWLEDGE_BASE_NAME, KNOWLEDGE_BASE_INDEX_TYPE,
+    KNOWLEDGE_BASE_NPROBE, KNOWLEDGE_BASE_EF_SEARCH and KNOWLEDGE_BASE_MMAP.
+    """
+    options = {}
+    for name, parse in [
+        ("name", str),
+        ("index_type", str),
+        ("nprobe", int),
+        ("ef_search", int),
+        ("mmap", lambda value: value.lower() in ("1", "true", "yes")),
+    ]:
+        value = os.getenv(f"KNOWLEDGE_BASE_{name.upper()}")
+        if value:
+            options[name] = parse(value)
+    return options
+
+
+def get_knowledge_base(**options) -> KnowledgeBase:
+    """
+    Return the process-wide knowledge base, loading it on first use.
+
+    The FAISS index is only read from disk once per process. Searching is
+    read-only, so the returned instance can be shared between threads.
+
+    Args:
+        **options: The `KnowledgeBase` options, used if it is not loaded
+            yet. Defaults to `knowledge_base_options`.
+
+    Returns:
+        KnowledgeBase: The shared knowledge base.
+    """
+    global _knowledge_base
+
+    if _knowledge_base is None:
+        with _lock:
+            if _knowledge_base is None:
+                _knowledge_base = KnowledgeBase(**(options or knowledge_base_options()))
+                print(f"Knowledge base loaded: {_knowledge_base.stats}")
+
+    return _knowledge_base
+
+
+def reload_knowledge_base(force: bool = False) -> KnowledgeBase:
+    """
+    Reload the shared knowledge base if the index on disk changed.
+
+    The new index is loaded before it replaces the old one, so queries that
+    are already running finish against the previous instance. It is loaded
+    with the options of the previous instance.
+
+    Args:
+        force (bool): Reload even if the index files did not change.
+
+    Returns:
+        KnowledgeBase: The (possibly new) shared knowledge base.
+    """
+    global _knowledge_base
+
+    with _lock:
+        if _knowledge_base is None or force or _knowledge_base.is_stale():
+            options = (
+                _knowledge_base.options
+                if _knowledge_base is not None
+                else knowledge_base_options()
+            )
+            _knowledge_base = KnowledgeBase(**options)
+            print(f"Knowledge base loaded: {_knowledge_base.stats}")
+
+        return _knowledge_base
+
+
+def knowledge_base_stats() -> Dict:
+    """Load statistics of the shared knowledge base, empty if it is not loaded yet."""
+    if _knowledge_base is None:
+        return {}
 
-        return self.database.vector.similarity_search(query, k=k)
+    return dict(
+        _knowledge_base.stats,
+        stale=_knowledge_base.is_stale(),
+        batching=_knowledge_base.batcher.stats(),
+    )
@@ -0,0 +1,102 @@
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Tuple
+
+MAX_BATCH = 64
+MAX_WAIT = 0.005
+
+
+class MicroBatcher:
+    """
+    Collects concurrent calls for a few milliseconds and runs them as one batch.
+
+    `fn` receives the list of submitted items and returns one result per item,
+    in the same order. A worker thread is started when the first item arrives
+    and exits again once nothing is pending, so an idle batcher holds no thread.
+
+    Args:
+        fn (Callable): The batch function.
+        max_batch (int): The largest batch passed to `fn`.
+        max_wait (float): Seconds to wait for more items before running a batch.
+    """
+
+    def __init__(
+        self,
+        fn: Callable[[List[Any]], List[Any]],
+        max_batch: int = MAX_BATCH,
+        max_wait: float = MAX_WAIT,
+    ) -> None:
+        self.fn = fn
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+
+        self._pending: List[Tuple[Any, Future]] = []
+        self._condition = threading.Condition()
+        self._running = False
+        self._batches = 0
+        self._items = 0
+
+    def submit(self, item: Any) -> Future:
+        """Queue an item and return the future of its result."""
+        future = Future()
+
+        with self._condition:
+            self._pending.append((item, future))
+            if len(self._pending) >= self.max_batch:
+                self._condition.notify()
+
+            if not self._running:
+                self._running = True
+                threading.Thread(
+                    target=self.__run, name="micro-batcher", daemon=True
+                ).start()
+
+        return future
+
+    def __call__(self, item: Any) -> Any:
+        return self.submit(item).result()
+
+    def stats(self) -> Dict:
+        with self._condition:
+            return {
+                "batches": self._batches,
+                "items": self._items,
+                "mean_batch": (
+                    round(self._items / self._batches, 2) if self._batches else 0
+                ),
+            }
+
+    def __run(self) -> None:
+        while True:
+            with self._condition:
+                if not self._pending:
+                    self._running = False
+                    return
+
+                deadline = time.monotonic() + self.max_wait
+                while len(self._pending) < self.max_batch:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._condition.wait(remaining)
+
+                batch = self._pending[: self.max_batch]
+                del self._pending[: self.max_batch]
+                self._batches += 1
+                self._items += len(batch)
+
+            self.__process(batch)
+
+    def __process(self, batch: List[Tuple[Any, Future]]) -> None:
+        items = [item for item, _ in batch]
+
+        try:
+            results = self.fn(items)
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+
+        for (_, future), result in zip(batch, results):
+            future.set_result(result)
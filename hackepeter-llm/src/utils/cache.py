@@ -0,0 +1,241 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+from langchain_core.caches import RETURN_VAL_TYPE, BaseCache
+from langchain_core.load import dumps, loads
+
+ROOT = Path(__file__).parent.parent.parent
+LLM_CACHE_PATH = ROOT / "database/cache/responses.sqlite"
+LLM_CACHE_MAX_ENTRIES = 50_000
+LLM_CACHE_TTL = 7 * 24 * 60 * 60
+
+
+class DiskCache:
+    """
+    A small persistent key-value cache backed by sqlite.
+
+    Entries are evicted least-recently-used first once more than `max_entries`
+    are stored, and expire `ttl` seconds after they were written. The cache is
+    safe to share between threads.
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        max_entries: Optional[int] = None,
+        ttl: Optional[float] = None,
+    ) -> None:
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_entries = max_entries
+        self.ttl = ttl
+
+        self.hits = 0
+        self.misses = 0
+
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(self.path, check_same_thread=False)
+        with self._connection:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                "key TEXT PRIMARY KEY, value BLOB, created REAL, accessed REAL)"
+            )
+            self._connection.execute(
+                "CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed)"
+            )
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)"
+            )
+
+    def get(self, key: str) -> Optional[bytes]:
+        return self.get_many([key]).get(key)
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, bytes]:
+        keys = list(dict.fromkeys(keys))
+        found = {}
+
+        now = time.time()
+        oldest = now - self.ttl if self.ttl is not None else 0.0
+
+        with self._lock, self._connection:
+            # sqlite limits the number of bound parameters per statement
+            for i in range(0, len(keys), 500):
+                batch = keys[i : i + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._connection.execute(
+                    f"SELECT key, value FROM entries WHERE key IN ({placeholders}) "
+                    "AND created >= ?",
+                    [*batch, oldest],
+                ).fetchall()
+                found.update(rows)
+
+            self._connection.executemany(
+                "UPDATE entries SET accessed = ? WHERE key = ?",
+                [(now, key) for key in found],
+            )
+
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+
+        return found
+
+    def set(self, key: str, value: bytes) -> None:
+        self.set_many([(key, value)])
+
+    def set_many(self, items: Iterable[Tuple[str, bytes]]) -> None:
+        now = time.time()
+        rows = [(key, value, now, now) for key, value in items]
+
+        with self._lock, self._connection:
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO entries (key, value, created, accessed) "
+                "VALUES (?, ?, ?, ?)",
+                rows,
+            )
+            self.__evict()
+
+    def get_meta(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT value FROM meta WHERE key = ?", (key,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def set_meta(self, key: str, value: str) -> None:
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value)
+            )
+
+    def clear(self) -> None:
+        with self._lock, self._connection:
+            self._connection.execute("DELETE FROM entries")
+            self._connection.execute("DELETE FROM meta")
+
+    def __len__(self) -> int:
+        with self._lock:
+            row = self._connection.execute("SELECT COUNT(*) FROM entries").fetchone()
+        return row[0]
+
+    def stats(self) -> Dict:
+        return {
+            "path": str(self.path),
+            "entries": len(self),
+            "max_entries": self.max_entries,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+    def __evict(self) -> None:
+        if self.ttl is not None:
+            self._connection.execute(
+                "DELETE FROM entries WHERE created < ?", (time.time() - self.ttl,)
+            )
+
+        if self.max_entries is None:
+            return
+
+        count = self._connection.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+        overflow = count - self.max_entries
+        if overflow > 0:
+            self._connection.execute(
+                "DELETE FROM entries WHERE key IN "
+                "(SELECT key FROM entries ORDER BY accessed ASC LIMIT ?)",
+                (overflow,),
+            )
+
+
+class LLMCache(BaseCache):
+    """
+    Persistent langchain cache for model responses.
+
+    Responses are keyed on the model parameters (`llm_string` contains the
+    model name, temperature etc.) and the fully rendered prompt. Output
+    parsers run on the cached generation, and their format instructions are
+    part of the rendered prompt, so parsed results are reproduced as well.
+    Only attach it to deterministic (temperature 0) models.
+    """
+
+    def __init__(self, cache: DiskCache) -> None:
+        self.cache = cache
+
+    def lookup(self, prompt: str, llm_string: str) -> Optional[RETURN_VAL_TYPE]:
+        value = self.cache.get(self.__key(prompt, llm_string))
+        if value is None:
+            return None
+
+        try:
+            generations = loads(value.decode("utf-8"))
+        except Exception:
+            return None
+
+        # Lets callbacks tell cache hits from model calls
+        for generation in generations:
+            generation.generation_info = dict(
+                generation.generation_info or {}, cached=True
+            )
+        return generations
+
+    def update(self, prompt: str, llm_string: str, return_val: RETURN_VAL_TYPE) -> None:
+        value = dumps(return_val).encode("utf-8")
+        self.cache.set(self.__key(prompt, llm_string), value)
+
+    def clear(self, **kwargs: Any) -> None:
+        self.cache.clear()
+
+    def __key(self, prompt: str, llm_string: str) -> str:
+        llm_string = stable_llm_string(llm_string)
+        return hashlib.sha256(f"{llm_string}\n{prompt}".encode("utf-8")).hexdigest()
+
+
+def stable_llm_string(llm_string: str) -> str:
+    """
+    The parts of a langchain `llm_string` that are the same in every process.
+
+    Model arguments that cannot be serialized, e.g. the HTTP clients and the
+    cache itself, are recorded with their repr, which contains a memory
+    address. They do not change the response, so they are left out.
+    """
+    serialized, separator, params = llm_string.rpartition("---")
+    try:
+        model = json.loads(serialized)
+    except ValueError:
+        return llm_string
+    if not isinstance(model, dict):
+        return llm_string
+
+    kwargs = model.get("kwargs", {})
+    model["kwargs"] = {
+        name: value
+        for name, value in kwargs.items()
+        if not (isinstance(value, dict) and value.get("type") == "not_implemented")
+    }
+    return json.dumps(model, sort_keys=True) + separator + params
+
+
+_llm_cache: Optional[LLMCache] = None
+
+
+def get_llm_cache() -> LLMCache:
+    """
+    Return the process-wide response cache for deterministic model calls.
+
+    Returns:
+        LLMCache: The shared response cache.
+    """
+    global _llm_cache
+
+    if _llm_cache is None:
+        cache = DiskCache(
+            LLM_CACHE_PATH, max_entries=LLM_CACHE_MAX_ENTRIES, ttl=LLM_CACHE_TTL
+        )
+        _llm_cache = LLMCache(cache)
+
+    return _llm_cache
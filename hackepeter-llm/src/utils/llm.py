@@ -0,0 +1,403 @@
+import asyncio
+import contextvars
+import json
+import os
+import threading
+import time
+import weakref
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Coroutine, Dict, Optional, Tuple
+
+import httpx
+from langchain_openai import ChatOpenAI
+
+from src.utils.scheduler import (
+    MAX_RETRIES,
+    RETRY_STATUS,
+    Priority,
+    Scheduler,
+    get_scheduler,
+    retry_delay,
+)
+from src.utils.tracing import LLM_RETRIES, count_tokens, tracing_callback
+
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", 20))
+KEEPALIVE_SECONDS = 30
+LOOP_WORKERS = 32
+COMPLETION_TOKENS = 500
+
+
+class _ReleasingStream(httpx.SyncByteStream):
+    """
+    A response body that frees its slot when it is closed, or when it is
+    garbage collected because a caller dropped it unclosed.
+    """
+
+    def __init__(self, stream: httpx.SyncByteStream, release) -> None:
+        self._stream = stream
+        self._release = release
+        weakref.finalize(self, release)
+
+    def __iter__(self):
+        yield from self._stream
+
+    def close(self) -> None:
+        try:
+            self._stream.close()
+        finally:
+            self._release()
+
+
+class _AsyncReleasingStream(httpx.AsyncByteStream):
+    """The async counterpart of `_ReleasingStream`."""
+
+    def __init__(self, stream: httpx.AsyncByteStream, release) -> None:
+        self._stream = stream
+        self._release = release
+        weakref.finalize(self, release)
+
+    async def __aiter__(self):
+        async for chunk in self._stream:
+            yield chunk
+
+    async def aclose(self) -> None:
+        try:
+            await self._stream.aclose()
+        finally:
+            self._release()
+
+
+def _once(fn):
+    lock = threading.Lock()
+    done = []
+
+    def call():
+        with lock:
+            if done:
+                return
+            done.append(True)
+        fn()
+
+    return call
+
+
+def estimate(request: httpx.Request) -> Tuple[str, int]:
+    """The model and the estimated prompt and completion tokens of a request."""
+    try:
+        body = json.loads(request.content or b"{}")
+    except Exception:
+        body = {}
+
+    model = str(body.get("model", "unknown"))
+    text = "\n".join(
+        str(message.get("content") or "") for message in body.get("messages", [])
+    )
+    completion = body.get("max_tokens") or COMPLETION_TOKENS
+    return model, count_tokens(text, model) + completion
+
+
+PRIORITY_HEADER = "x-llm-priority"
+
+
+class _Scheduling:
+    """
+    The scheduling and retry state of one request, shared by the sync and
+    async transports.
+
+    The chat models send their priority in a header, which is removed
+    before the request goes upstream.
+    """
+
+    def __init__(self, scheduler: Scheduler, request: httpx.Request) -> None:
+        self.scheduler = scheduler
+        self.model, self.tokens = estimate(request)
+        priority = request.headers.get(PRIORITY_HEADER, "").upper()
+        self.priority = Priority.__members__.get(priority, Priority.BACKGROUND)
+        if PRIORITY_HEADER in request.headers:
+            del request.headers[PRIORITY_HEADER]
+        self.attempt = 0
+
+    @property
+    def slot(self) -> Tuple[str, int, Priority]:
+        """The arguments of `Scheduler.acquire` for the request."""
+        return self.model, self.tokens, self.priority
+
+    def done(self, response: httpx.Response) -> bool:
+        """Whether the response is final, i.e. not retried."""
+        return response.status_code not in RETRY_STATUS or self.attempt >= MAX_RETRIES
+
+    def retry(self, response=None, error=None) -> Optional[float]:
+        """
+        Free the slot of a failed attempt and return the seconds to sleep
+        before the next, or None if the request gives up.
+
+        A 429 holds back every request to the model instead of only this one.
+        """
+        self.scheduler.release()
+        if self.attempt >= MAX_RETRIES:
+            return None
+
+        if response is not None:
+            retry_after = response.headers.get("retry-after")
+            reason = str(response.status_code)
+        else:
+            retry_after, reason = None, type(error).__name__
+
+        delay = retry_delay(self.attempt, retry_after)
+        self.attempt += 1
+        LLM_RETRIES.inc(model=self.model, reason=reason)
+
+        if response is not None and response.status_code == 429:
+            self.scheduler.pause(self.model, delay)
+            return 0.0
+        return delay
+
+    def hold(self, response: httpx.Response, releasing_stream) -> httpx.Response:
+        """Keep the slot of the request until its response is closed."""
+        if isinstance(response.stream, httpx.ByteStream):
+            # The body is already in memory, there is nothing left to stream
+            self.scheduler.release()
+        else:
+            release = _once(self.scheduler.release)
+            response.stream = releasing_stream(response.stream, release)
+        return response
+
+
+class ScheduledTransport(httpx.BaseTransport):
+    """
+    A pooled transport that sends every request through the scheduler.
+
+    A request holds its slot from admission until the response is closed,
+    so streamed responses count while they stream. Responses with a 429 or
+    5xx status and connection errors are retried with jittered backoff.
+    """
+
+    def __init__(
+        self,
+        scheduler: Scheduler,
+        limits: httpx.Limits,
+        transport: Optional[httpx.BaseTransport] = None,
+    ) -> None:
+        self.scheduler = scheduler
+        self._transport = transport or httpx.HTTPTransport(limits=limits)
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        scheduling = _Scheduling(self.scheduler, request)
+
+        while True:
+            self.scheduler.acquire(*scheduling.slot)
+            try:
+                response = self._transport.handle_request(request)
+            except httpx.TransportError as e:
+                delay = scheduling.retry(error=e)
+                if delay is None:
+                    raise
+            except BaseException:
+                self.scheduler.release()
+                raise
+            else:
+                if scheduling.done(response):
+                    return scheduling.hold(response, _ReleasingStream)
+
+                response.close()
+                delay = scheduling.retry(response=response)
+
+            time.sleep(delay)
+
+    def close(self) -> None:
+        self._transport.close()
+
+
+class AsyncScheduledTransport(httpx.AsyncBaseTransport):
+    """
+    The async counterpart of `ScheduledTransport`.
+
+    Connections belong to the event loop that opened them, so every loop
+    gets its own pool.
+    """
+
+    def __init__(
+        self,
+        scheduler: Scheduler,
+        limits: httpx.Limits,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+    ) -> None:
+        self.scheduler = scheduler
+        self.limits = limits
+        self._transport = transport
+        self._transports: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+
+    def __transport(self) -> httpx.AsyncBaseTransport:
+        if self._transport is not None:
+            return self._transport
+
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if loop not in self._transports:
+                self._transports[loop] = httpx.AsyncHTTPTransport(limits=self.limits)
+            return self._transports[loop]
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        transport = self.__transport()
+        scheduling = _Scheduling(self.scheduler, request)
+
+        while True:
+            await self.scheduler.aacquire(*scheduling.slot)
+            try:
+                response = await transport.handle_async_request(request)
+            except httpx.TransportError as e:
+                delay = scheduling.retry(error=e)
+                if delay is None:
+                    raise
+            except BaseException:
+                self.scheduler.release()
+                raise
+            else:
+                if scheduling.done(response):
+                    return scheduling.hold(response, _AsyncReleasingStream)
+
+                await response.aclose()
+                delay = scheduling.retry(response=response)
+
+            await asyncio.sleep(delay)
+
+    async def aclose(self) -> None:
+        transport = self._transports.pop(asyncio.get_running_loop(), None)
+        if transport is not None:
+            await transport.aclose()
+
+
+_http_clients: Optional[Tuple[httpx.Client, httpx.AsyncClient]] = None
+_models: Dict[Tuple, ChatOpenAI] = {}
+_lock = threading.Lock()
+
+
+def get_http_clients() -> Tuple[httpx.Client, httpx.AsyncClient]:
+    """
+    Return the process-wide HTTP clients of all LLM calls.
+
+    The clients keep connections alive between calls and send their
+    requests through the scheduler. Calls of all priorities share one
+    connection pool, the scheduler decides which request goes next.
+    """
+    global _http_clients
+
+    with _lock:
+        if _http_clients is None:
+            limits = httpx.Limits(
+                max_connections=LLM_MAX_CONNECTIONS,
+                max_keepalive_connections=LLM_MAX_CONNECTIONS,
+                keepalive_expiry=KEEPALIVE_SECONDS,
+            )
+            scheduler = get_scheduler()
+            # The timeouts of the OpenAI client apply per request
+            _http_clients = (
+                httpx.Client(
+                    transport=ScheduledTransport(scheduler, limits), timeout=None
+                ),
+                httpx.AsyncClient(
+                    transport=AsyncScheduledTransport(scheduler, limits), timeout=None
+                ),
+            )
+
+        return _http_clients
+
+
+def get_chat_model(
+    model: str,
+    temperature: float = 0,
+    priority: Priority = Priority.BACKGROUND,
+    **params: Any,
+) -> ChatOpenAI:
+    """
+    Return the shared chat model for a model and its parameters.
+
+    Chat models are safe to share between threads, so every combination is
+    created once and all of them use the pooled HTTP clients. The scheduler
+    retries failed requests, so the OpenAI client does not.
+
+    Args:
+        model (str): The OpenAI model name.
+        temperature (float): The sampling temperature.
+        priority (Priority): The scheduling class of the calls.
+        **params: Further ChatOpenAI parameters, e.g. cache. Must be hashable.
+
+    Returns:
+        ChatOpenAI: The chat model.
+    """
+    key = (model, temperature, priority, tuple(sorted(params.items())))
+
+    with _lock:
+        llm = _models.get(key)
+    if llm is not None:
+        return llm
+
+    http_client, http_async_client = get_http_clients()
+    llm = ChatOpenAI(
+        model_name=model,
+        temperature=temperature,
+        http_client=http_client,
+        http_async_client=http_async_client,
+        default_headers={PRIORITY_HEADER: priority.name.lower()},
+        callbacks=[tracing_callback],
+        **{"max_retries": 0, **params},
+    )
+
+    with _lock:
+        return _models.setdefault(key, llm)
+
+
+def llm_stats() -> Dict:
+    """Shared chat models, requests in flight and waiting, and rate limits."""
+    with _lock:
+        models = len(_models)
+    return dict(get_scheduler().stats(), chat_models=models)
+
+
+_loop: Optional[asyncio.AbstractEventLoop] = None
+
+
+def _get_loop() -> asyncio.AbstractEventLoop:
+    global _loop
+
+    with _lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            # Shared by the to_thread calls of all jobs on the loop
+            _loop.set_default_executor(
+                ThreadPoolExecutor(LOOP_WORKERS, thread_name_prefix="llm-loop")
+            )
+            threading.Thread(
+                target=_loop.run_forever, name="llm-loop", daemon=True
+            ).start()
+
+        return _loop
+
+
+def run_sync(coroutine: Coroutine) -> Any:
+    """
+    Run a coroutine on the process-wide LLM event loop and wait for it.
+
+    Unlike `asyncio.run`, which closes its loop and with it the pooled
+    connections, the loop lives as long as the process. The coroutine runs
+    in the caller's context, so it is traced as part of the caller's span.
+    """
+    loop = _get_loop()
+    context = contextvars.copy_context()
+    result: Future = Future()
+
+    def done(task: asyncio.Task) -> None:
+        if task.cancelled():
+            result.cancel()
+        elif task.exception() is not None:
+            result.set_exception(task.exception())
+        else:
+            result.set_result(task.result())
+
+    def start() -> None:
+        task = context.run(loop.create_task, coroutine)
+        task.add_done_callback(done)
+
+    loop.call_soon_threadsafe(start)
+    return result.result()
@@ -0,0 +1,276 @@
+import asyncio
+import itertools
+import os
+import random
+import threading
+import time
+from enum import IntEnum
+from typing import Dict, Optional, Tuple
+
+from src.utils.ratelimit import RateLimiter
+
+LLM_CONCURRENCY = int(os.getenv("LLM_CONCURRENCY", 16))
+# Requests and tokens per minute, overridable with LLM_RATE_LIMITS, e.g.
+# "gpt-3.5-turbo=3500:160000,gpt-4-turbo-preview=500:300000"
+MODEL_LIMITS: Dict[str, Tuple[int, int]] = {
+    "gpt-3.5-turbo": (3500, 160_000),
+    "gpt-4-turbo-preview": (500, 300_000),
+}
+DEFAULT_LIMITS = (500, 60_000)
+BURST_SECONDS = 10
+MAX_WAIT = 1.0
+
+MAX_RETRIES = 4
+RETRY_BASE = 0.5
+RETRY_MAX = 30.0
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+
+class Priority(IntEnum):
+    """Scheduling classes, lower values go first."""
+
+    INTERACTIVE = 0
+    BACKGROUND = 1
+
+
+def parse_limits(value: str) -> Dict[str, Tuple[int, int]]:
+    """Parse "model=requests:tokens,..." into per-minute limits."""
+    limits = {}
+    for item in filter(None, (part.strip() for part in value.split(","))):
+        model, _, rates = item.partition("=")
+        requests, _, tokens = rates.partition(":")
+        limits[model.strip()] = (int(requests), int(tokens))
+    return limits
+
+
+class _Buckets:
+    """The request and token buckets of one model."""
+
+    def __init__(self, requests_per_minute: int, tokens_per_minute: int) -> None:
+        self.requests = RateLimiter(
+            requests_per_minute / 60, requests_per_minute / 60 * BURST_SECONDS
+        )
+        self.tokens = RateLimiter(
+            tokens_per_minute / 60, tokens_per_minute / 60 * BURST_SECONDS
+        )
+        self.paused_until = 0.0
+
+    def wait(self, tokens: float) -> float:
+        """Seconds until a request of `tokens` fits, 0 if it fits now."""
+        paused = self.paused_until - time.monotonic()
+        tokens = min(tokens, self.tokens.capacity)
+        missing_requests = 1 - self.requests.available()
+        missing_tokens = tokens - self.tokens.available()
+        return max(
+            paused,
+            missing_requests / self.requests.rate,
+            missing_tokens / self.tokens.rate,
+            0.0,
+        )
+
+    def take(self, tokens: float) -> None:
+        self.requests.acquire(1, timeout=0)
+        self.tokens.acquire(tokens, timeout=0)
+
+
+class Scheduler:
+    """
+    Admits LLM requests by priority, per-model rate limits and a global
+    concurrency limit.
+
+    A request waits until the token buckets of its model can pay for it and
+    a concurrency slot is free. Among the requests that could go, the one
+    with the best priority goes first, and requests of the same model and
+    priority go in arrival order. So a burst of background requests queues
+    behind the buckets while an interactive request overtakes it.
+    """
+
+    def __init__(
+        self,
+        concurrency: int = LLM_CONCURRENCY,
+        limits: Optional[Dict[str, Tuple[int, int]]] = None,
+        default_limits: Tuple[int, int] = DEFAULT_LIMITS,
+    ) -> None:
+        if concurrency < 1:
+            raise ValueError("Concurrency must be at least 1.")
+
+        self.concurrency = concurrency
+        self.limits = dict(MODEL_LIMITS if limits is None else limits)
+        self.default_limits = default_limits
+        self.active = 0
+
+        self._buckets: Dict[str, _Buckets] = {}
+        self._waiting: Dict[Tuple[int, int], Tuple[str, float]] = {}
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+
+    def acquire(
+        self, model: str, tokens: float, priority: Priority = Priority.BACKGROUND
+    ) -> None:
+        """
+        Wait until a request may be sent.
+
+        Args:
+            model (str): The model the request goes to.
+            tokens (float): The estimated prompt and completion tokens.
+            priority (Priority): The scheduling class of the request.
+        """
+        with self._condition:
+            entry = (int(priority), next(self._sequence))
+            self._waiting[entry] = (model, tokens)
+            try:
+                while True:
+                    wait = self.__admit(entry)
+                    if wait == 0:
+                        break
+                    self._condition.wait(min(wait, MAX_WAIT) if wait else MAX_WAIT)
+            finally:
+                del self._waiting[entry]
+                # Waiters behind this one may be able to go now
+                self._condition.notify_all()
+
+            self.__buckets(model).take(tokens)
+            self.active += 1
+
+    def try_acquire(
+        self, model: str, tokens: float, priority: Priority = Priority.BACKGROUND
+    ) -> bool:
+        """Take a slot if a request may be sent right away."""
+        with self._condition:
+            entry = (int(priority), next(self._sequence))
+            self._waiting[entry] = (model, tokens)
+            try:
+                if self.__admit(entry) != 0:
+                    return False
+            finally:
+                del self._waiting[entry]
+
+            self.__buckets(model).take(tokens)
+            self.active += 1
+            return True
+
+    async def aacquire(
+        self, model: str, tokens: float, priority: Priority = Priority.BACKGROUND
+    ) -> None:
+        """Like `acquire`, but waits in a worker thread so the loop keeps running."""
+        if self.try_acquire(model, tokens, priority):
+            return
+
+        future = asyncio.ensure_future(
+            asyncio.to_thread(self.acquire, model, tokens, priority)
+        )
+        try:
+            await asyncio.shield(future)
+        except asyncio.CancelledError:
+            # The thread still takes the slot, so give it back once it has
+            future.add_done_callback(lambda _: self.release())
+            raise
+
+    def release(self) -> None:
+        with self._condition:
+            self.active -= 1
+            self._condition.notify_all()
+
+    def pause(self, model: str, seconds: float) -> None:
+        """Hold back all requests to a model, e.g. after it answered 429."""
+        with self._condition:
+            buckets = self.__buckets(model)
+            buckets.paused_until = max(buckets.paused_until, time.monotonic() + seconds)
+
+    def stats(self) -> Dict:
+        with self._condition:
+            waiting: Dict[str, int] = {}
+            for priority, _ in self._waiting:
+                name = Priority(priority).name.lower()
+                waiting[name] = waiting.get(name, 0) + 1
+
+            return {
+                "limit": self.concurrency,
+                "active": self.active,
+                "waiting": waiting,
+                "models": {
+                    model: {
+                        "requests": round(buckets.requests.available(), 1),
+                        "tokens": round(buckets.tokens.available()),
+                        "paused": buckets.paused_until > time.monotonic(),
+                    }
+                    for model, buckets in self._buckets.items()
+                },
+            }
+
+    def __admit(self, entry: Tuple[int, int]) -> Optional[float]:
+        """
+        0 if the request may go now, else the seconds until its buckets can
+        pay for it, or None if it waits for a slot or for other requests.
+        """
+        model, tokens = self._waiting[entry]
+        if not self.__is_head(entry):
+            return None
+
+        wait = self.__buckets(model).wait(tokens)
+        if wait > 0:
+            return wait
+
+        if self.active >= self.concurrency:
+            return None
+
+        # A free slot goes to the best request that could use it
+        for other in sorted(self._waiting):
+            if other == entry:
+                return 0
+            if (
+                self.__is_head(other)
+                and self.__buckets(self._waiting[other][0]).wait(
+                    self._waiting[other][1]
+                )
+                == 0
+            ):
+                return None
+        return 0
+
+    def __is_head(self, entry: Tuple[int, int]) -> bool:
+        model = self._waiting[entry][0]
+        return not any(
+            other < entry and self._waiting[other][0] == model
+            for other in self._waiting
+        )
+
+    def __buckets(self, model: str) -> _Buckets:
+        if model not in self._buckets:
+            self._buckets[model] = _Buckets(
+                *self.limits.get(model, self.default_limits)
+            )
+        return self._buckets[model]
+
+
+def retry_delay(attempt: int, retry_after: Optional[str] = None) -> float:
+    """
+    Seconds to wait before retry number `attempt`.
+
+    Uses the Retry-After header if the provider sent one, else exponential
+    backoff with full jitter, so clients that failed together do not retry
+    together.
+    """
+    if retry_after:
+        try:
+            return min(float(retry_after), RETRY_MAX)
+        except ValueError:
+            pass
+    return random.uniform(0, min(RETRY_MAX, RETRY_BASE * 2**attempt))
+
+
+_scheduler: Optional[Scheduler] = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler() -> Scheduler:
+    """Return the process-wide scheduler of all LLM requests."""
+    global _scheduler
+
+    with _scheduler_lock:
+        if _scheduler is None:
+            limits = dict(MODEL_LIMITS)
+            limits.update(parse_limits(os.getenv("LLM_RATE_LIMITS", "")))
+            _scheduler = Scheduler(limits=limits)
+
+        return _scheduler
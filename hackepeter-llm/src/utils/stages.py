@@ -0,0 +1,90 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, List, NamedTuple, Tuple
+
+from src.utils.tracing import span
+
+
+class Stage(NamedTuple):
+    """
+    A step of a pipeline.
+
+    Args:
+        name (str): The stage name, also the key of its result.
+        run (Callable): A coroutine function called with the results of the
+            stages it depends on as keyword arguments.
+        after (Tuple[str, ...]): The stages it depends on.
+    """
+
+    name: str
+    run: Callable[..., Awaitable[Any]]
+    after: Tuple[str, ...] = ()
+
+
+class StageSkipped(Exception):
+    """A stage did not run because a stage it depends on failed."""
+
+
+async def run_stages(stages: List[Stage], prefix: str = "stage") -> Dict[str, Any]:
+    """
+    Run a DAG of stages, every stage as soon as its dependencies are done.
+
+    Independent stages overlap, so the pipeline takes as long as its critical
+    path. A failing stage does not cancel the others; stages that depend on
+    it are skipped.
+
+    Args:
+        stages (List[Stage]): The stages, in any order.
+        prefix (str): Prefix of the span names of the stages.
+
+    Returns:
+        dict: The result of every stage, or the exception it failed with.
+    """
+    names = {stage.name for stage in stages}
+    for stage in stages:
+        missing = set(stage.after) - names
+        if missing:
+            raise ValueError(f"Stage {stage.name} depends on unknown {missing}.")
+
+    tasks: Dict[str, asyncio.Task] = {}
+
+    async def run(stage: Stage) -> Any:
+        inputs = {}
+        for name in stage.after:
+            try:
+                inputs[name] = await tasks[name]
+            except Exception as e:
+                raise StageSkipped(f"{stage.name} needs {name}, which failed.") from e
+
+        with span(f"{prefix}.{stage.name}"):
+            return await stage.run(**inputs)
+
+    for stage in _ordered(stages):
+        tasks[stage.name] = asyncio.create_task(run(stage))
+
+    results = await asyncio.gather(*tasks.values(), return_exceptions=True)
+    return dict(zip(tasks, results))
+
+
+def _ordered(stages: List[Stage]) -> List[Stage]:
+    """The stages in dependency order, so every task exists before it is awaited."""
+    by_name = {stage.name: stage for stage in stages}
+    ordered, visiting, done = [], set(), set()
+
+    def visit(stage: Stage) -> None:
+        if stage.name in done:
+            return
+        if stage.name in visiting:
+            raise ValueError(f"Stage {stage.name} is part of a cycle.")
+
+        visiting.add(stage.name)
+        for name in stage.after:
+            visit(by_name[name])
+        visiting.discard(stage.name)
+
+        done.add(stage.name)
+        ordered.append(stage)
+
+    for stage in stages:
+        visit(stage)
+
+    return ordered
@@ -0,0 +1,354 @@
+import contextlib
+import contextvars
+import itertools
+import json
+import threading
+import time
+import uuid
+from collections import deque
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+from uuid import UUID
+
+import tiktoken
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+RECENT_SPANS = 1000
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+class Histogram:
+    """A Prometheus histogram with labels."""
+
+    def __init__(self, name: str, help: str, buckets: Tuple[float, ...] = BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = buckets
+        self._values: Dict[Labels, List] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            entry = self._values.setdefault(key, [[0] * len(self.buckets), 0.0, 0])
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[0][i] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, (counts, total, count) in sorted(self._values.items()):
+                for bound, bucket in zip(self.buckets, counts):
+                    lines.append(
+                        f"{self.name}_bucket{_labels(key, le=str(bound))} {bucket}"
+                    )
+                lines.append(f'{self.name}_bucket{_labels(key, le="+Inf")} {count}')
+                lines.append(f"{self.name}_sum{_labels(key)} {total}")
+                lines.append(f"{self.name}_count{_labels(key)} {count}")
+        return lines
+
+
+class Counter:
+    """A Prometheus counter with labels."""
+
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self._values: Dict[Labels, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, value: float = 1, **labels: str) -> None:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_labels(key)} {value}")
+        return lines
+
+
+def _labels(key: Labels, **extra: str) -> str:
+    items = list(key) + list(extra.items())
+    if not items:
+        return ""
+    return "{" + ",".join(f"{k}={json.dumps(str(v))}" for k, v in items) + "}"
+
+
+SPAN_SECONDS = Histogram(
+    "hackepeter_span_duration_seconds", "Duration of traced operations."
+)
+SPAN_ERRORS = Counter(
+    "hackepeter_span_errors_total", "Failed operations by error class."
+)
+LLM_TOKENS = Counter(
+    "hackepeter_llm_tokens_total", "Tokens sent to and received from LLMs."
+)
+LLM_RETRIES = Counter(
+    "hackepeter_llm_retries_total", "LLM requests retried by status or error."
+)
+METRICS = [SPAN_SECONDS, SPAN_ERRORS, LLM_TOKENS, LLM_RETRIES]
+
+
+def render_metrics() -> str:
+    """All metrics in the Prometheus text exposition format."""
+    return "\n".join(line for metric in METRICS for line in metric.render()) + "\n"
+
+
+def classify_error(error: BaseException) -> str:
+    """A coarse, low-cardinality class of an error, used as a metric label."""
+    names = {cls.__name__ for cls in type(error).__mro__}
+
+    if "RateLimitError" in names:
+        return "rate_limit"
+    if names & {"APITimeoutError", "TimeoutError", "Timeout", "ReadTimeout"}:
+        return "timeout"
+    if names & {"AuthenticationError", "PermissionDeniedError"}:
+        return "auth"
+    if names & {"APIConnectionError", "ConnectionError"}:
+        return "connection"
+    if names & {"OutputParserException", "JSONDecodeError", "ValidationError"}:
+        return "parse"
+    if "APIStatusError" in names:
+        return "api"
+    return "other"
+
+
+_recent: deque = deque(maxlen=RECENT_SPANS)
+_current: contextvars.ContextVar[Optional[Dict]] = contextvars.ContextVar(
+    "span", default=None
+)
+
+
+def record_span(
+    name: str,
+    duration: float,
+    error: Optional[BaseException] = None,
+    parent: Optional[Dict] = None,
+    span_id: Optional[str] = None,
+    **attributes: Any,
+) -> Dict:
+    """
+    Record a finished operation as a span and in the metrics.
+
+    Args:
+        name (str): The operation, e.g. "metadata.science".
+        duration (float): Its duration in seconds.
+        error (BaseException, optional): The error it failed with.
+        parent (dict, optional): The enclosing span.
+        span_id (str, optional): The id of the span, random by default.
+        **attributes: Further fields stored with the span.
+
+    Returns:
+        dict: The span.
+    """
+    status = "error" if error else "ok"
+    record = {
+        "id": span_id or uuid.uuid4().hex[:16],
+        "trace_id": parent["trace_id"] if parent else uuid.uuid4().hex,
+        "parent_id": parent["id"] if parent else None,
+        "name": name,
+        "start": time.time() - duration,
+        "duration_ms": round(duration * 1000, 3),
+        "status": status,
+        **attributes,
+    }
+    if error:
+        record["error"] = classify_error(error)
+        record["message"] = str(error)[:500]
+        SPAN_ERRORS.inc(span=name, error=record["error"])
+
+    SPAN_SECONDS.observe(duration, span=name, status=status)
+    _recent.append(record)
+    return record
+
+
+@contextlib.contextmanager
+def span(name: str, **attributes: Any) -> Iterator[Dict]:
+    """
+    Trace the enclosed block as a span nested in the current one.
+
+    Exceptions are recorded and re-raised. Attributes added to the yielded
+    dict while the block runs, e.g. token counts, are stored with the span.
+    """
+    parent = _current.get()
+    current = {
+        "id": uuid.uuid4().hex[:16],
+        "trace_id": parent["trace_id"] if parent else uuid.uuid4().hex,
+        "attributes": dict(attributes),
+    }
+    # Children inherit the trace id, so a root span needs a parent-like
+    # record for record_span that carries its own trace id
+    trace = {"id": None, "trace_id": current["trace_id"]}
+    token = _current.set(current)
+    start = time.perf_counter()
+
+    error = None
+    try:
+        yield current["attributes"]
+    except BaseException as e:
+        error = e
+        raise
+    finally:
+        _current.reset(token)
+        record_span(
+            name,
+            time.perf_counter() - start,
+            error=error,
+            parent=parent or trace,
+            span_id=current["id"],
+            **current["attributes"],
+        )
+
+
+def traced(iterable: Iterable, name: str) -> Iterator:
+    """Yield the items of an iterable, tracing the production of each as a span."""
+    parent = _current.get()
+    iterator = iter(iterable)
+
+    for step in itertools.count():
+        start = time.perf_counter()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            return
+        except Exception as e:
+            record_span(name, time.perf_counter() - start, e, parent, step=step)
+            raise
+
+        record_span(name, time.perf_counter() - start, parent=parent, step=step)
+        yield item
+
+
+def recent_spans(limit: int = 100, name: Optional[str] = None) -> List[Dict]:
+    """The most recent spans, newest first."""
+    spans = [span for span in reversed(_recent) if name is None or span["name"] == name]
+    return spans[:limit]
+
+
+_encodings: Dict[str, Any] = {}
+
+
+def count_tokens(text: str, model: str) -> int:
+    """
+    The number of tokens of a text for a model.
+
+    tiktoken downloads its vocabularies on first use. If that is not possible,
+    the count falls back to the usual estimate of four characters per token.
+    """
+    if model not in _encodings:
+        try:
+            try:
+                _encodings[model] = tiktoken.encoding_for_model(model)
+            except KeyError:
+                _encodings[model] = tiktoken.get_encoding("cl100k_base")
+        except Exception as e:
+            print(f"Estimating token counts for {model}: {e}")
+            _encodings[model] = None
+
+    encoding = _encodings[model]
+    if encoding is None:
+        return max(1, len(text) // 4) if text else 0
+
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+class TracingCallback(BaseCallbackHandler):
+    """
+    Counts LLM tokens and traces every LLM call and tool call of a chain.
+
+    Token counts are added to the metrics and to the span that is active
+    when the call starts. Responses from the LLM cache are traced with
+    `cached` set, but their tokens are not counted.
+    """
+
+    def __init__(self) -> None:
+        self._runs: Dict[UUID, Tuple[float, str, Optional[Dict], Dict]] = {}
+        self._lock = threading.Lock()
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs) -> None:
+        model = _model_name(serialized, kwargs)
+        text = "\n".join(str(m.content) for batch in messages for m in batch)
+        self.__start(
+            run_id, "llm", model=model, prompt_tokens=count_tokens(text, model)
+        )
+
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs) -> None:
+        model = _model_name(serialized, kwargs)
+        tokens = sum(count_tokens(prompt, model) for prompt in prompts)
+        self.__start(run_id, "llm", model=model, prompt_tokens=tokens)
+
+    def on_llm_end(self, response: LLMResult, *, run_id, **kwargs) -> None:
+        run = self.__pop(run_id)
+        if run is None:
+            return
+
+        start, name, parent, attributes = run
+        generations = [g for batch in response.generations for g in batch]
+        text = "".join(g.text for g in generations)
+        attributes["completion_tokens"] = count_tokens(text, attributes["model"])
+        if any((g.generation_info or {}).get("cached") for g in generations):
+            attributes["cached"] = True
+        self.__finish(start, name, parent, attributes)
+
+    def on_llm_error(self, error: BaseException, *, run_id, **kwargs) -> None:
+        run = self.__pop(run_id)
+        if run is not None:
+            self.__finish(*run, error=error)
+
+    def on_tool_start(self, serialized, input_str, *, run_id, **kwargs) -> None:
+        self.__start(run_id, "agent.tool", tool=serialized.get("name"))
+
+    def on_tool_end(self, output, *, run_id, **kwargs) -> None:
+        run = self.__pop(run_id)
+        if run is not None:
+            self.__finish(*run)
+
+    def on_tool_error(self, error: BaseException, *, run_id, **kwargs) -> None:
+        run = self.__pop(run_id)
+        if run is not None:
+            self.__finish(*run, error=error)
+
+    def __start(self, run_id: UUID, name: str, **attributes: Any) -> None:
+        with self._lock:
+            self._runs[run_id] = (time.perf_counter(), name, _current.get(), attributes)
+
+    def __pop(self, run_id: UUID):
+        with self._lock:
+            return self._runs.pop(run_id, None)
+
+    def __finish(
+        self,
+        start: float,
+        name: str,
+        parent: Optional[Dict],
+        attributes: Dict,
+        error: Optional[BaseException] = None,
+    ) -> None:
+        if name == "llm" and not attributes.get("cached"):
+            model = attributes["model"]
+            for kind in ["prompt_tokens", "completion_tokens"]:
+                if kind in attributes:
+                    LLM_TOKENS.inc(attributes[kind], model=model, kind=kind[:-7])
+                    if parent is not None:
+                        totals = parent["attributes"]
+                        totals[kind] = totals.get(kind, 0) + attributes[kind]
+
+        record_span(
+            name, time.perf_counter() - start, error=error, parent=parent, **attributes
+        )
+
+
+def _model_name(serialized: Dict, kwargs: Dict) -> str:
+    params = kwargs.get("invocation_params") or {}
+    return str(params.get("model_name") or params.get("model") or "unknown")
+
+
+tracing_callback = TracingCallback()
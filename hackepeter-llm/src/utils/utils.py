@@ -1,7 +1,10 @@
-import json
-from typing import List
+import asyncio
+import threading
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor, wait
 from pathlib import Path
-from langchain_openai import ChatOpenAI
+from typing import Dict, List, Optional, Tuple
+
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.pydantic_v1 import BaseModel, Field
 from langchain_core.output_parsers import JsonOutputParser, StrOutputParser
@@ -9,104 +12,396 @@ from langchain_core.output_parsers import JsonOutputParser, StrOutputParser
 from src.agent.prompts import (description_chain_prompt,
                                evaluation_chain_prompt, keyword_chain_prompt,
                                science_chain_prompt, system_chain_prompt)
-from src.data.wrapper import KnowledgeBase
+from src.data.graph import GraphStore
+from src.data.wrapper import get_knowledge_base
+from src.utils.cache import get_llm_cache
+from src.utils.llm import get_chat_model, run_sync
+from src.utils.scheduler import Priority
+from src.utils.stages import Stage, StageSkipped, run_stages
+from src.utils.tracing import span
 
 path = Path("src/data/graph.json")
+runs_dir = Path("src/data/graphs")
+
+DEFAULT_RUN = "default"
+METADATA_WORKERS = 8
+TREE_PAGE_SIZE = 100
+# Finished runs beyond this many are dropped from memory and reloaded from
+# disk when they are requested again
+MAX_LOADED_RUNS = 16
+# Progress statuses of runs that are not finished yet
+ACTIVE_STATUSES = ("queued", "running")
+
+
+def _load_store(store_path: Path) -> GraphStore:
+    """
+    Load the graph store of a run from disk.
+
+    A run that is loaded from disk cannot be active, the process that ran it
+    is gone, so an active status is replaced by "interrupted".
+    """
+    store = GraphStore(store_path)
+    if store.progress.get("status") in ACTIVE_STATUSES:
+        store.set_progress(
+            status="interrupted", reason="The server stopped before the run finished."
+        )
+    return store
+
+
+_stores: Dict[str, GraphStore] = {DEFAULT_RUN: _load_store(path)}
+_stores_lock = threading.Lock()
+_latest_run = DEFAULT_RUN
+
+_metadata_pool = ThreadPoolExecutor(
+    max_workers=METADATA_WORKERS, thread_name_prefix="metadata"
+)
+_metadata_jobs: Dict[Tuple[str, int], Future] = {}
+
+
+def create_run() -> str:
+    """
+    Create an empty graph for a new generation run.
+
+    Every run has its own store and lock, so several runs can insert nodes
+    concurrently without touching each other's ids.
+
+    Returns:
+        str: The run id.
+    """
+    global _latest_run
+
+    run_id = uuid.uuid4().hex
+    store = GraphStore(runs_dir / f"{run_id}.json")
+    store.reset()
+
+    with _stores_lock:
+        _stores[run_id] = store
+        _latest_run = run_id
+        _evict_runs()
+
+    return run_id
+
+
+def get_store(run_id: Optional[str] = None) -> GraphStore:
+    """
+    Return the graph store of a run.
+
+    Args:
+        run_id (str, optional): The run id. Defaults to the latest run.
+
+    Returns:
+        GraphStore: The store.
+
+    Raises:
+        KeyError: If the run does not exist.
+    """
+    return resolve_run(run_id)[1]
+
+
+def resolve_run(run_id: Optional[str] = None) -> Tuple[str, GraphStore]:
+    """
+    Return the id and the graph store of a run.
+
+    Args:
+        run_id (str, optional): The run id. Defaults to the latest run.
+
+    Returns:
+        tuple: The run id and the store.
+
+    Raises:
+        KeyError: If the run does not exist.
+    """
+    with _stores_lock:
+        if run_id is None:
+            run_id = _latest_run
 
+        if run_id in _stores:
+            # Keep the stores in least recently used order
+            _stores[run_id] = _stores.pop(run_id)
+        else:
+            # Runs of a previous process or evicted runs are loaded from disk
+            run_path = runs_dir / f"{run_id}.json"
+            if not run_id.isalnum() or not run_path.exists():
+                raise KeyError(f"Run '{run_id}' does not exist.")
+            _stores[run_id] = _load_store(run_path)
+            _evict_runs(keep=run_id)
+
+        return run_id, _stores[run_id]
+
+
+def _evict_runs(keep: Optional[str] = None) -> None:
+    """Drop the least recently used finished runs. Needs `_stores_lock`."""
+    pending = {
+        job_run_id for (job_run_id, _), job in _metadata_jobs.items() if not job.done()
+    }
+    finished = [
+        run_id
+        for run_id, store in _stores.items()
+        if run_id not in (DEFAULT_RUN, _latest_run, keep)
+        and run_id not in pending
+        and store.progress.get("status") not in ACTIVE_STATUSES
+    ]
 
-def initialize_graph():
-    graph = []
-    with open(path, "w") as f:
-        json.dump(graph, f)
+    for run_id in finished[: max(0, len(_stores) - MAX_LOADED_RUNS)]:
+        del _stores[run_id]
+        for key in [key for key in _metadata_jobs if key[0] == run_id]:
+            del _metadata_jobs[key]
+
+
+def initialize_graph(run_id: Optional[str] = DEFAULT_RUN):
+    run_id, store = resolve_run(run_id)
+    store.reset()
+
+    with _stores_lock:
+        for key in [key for key in list(_metadata_jobs) if key[0] == run_id]:
+            del _metadata_jobs[key]
 
     return None
 
 
-def read_graph():
+def read_graph(run_id: Optional[str] = None):
     """
-    Read the graph from a file.
+    Read the graph of a run from the in-memory store.
+
+    Args:
+        run_id (str, optional): The run id. Defaults to the latest run.
 
     Returns:
         list: The graph.
     """
-    with open(path, "r") as f:
-        graph = json.load(f)
-    return graph
+    return get_store(run_id).nodes()
 
 
-def update_graph(node_path: str):
+def read_tree(
+    run_id: Optional[str] = None,
+    path: str = "",
+    offset: int = 0,
+    limit: int = TREE_PAGE_SIZE,
+    depth: Optional[int] = None,
+) -> str:
+    """
+    A compact view of the graph: one line with id, path and number of
+    children per node, without any metadata.
+
+    Args:
+        run_id (str, optional): The run id. Defaults to the latest run.
+        path (str): Only show the nodes below this node path.
+        offset (int): The number of nodes to skip.
+        limit (int): The maximum number of nodes to show.
+        depth (int, optional): The number of levels to show below `path`.
+
+    Returns:
+        str: The view.
+    """
+    store = get_store(run_id)
+
+    with store.lock:
+        node_id = None
+        if path:
+            node = store.find_path(path.strip("/"))
+            if node is None:
+                return f"Node '{path}' does not exist."
+            node_id = node["id"]
+
+        nodes = store.walk(node_id, depth)
+
+    if not nodes:
+        return f"There are no nodes below '{path}'." if path else "The graph is empty."
+
+    offset = max(offset, 0)
+    if offset >= len(nodes):
+        message = f"No nodes at offset {offset}, there are {len(nodes)} nodes"
+        if path:
+            message += f" below '{path}'"
+        return message + f". Use an offset from 0 to {len(nodes) - 1}."
+
+    page = nodes[offset : offset + limit]
+    lines = [f"{id} {node_path} ({children})" for id, node_path, children in page]
+
+    header = f"Nodes {offset + 1}-{offset + len(page)} of {len(nodes)}"
+    if path:
+        header += f" below '{path}'"
+    header += " as: id path (number of children)"
+    if offset + len(page) < len(nodes):
+        header += f". Use offset={offset + len(page)} for more"
+
+    return "\n".join([header + "."] + lines)
+
+
+def update_graph(node_path: str, run_id: Optional[str] = None):
     """
     Create a new node in the graph based on the given node path.
     The path consists of the node names separated by slashes (e.g. "Transportation/Cars/Speed Limit")
     The first part is the root node, the second part is a section, and the third part is an action.
     The node path must have a depth of 1 to 3.
 
+    The node is added right away with the metadata status "pending". Its
+    metadata is generated in the background and written into the graph once
+    it is done.
+
     Args:
         node_path (str): The path of the node.
+        run_id (str, optional): The run id. Defaults to the latest run.
+
+    Returns:
+        str: A message for the agent.
+    """
+    run_id, store = resolve_run(run_id)
+
+    path_parts = _path_parts(node_path)
+    name = path_parts[-1]
+
+    with store.lock:
+        error = _add_node(run_id, store, path_parts)
+    if error:
+        return error
+
+    message = f"Node '{name}' added to the graph."
+    return message
+
+
+def update_graph_many(node_paths: List[str], run_id: Optional[str] = None):
+    """
+    Create several nodes in the graph at once.
+
+    The paths are validated against the graph and against each other, and
+    inserted parents first, so a batch may contain a root, its areas and
+    their actions. The metadata of all new nodes is generated concurrently.
+
+    Args:
+        node_paths (List[str]): The node paths, see `update_graph`.
+        run_id (str, optional): The run id. Defaults to the latest run.
 
     Returns:
-        None
+        str: A summary for the agent, with the reason for every path that
+            was not added.
     """
-    graph = read_graph()
+    run_id, store = resolve_run(run_id)
+
+    paths = list(dict.fromkeys("/".join(_path_parts(path)) for path in node_paths))
+    paths = sorted(paths, key=lambda path: path.count("/"))
+
+    errors = []
+    with store.lock:
+        for node_path in paths:
+            error = _add_node(run_id, store, node_path.split("/"))
+            if error:
+                errors.append(f"- {node_path}: {error}")
+
+    message = f"Added {len(paths) - len(errors)} of {len(paths)} nodes to the graph."
+    if errors:
+        message += "\nNot added:\n" + "\n".join(errors)
+    return message
+
+
+def _path_parts(node_path: str) -> List[str]:
+    """The node names of a path, without surrounding whitespace."""
+    return [part.strip() for part in node_path.split("/")]
+
+
+def _add_node(run_id: str, store: GraphStore, path_parts: List[str]) -> Optional[str]:
+    """Add a node and submit its metadata job, or return why the path is invalid."""
+    if not all(path_parts):
+        return (
+            "Node names must not be empty. "
+            "Remove leading, trailing and double slashes."
+        )
 
-    path_parts = node_path.split("/")
     path_depth = len(path_parts)
+    name = path_parts[-1]
 
     if path_depth == 1:
-        id = 1
         parent_id = None
-        name = path_parts[0]
         type = "root"
-        metadata = generate_metadata(path_parts, type)
 
     elif path_depth <= 3:
-        ids = [node["id"] for node in graph]
-        id_name_mapping = {node["name"]: node["id"] for node in graph}
-
-        if not graph:
+        if not len(store):
             return "The graph is empty. You must add a root node first."
 
-        id = max(ids) + 1
-        parent_id = id_name_mapping.get(path_parts[-2])
-        if not parent_id:
+        parent = store.find_path("/".join(path_parts[:-1]))
+        if not parent:
             return "Parent node does not exist. You must specify the area first before adding an action."
 
-        name = path_parts[-1]
+        parent_id = parent["id"]
         type = "area" if path_depth == 2 else "action"
-        previous_content = ""
-        for node in graph:
-            if node["id"] == parent_id:
-                previous_content = node["metadata"]
-                break
-
-        if previous_content.get("description"):
-            previous_content = previous_content["description"]
-        else:
-            previous_content = ""
-
-        metadata = generate_metadata(path_parts, type, previous_content)
 
     else:
         return "Path depth must be between 1 and 3."
 
-    new_node = {
-        "id": id,
-        "parent_id": parent_id,
-        "name": name,
-        "type": type,
-        "metadata": metadata,
-    }
-
-    if new_node not in [node["id"] for node in graph]:
-        graph.append(new_node)
-    else:
+    if store.find(parent_id, name):
         return "Node already exists in the graph."
 
-    with open(path, "w") as f:
-        json.dump(graph, f)
+    node = store.add(name, parent_id, type, status="pending", metadata={})
 
-    message = f"Node '{name}' added to the graph."
-    return message
+    job = _metadata_pool.submit(
+        _complete_metadata, run_id, node["id"], path_parts, type, parent_id
+    )
+    with _stores_lock:
+        _metadata_jobs[(run_id, node["id"])] = job
+
+    return None
+
+
+def wait_for_metadata(run_id: Optional[str] = None, timeout: Optional[float] = None):
+    """
+    Block until the submitted metadata jobs are finished.
+
+    Args:
+        run_id (str, optional): Only wait for this run. Defaults to all runs.
+        timeout (float, optional): Maximum number of seconds to wait.
+    """
+    with _stores_lock:
+        jobs = [
+            job
+            for (job_run_id, _), job in list(_metadata_jobs.items())
+            if run_id is None or job_run_id == run_id
+        ]
+
+    wait(jobs, timeout=timeout)
+
+
+def _complete_metadata(
+    run_id: str,
+    node_id: int,
+    path_parts: List[str],
+    type: str,
+    parent_id: Optional[int],
+) -> dict:
+    store = get_store(run_id)
+
+    status = "done"
+    try:
+        previous_description = _parent_description(store, run_id, parent_id)
+        with span("metadata", type=type):
+            metadata = generate_metadata(path_parts, type, previous_description)
+    except Exception as e:
+        print(e)
+        status = "failed"
+        metadata = {"description": f"Could not create Metadata. {e}"}
+
+    with store.lock:
+        # The graph may have been reset while the metadata was generated
+        if store.get(node_id) and store.path_of(node_id) == "/".join(path_parts):
+            store.update(node_id, metadata=metadata, status=status)
+
+    return metadata
+
+
+def _parent_description(
+    store: GraphStore, run_id: str, parent_id: Optional[int]
+) -> str:
+    if parent_id is None:
+        return ""
+
+    # Jobs run in submission order and parents are always submitted before
+    # their children, so waiting here cannot starve the pool.
+    job = _metadata_jobs.get((run_id, parent_id))
+    if job is not None:
+        metadata = job.result()
+    else:
+        metadata = store.get(parent_id)["metadata"]
+
+    return metadata.get("description", "")
 
 
 def generate_metadata(
@@ -115,120 +410,147 @@ def generate_metadata(
     previous_description: str = "",
     power: bool = False,
 ):
+    """Synchronous wrapper of `agenerate_metadata` for the metadata workers."""
+    return run_sync(agenerate_metadata(path_parts, type, previous_description, power))
 
-    model = "gpt-4-turbo-preview" if power else "gpt-3.5-turbo"
-    llm = ChatOpenAI(model_name=model, temperature=0)
 
-    try:
-        node_stack = ""
-        if len(path_parts) == 3:
-            node_stack = (
-                path_parts[2]
-                + " within the area "
-                + path_parts[1]
-                + " within the sector "
-                + path_parts[0]
-            )
-        elif len(path_parts) == 2:
-            node_stack = path_parts[1] + " within the sector " + path_parts[0]
-        else:
-            node_stack = path_parts[0]
+async def agenerate_metadata(
+    path_parts: List[str],
+    type: str,
+    previous_description: str = "",
+    power: bool = False,
+):
+    """
+    Generate the metadata of a node.
 
-        prompt = system_chain_prompt.format(type=type, node_stack=node_stack)
-        prompt_template = ChatPromptTemplate.from_messages(
-            [("system", prompt), ("human", "{input}")]
+    The stages form a DAG and run with `ainvoke`: description and keywords
+    overlap, retrieval needs both, science needs the retrieved documents and
+    evaluation needs the science summary.
+    """
+    model = "gpt-4-turbo-preview" if power else "gpt-3.5-turbo"
+    llm = get_chat_model(
+        model, temperature=0, priority=Priority.BACKGROUND, cache=get_llm_cache()
+    )
+
+    node_stack = ""
+    if len(path_parts) == 3:
+        node_stack = (
+            path_parts[2]
+            + " within the area "
+            + path_parts[1]
+            + " within the sector "
+            + path_parts[0]
         )
-        chain_component = prompt_template | llm | StrOutputParser()
+    elif len(path_parts) == 2:
+        node_stack = path_parts[1] + " within the sector " + path_parts[0]
+    else:
+        node_stack = path_parts[0]
+
+    prompt = system_chain_prompt.format(type=type, node_stack=node_stack)
+    prompt_template = ChatPromptTemplate.from_messages(
+        [("system", prompt), ("human", "{input}")]
+    )
+    chain_component = prompt_template | llm | StrOutputParser()
 
+    async def description():
         prompt = description_chain_prompt.format(
             type=type, previous_description=previous_description
         )
+        return str(await chain_component.ainvoke({"input": f"{prompt}"}))
 
-        description = str(chain_component.invoke({"input": f"{prompt}"}))
-
-        if type == "root" or type == "area":
-            return {"description": description}
-
-        elif type == "action":
-            try:
-
-                prompt = keyword_chain_prompt.format(
-                    name=path_parts[-1], current_description=description
-                )
-
-                keywords_string = str(chain_component.invoke({"input": f"{prompt}"}))
-
-            except Exception as e:
-                print(e)
-                return {
-                    "description": description,
-                    "keywords": f"Could not generate keywords. {e}",
-                }
-
-            try:
-                knowledge_base = KnowledgeBase()
-                docs = knowledge_base.query(
-                    keywords=keywords_string, query=description, k=5
-                )
-                sources = {doc.metadata["title"]: doc.metadata["source"] for doc in docs}
-                # docs is a list of documents, each document has .page_content (1000 chars) and .metadata. Metadata has min. title, summary, source.
-                joined_docs = " ".join(doc.page_content for doc in docs)
-
-                prompt = science_chain_prompt.format(
-                    name=path_parts[-1],
-                    docs_content=joined_docs,
-                    current_description=description,
-                )
-                science_string = str(chain_component.invoke({"input": f"{prompt}"}))
-
-            except Exception as e:
-                print(e)
-                return {
-                    "description": description,
-                    "keywords": keywords_string,
-                    "science": f"Could not generate science. {e}",
-                    "sources": f"No science so no sources. {e}",
-                }
-
-            try:
-
-                class Evaluation(BaseModel):
-                    effectiveness: float = Field(
-                        description="The estimated effectiveness of the action in reducing carbon emissions. 1 marking the lowest effectiveness and 5 marking the highest."
-                    )
-                    scientific_concensus: float = Field(
-                        description="The amount of evidence / support for the effectiveness of the action. 1 marking the lowest and 5 marking the highest."
-                    )
-                    realization_speed: float = Field(
-                        description="The estimated time it will take for the action to have an impact on carbon emissions. 1 marking the slowest and 5 marking the fastest."
-                    )
-
-                parser = JsonOutputParser(pydantic_object=Evaluation)
-                chain_component = prompt_template | llm | parser
-                prompt = evaluation_chain_prompt.format(
-                    name=path_parts[-1],
-                    current_description=description,
-                    science=science_string,
-                    format_instructions=parser.get_format_instructions(),
-                )
-                metrics = chain_component.invoke({"input": f"{prompt}"})
-            except Exception as e:
-                print(e)
-                return {
-                    "description": description,
-                    "keywords": keywords_string,
-                    "science": science_string,
-                    "sources": sources,
-                    "metrics": f"Could not generate metrics. {e}",
-                }
-            return {
-                "description": description,
-                "keywords": keywords_string,
-                "science": science_string,
-                "sources": sources,
-                "metrics": metrics,
-            }
+    async def keywords():
+        prompt = keyword_chain_prompt.format(name=path_parts[-1])
+        return str(await chain_component.ainvoke({"input": f"{prompt}"}))
 
-    except Exception as e:
-        print(e)
-        return {"description": f"Could not create Metadata. {e}"}
+    async def retrieval(description, keywords):
+        knowledge_base = get_knowledge_base()
+        return await asyncio.to_thread(
+            knowledge_base.query, keywords=keywords, query=description, k=5
+        )
+
+    async def science(description, retrieval):
+        # docs is a list of documents, each document has .page_content (1000 chars) and .metadata. Metadata has min. title, summary, source.
+        joined_docs = " ".join(doc.page_content for doc in retrieval)
+        prompt = science_chain_prompt.format(
+            name=path_parts[-1],
+            docs_content=joined_docs,
+            current_description=description,
+        )
+        return str(await chain_component.ainvoke({"input": f"{prompt}"}))
+
+    async def evaluation(description, science):
+        class Evaluation(BaseModel):
+            effectiveness: float = Field(
+                description="The estimated effectiveness of the action in reducing carbon emissions. 1 marking the lowest effectiveness and 5 marking the highest."
+            )
+            scientific_concensus: float = Field(
+                description="The amount of evidence / support for the effectiveness of the action. 1 marking the lowest and 5 marking the highest."
+            )
+            realization_speed: float = Field(
+                description="The estimated time it will take for the action to have an impact on carbon emissions. 1 marking the slowest and 5 marking the fastest."
+            )
+
+        parser = JsonOutputParser(pydantic_object=Evaluation)
+        prompt = evaluation_chain_prompt.format(
+            name=path_parts[-1],
+            current_description=description,
+            science=science,
+            format_instructions=parser.get_format_instructions(),
+        )
+        return await (prompt_template | llm | parser).ainvoke({"input": f"{prompt}"})
+
+    if type == "action":
+        stages = [
+            Stage("description", description),
+            Stage("keywords", keywords),
+            Stage("retrieval", retrieval, after=("description", "keywords")),
+            Stage("science", science, after=("description", "retrieval")),
+            Stage("evaluation", evaluation, after=("description", "science")),
+        ]
+    else:
+        stages = [Stage("description", description)]
+
+    results = await run_stages(stages, prefix="metadata")
+    for name, result in results.items():
+        if isinstance(result, Exception) and not isinstance(result, StageSkipped):
+            print(f"{name}: {result}")
+
+    return _metadata(type, results)
+
+
+def _metadata(type: str, results: Dict) -> Dict:
+    """The metadata of a node from its stage results, with messages for failed stages."""
+    failed = {
+        name: result
+        for name, result in results.items()
+        if isinstance(result, Exception)
+    }
+
+    if "description" in failed:
+        return {"description": f"Could not create Metadata. {failed['description']}"}
+
+    metadata = {"description": results["description"]}
+    if type != "action":
+        return metadata
+
+    if "keywords" in failed:
+        metadata["keywords"] = f"Could not generate keywords. {failed['keywords']}"
+        return metadata
+    metadata["keywords"] = results["keywords"]
+
+    error = failed.get("retrieval") or failed.get("science")
+    if error:
+        metadata["science"] = f"Could not generate science. {error}"
+        metadata["sources"] = f"No science so no sources. {error}"
+        return metadata
+    metadata["science"] = results["science"]
+    metadata["sources"] = {
+        doc.metadata["title"]: doc.metadata["source"] for doc in results["retrieval"]
+    }
+
+    if "evaluation" in failed:
+        metadata["metrics"] = f"Could not generate metrics. {failed['evaluation']}"
+    else:
+        metadata["metrics"] = results["evaluation"]
+
+    return metadata
@@ -0,0 +1,31 @@
+import contextlib
+from pathlib import Path
+from typing import Iterator
+from unittest import mock
+
+import pytest
+
+from src.data.graph import GraphStore
+from src.utils import utils
+
+
+@contextlib.contextmanager
+def isolated_runs(root: Path) -> Iterator[None]:
+    """Keep the graph runs below `root`, starting with an empty default run."""
+    with contextlib.ExitStack() as stack:
+        stack.enter_context(mock.patch.object(utils, "runs_dir", root / "graphs"))
+        stack.enter_context(
+            mock.patch.object(
+                utils, "_stores", {utils.DEFAULT_RUN: GraphStore(root / "graph.json")}
+            )
+        )
+        stack.enter_context(mock.patch.object(utils, "_latest_run", utils.DEFAULT_RUN))
+        stack.enter_context(mock.patch.object(utils, "_metadata_jobs", {}))
+        yield
+
+
+@pytest.fixture
+def runs(tmp_path):
+    """Graph runs that are isolated from the real ones and from other tests."""
+    with isolated_runs(tmp_path):
+        yield
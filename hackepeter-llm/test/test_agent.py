@@ -0,0 +1,123 @@
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+from langchain.agents import tool
+from langchain_core.language_models import FakeMessagesListChatModel
+from langchain_core.messages import AIMessage
+
+from run import app
+from src.agent import agent as agent_module
+from src.agent.agent import Agent, RunBudget, cancel_run
+from src.data.graph import GraphStore
+from src.utils import utils
+from src.utils.tracing import recent_spans
+
+
+class ToolCallingModel(FakeMessagesListChatModel):
+    """Answers every turn with a call of the get_nodes tool."""
+
+    def bind_tools(self, tools, **kwargs):
+        return self
+
+
+def tool_call(index: int) -> AIMessage:
+    call = {
+        "id": f"call_{index}",
+        "type": "function",
+        "function": {"name": "get_nodes", "arguments": json.dumps({"path": ""})},
+    }
+    return AIMessage(content="", additional_kwargs={"tool_calls": [call]})
+
+
+@pytest.fixture
+def run(runs, monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    monkeypatch.setattr(agent_module, "_controls", {})
+    return utils.create_run()
+
+
+def make_agent(run_id: str, budget: RunBudget, on_call=lambda: None) -> Agent:
+    @tool
+    def get_nodes(path: str = ""):
+        """Returns the graph."""
+        on_call()
+        return "Nodes 0-0 of 0."
+
+    agent = Agent(tools=[get_nodes], run_id=run_id, budget=budget)
+    agent.llm = ToolCallingModel(responses=[tool_call(i) for i in range(100)])
+    return agent
+
+
+def test_run_stops_at_step_budget(run):
+    make_agent(run, RunBudget(max_steps=3)).create_graph("Transport")
+
+    progress = utils.get_store(run).progress
+    assert progress["status"] == "budget_exceeded"
+    assert progress["steps"] == 3
+    assert progress["last_step"] == "get_nodes"
+    assert progress["tokens"] > 0
+
+    # The tools run under the agent's span
+    agent = recent_spans(limit=1, name="agent")[0]
+    tools = recent_spans(limit=3, name="agent.tool")
+    assert [span["tool"] for span in tools] == ["get_nodes"] * 3
+    assert all(span["trace_id"] == agent["trace_id"] for span in tools)
+
+
+def test_run_stops_at_token_budget(run):
+    make_agent(run, RunBudget(max_tokens=1)).create_graph("Transport")
+
+    progress = utils.get_store(run).progress
+    assert progress["status"] == "budget_exceeded"
+    assert progress["steps"] == 1
+
+
+def test_cancelled_run_stops_at_next_call(run):
+    calls = []
+
+    def cancel():
+        calls.append(1)
+        assert cancel_run(run)
+
+    make_agent(run, RunBudget(), on_call=cancel).create_graph("Transport")
+
+    progress = utils.get_store(run).progress
+    assert progress["status"] == "cancelled"
+    assert len(calls) == 1
+    assert not cancel_run(run)
+
+
+def test_run_cancelled_before_it_starts_does_not_run(run):
+    calls = []
+    agent = make_agent(run, RunBudget(), on_call=lambda: calls.append(1))
+    assert utils.get_store(run).progress["status"] == "queued"
+
+    assert TestClient(app).post(f"/runs/{run}/cancel").status_code == 200
+    agent.create_graph("Transport")
+
+    progress = utils.get_store(run).progress
+    assert progress["status"] == "cancelled"
+    assert progress["steps"] == 0
+    assert not calls
+
+
+@pytest.mark.parametrize(
+    "limits", [{"max_steps": 0}, {"max_tokens": -1}, {"max_seconds": 0}]
+)
+def test_start_rejects_empty_budgets(run, limits):
+    response = TestClient(app).post("/start", json={"sector": "Transport", **limits})
+    assert response.status_code == 422
+
+
+def test_progress_is_persisted_and_served(run):
+    make_agent(run, RunBudget(max_steps=1)).create_graph("Transport")
+    store = utils.get_store(run)
+
+    assert GraphStore(store.path).progress == store.progress
+
+    client = TestClient(app)
+    progress = client.get(f"/runs/{run}").json()
+    assert progress["status"] == "budget_exceeded"
+    assert progress["steps"] == 1
+    assert client.post(f"/runs/{run}/cancel").status_code == 404
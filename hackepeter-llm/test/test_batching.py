@@ -0,0 +1,36 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from src.utils.batching import MicroBatcher
+
+
+def test_concurrent_calls_are_batched():
+    batches = []
+    release = threading.Event()
+
+    def fn(items):
+        batches.append(list(items))
+        release.wait(1)
+        return [item * 2 for item in items]
+
+    batcher = MicroBatcher(fn, max_batch=8, max_wait=0.05)
+    with ThreadPoolExecutor(max_workers=16) as pool:
+        futures = [pool.submit(batcher, i) for i in range(16)]
+        release.set()
+        results = [future.result() for future in futures]
+
+    assert results == [i * 2 for i in range(16)]
+    assert len(batches) < 16
+    assert all(len(batch) <= 8 for batch in batches)
+    assert batcher.stats()["items"] == 16
+
+
+def test_errors_reach_every_caller_of_the_batch():
+    def fn(items):
+        raise RuntimeError("search failed")
+
+    batcher = MicroBatcher(fn)
+    with pytest.raises(RuntimeError):
+        batcher(1)
@@ -0,0 +1,17 @@
+from benchmarks.__main__ import compare
+from benchmarks.suite import BENCHMARKS
+
+
+def test_compare_reports_slower_and_lower_throughput_metrics():
+    previous = {"results": {"a": {"mean_ms": 10, "pages_per_s": 100, "kilobytes": 1}}}
+    current = {"results": {"a": {"mean_ms": 15, "pages_per_s": 50, "kilobytes": 9}}}
+
+    regressions = compare(current, previous)
+    assert len(regressions) == 2
+    assert compare(previous, current) == []
+
+
+def test_splitter_benchmark_runs():
+    [(key, metrics)] = BENCHMARKS["splitter"](True)
+    assert key == "splitter"
+    assert metrics["chunks_per_s"] > 0
@@ -0,0 +1,102 @@
+import httpx
+import pytest
+from langchain_community.embeddings import FakeEmbeddings
+from langchain_core.language_models import FakeListChatModel
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.prompts import ChatPromptTemplate
+from langchain_openai import ChatOpenAI
+
+from src.data.embeddings import CachedEmbeddings
+from src.utils.cache import DiskCache, LLMCache
+
+
+class CountingEmbeddings(FakeEmbeddings):
+    calls: list = []
+
+    def embed_documents(self, texts):
+        self.calls.append(list(texts))
+        return super().embed_documents(texts)
+
+
+def test_embeddings_are_only_computed_once(tmp_path):
+    model = CountingEmbeddings(size=4, calls=[])
+    embeddings = CachedEmbeddings(model, "fake", DiskCache(tmp_path / "cache.sqlite"))
+
+    first = embeddings.embed_documents(["a", "b", "a"])
+    second = embeddings.embed_documents(["b", "c"])
+
+    assert model.calls == [["a", "b"], ["c"]]
+    assert first[0] == first[2]
+    assert second[0] == pytest.approx(first[1])
+    assert embeddings.embed_query("c") == pytest.approx(second[1])
+
+
+def test_embedding_cache_persists_and_checks_dimension(tmp_path):
+    path = tmp_path / "cache.sqlite"
+    CachedEmbeddings(FakeEmbeddings(size=4), "fake", DiskCache(path)).embed_query("a")
+
+    embeddings = CachedEmbeddings(FakeEmbeddings(size=8), "fake", DiskCache(path))
+    assert len(embeddings.embed_query("a")) == 4
+
+    with pytest.raises(ValueError):
+        embeddings.embed_query("b")
+
+
+def test_disk_cache_evicts_least_recently_used(tmp_path):
+    cache = DiskCache(tmp_path / "cache.sqlite", max_entries=2)
+    cache.set("a", b"1")
+    cache.set("b", b"2")
+    cache.get("a")
+    cache.set("c", b"3")
+
+    assert cache.get("b") is None
+    assert cache.get_many(["a", "c"]) == {"a": b"1", "c": b"3"}
+    assert len(cache) == 2
+
+
+def test_llm_responses_are_cached(tmp_path):
+    cache = LLMCache(DiskCache(tmp_path / "responses.sqlite", ttl=60))
+    llm = FakeListChatModel(responses=["first", "second"], cache=cache)
+    chain = ChatPromptTemplate.from_messages([("human", "{input}")]) | llm
+
+    assert (chain | StrOutputParser()).invoke({"input": "a"}) == "first"
+    assert (chain | StrOutputParser()).invoke({"input": "a"}) == "first"
+    assert (chain | StrOutputParser()).invoke({"input": "b"}) == "second"
+    assert (cache.cache.hits, cache.cache.misses) == (1, 2)
+
+
+def test_llm_responses_are_cached_across_processes(tmp_path):
+    requests = []
+
+    def handler(request):
+        requests.append(request)
+        return httpx.Response(
+            200,
+            json={
+                "id": "chatcmpl-1",
+                "object": "chat.completion",
+                "created": 0,
+                "model": "gpt-3.5-turbo",
+                "choices": [
+                    {
+                        "index": 0,
+                        "message": {"role": "assistant", "content": "cached"},
+                        "finish_reason": "stop",
+                    }
+                ],
+            },
+        )
+
+    def process():
+        # Every process has its own clients and cache objects
+        return ChatOpenAI(
+            model_name="gpt-3.5-turbo",
+            temperature=0,
+            openai_api_key="test",
+            http_client=httpx.Client(transport=httpx.MockTransport(handler)),
+            cache=LLMCache(DiskCache(tmp_path / "responses.sqlite")),
+        )
+
+    assert process().invoke("a").content == "cached"
+    assert process().invoke("a").content == "cached"
+    assert len(requests) == 1
@@ -0,0 +1,56 @@
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+from langchain_core.language_models import FakeListChatModel
+
+from run import app
+from src.agent import chatbot
+
+CHAT = {
+    "science": "Speed limits save 5% of emissions.",
+    "sources": ["Paper A"],
+    "history": [{"user": "How much?"}, {"model": "5%."}, {"user": "Source?"}],
+}
+
+
+@pytest.fixture
+def client(monkeypatch):
+    llm = FakeListChatModel(responses=["Paper A says so."])
+    monkeypatch.setattr(chatbot, "_llm", llm)
+    return TestClient(app)
+
+
+def test_converse_answers(client):
+    assert client.post("/converse", json=CHAT).json() == "Paper A says so."
+
+
+def test_converse_streams_tokens(client):
+    with client.stream("POST", "/converse/stream", json=CHAT) as response:
+        body = "".join(response.iter_text())
+
+    events = [
+        json.loads(line[len("data: ") :])
+        for line in body.splitlines()
+        if line.startswith("data: ")
+    ]
+    tokens = [event["token"] for event in events[:-1]]
+    assert "".join(tokens) == "Paper A says so."
+    assert events[-1] == {}
+
+
+def test_chatbot_builds_history():
+    messages = chatbot.ActionChatbot(llm=FakeListChatModel(responses=[""])).messages(
+        chatbot.ChatInput(**CHAT)
+    )
+
+    assert [message.type for message in messages] == ["human", "human", "ai", "human"]
+    assert messages[-1].content == "Source?"
+
+
+def test_history_must_end_with_the_user(client):
+    chat = dict(CHAT, history=[{"user": "How much?"}, {"model": "5%."}])
+
+    assert client.post("/converse", json=chat).status_code == 422
+    assert client.post("/converse/stream", json=chat).status_code == 422
+    assert client.post("/converse", json=dict(CHAT, history=[])).status_code == 422
@@ -0,0 +1,32 @@
+import pickle
+from datetime import date
+
+from langchain_core.documents import Document
+
+from src.data.corpus import Corpus
+
+
+def test_corpus_appends_and_streams_documents(tmp_path):
+    corpus = Corpus(tmp_path / "corpus.sqlite")
+    docs = [
+        Document(page_content=f"text {i}", metadata={"published": date(2024, 1, i)})
+        for i in range(1, 6)
+    ]
+
+    assert corpus.add(docs[:3]) == 3
+    assert corpus.add(docs) == 2
+    assert len(corpus) == 5
+
+    batches = list(corpus.batches(2))
+    assert [len(batch) for batch in batches] == [2, 2, 1]
+    assert [doc.page_content for doc in corpus] == [doc.page_content for doc in docs]
+    assert batches[0][0].metadata == {"published": "2024-01-01"}
+
+
+def test_corpus_imports_legacy_pickles(tmp_path):
+    with open(tmp_path / "2024-03-01_12-00-00.pkl", "wb") as f:
+        pickle.dump([Document(page_content="legacy", metadata={})], f)
+
+    corpus = Corpus(tmp_path / "corpus.sqlite")
+    assert corpus.import_pickles(tmp_path) == 1
+    assert [doc.page_content for doc in corpus] == ["legacy"]
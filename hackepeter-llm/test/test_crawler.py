@@ -0,0 +1,118 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import fitz
+import pytest
+from langchain_core.documents import Document
+
+from src.data import loader
+from src.data.loader import DataCrawler, SemanticScholarLoader, Source
+
+
+def make_pdf(text: str) -> bytes:
+    pdf = fitz.open()
+    pdf.new_page().insert_text((72, 72), text)
+    return pdf.tobytes()
+
+
+@pytest.fixture
+def stub_server():
+    pdf = make_pdf("Speed limits reduce emissions")
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            host = f"http://127.0.0.1:{self.server.server_port}"
+            if self.path.startswith("/search"):
+                paper = {
+                    "title": "Speed Limits",
+                    "abstract": "Lower speed, lower emissions.",
+                    "year": 2020,
+                    "isOpenAccess": True,
+                    "openAccessPdf": {"url": f"{host}/paper.pdf"},
+                    "citationCount": 1,
+                }
+                body = json.dumps({"data": [paper]}).encode()
+                content_type = "application/json"
+            elif self.path == "/paper.pdf":
+                body, content_type = pdf, "application/pdf"
+            else:
+                self.send_error(404)
+                return
+
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_port}"
+    server.shutdown()
+
+
+def stub_source(name, delay=0.0, fail=False, **kwargs):
+    def load(query):
+        time.sleep(delay)
+        if fail:
+            raise ConnectionError(f"{name} is down")
+        return [Document(page_content=f"{name}: {query}")]
+
+    return Source(name, load, **kwargs)
+
+
+def test_crawl_many_fans_out_and_keeps_order():
+    crawler = DataCrawler(
+        [stub_source("a", delay=0.2, max_concurrency=3), stub_source("b", delay=0.2)]
+    )
+
+    start = time.monotonic()
+    docs = crawler.crawl_many(["x", "y", "z"])
+
+    assert [doc.page_content for doc in docs] == [
+        "a: x",
+        "b: x",
+        "a: y",
+        "b: y",
+        "a: z",
+        "b: z",
+    ]
+    # Source b is sequential (3 x 0.2s), source a runs alongside it
+    assert time.monotonic() - start < 1.0
+
+
+def test_crawl_many_returns_partial_results():
+    crawler = DataCrawler(
+        [
+            stub_source("ok"),
+            stub_source("down", fail=True),
+            stub_source("slow", delay=3, timeout=0.3),
+        ]
+    )
+
+    docs = crawler.crawl_many(["x"])
+
+    assert [doc.page_content for doc in docs] == ["ok: x"]
+    assert sorted(error["source"] for error in crawler.errors) == ["down", "slow"]
+
+
+def test_semantic_scholar_loader_against_stub_server(
+    stub_server, tmp_path, monkeypatch
+):
+    monkeypatch.setattr(loader, "ROOT", tmp_path)
+
+    def load(query):
+        return SemanticScholarLoader(query, endpoint=f"{stub_server}/search").load()
+
+    crawler = DataCrawler([Source("semantic_scholar", load, rate=10)])
+    docs = crawler.crawl_many(["speed limit"])
+
+    assert len(docs) == 1
+    assert "Speed limits reduce emissions" in docs[0].page_content
+    assert docs[0].metadata["source"] == f"{stub_server}/paper.pdf"
+    assert docs[0].metadata["summary"] == "Lower speed, lower emissions."
@@ -0,0 +1,135 @@
+import numpy as np
+import pytest
+from langchain_community.embeddings import DeterministicFakeEmbedding
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+
+from src.data import loader
+from src.data.corpus import CORPUS_FILE, Corpus
+from src.data.index import INDEX_TYPES, build_index, index_type
+from src.data.loader import Database
+
+
+@pytest.fixture
+def database(tmp_path, monkeypatch):
+    embeddings = DeterministicFakeEmbedding(size=8)
+    monkeypatch.setattr(loader, "ROOT", tmp_path)
+    monkeypatch.setattr(loader, "get_embeddings", lambda provider=None: embeddings)
+
+    FAISS.from_texts(["legacy chunk"], embeddings).save_local(
+        tmp_path / "database" / "vector_db"
+    )
+    return Database(name="vector_db")
+
+
+def docs(*texts):
+    return [Document(page_content=text, metadata={"title": text}) for text in texts]
+
+
+def test_add_documents_skips_indexed_chunks(database):
+    assert database.add_documents(docs("a", "b", "a", "legacy chunk")) == 2
+    assert database.add_documents(docs("b", "c")) == 1
+    assert database.vector.index.ntotal == 4
+
+
+def test_added_chunks_are_persisted_as_segments(database):
+    database.add_documents(docs("a"))
+    database.add_documents(docs("b"))
+    fingerprint = database.fingerprint()
+
+    reloaded = Database(name="vector_db")
+    assert reloaded.vector.index.ntotal == 3
+    assert [
+        doc.page_content for doc in reloaded.vector.similarity_search("b", k=1)
+    ] == ["b"]
+
+    reloaded.compact()
+    assert not (reloaded.path / "segments").exists()
+    assert reloaded.fingerprint() != fingerprint
+    assert Database(name="vector_db").vector.index.ntotal == 3
+
+
+@pytest.mark.parametrize("index_type", ["ivf", "hnsw"])
+def test_reindexed_database_loads_memory_mapped(database, index_type):
+    database.add_documents(docs(*[f"chunk {i}" for i in range(60)]))
+    database.reindex(index_type)
+
+    reloaded = Database(name="vector_db", mmap=True, nprobe=4, ef_search=32)
+    # faiss only memory-maps IVF indexes, the others are read into RAM
+    assert reloaded.mmap == (index_type == "ivf")
+    assert reloaded.vector.index.ntotal == 61
+    assert [
+        doc.page_content for doc in reloaded.vector.similarity_search("chunk 7", k=1)
+    ] == ["chunk 7"]
+
+
+@pytest.mark.parametrize("kind", INDEX_TYPES)
+def test_index_type_of_built_indexes(kind):
+    vectors = np.random.default_rng(0).random((300, 8), dtype=np.float32)
+    assert index_type(build_index(kind, vectors, m=4)) == kind
+
+
+def test_memory_mapped_database_is_read_only(database):
+    database.add_documents(docs(*[f"chunk {i}" for i in range(60)]))
+    database.reindex("ivf")
+    files = sorted(database.path.rglob("*"))
+
+    reloaded = Database(name="vector_db", mmap=True)
+    assert reloaded.mmap
+    with pytest.raises(ValueError):
+        reloaded.add_documents(docs("new chunk"))
+    with pytest.raises(ValueError):
+        reloaded.compact()
+    with pytest.raises(ValueError):
+        reloaded.reindex("flat")
+
+    assert sorted(database.path.rglob("*")) == files
+    assert reloaded.vector.index.ntotal == 61
+
+
+def test_flat_indexes_are_not_memory_mapped(database):
+    reloaded = Database(name="vector_db", mmap=True)
+    assert not reloaded.mmap
+    assert index_type(reloaded.vector.index) == "flat"
+
+
+def test_segments_disable_memory_mapping(database):
+    database.add_documents(docs("a"))
+
+    reloaded = Database(name="vector_db", mmap=True)
+    assert not reloaded.mmap
+    assert reloaded.vector.index.ntotal == 2
+
+
+def test_lexical_index_follows_added_documents(database):
+    database.add_documents(docs("heat pumps"))
+    assert [id for id, _ in database.lexical.search("heat", k=1)] == [
+        database.chunk_id(docs("heat pumps")[0])
+    ]
+
+    database.add_documents(docs("electric cars"))
+    assert len(database.lexical) == 3
+    assert database.lexical.search("electric cars", k=1)
+
+
+def test_database_is_rebuilt_from_the_corpus(database):
+    database.corpus.add(docs("heat pumps", "electric cars", "heat pumps"))
+
+    rebuilt = Database(name="rebuilt", from_corpus=True, batch_size=1)
+    assert rebuilt.vector.index.ntotal == 2
+    assert Database(name="rebuilt").vector.index.ntotal == 2
+
+
+def test_index_records_its_embedding_provider(tmp_path, monkeypatch):
+    monkeypatch.setattr(loader, "ROOT", tmp_path)
+    Corpus(tmp_path / CORPUS_FILE).add(docs("heat pumps", "electric cars"))
+    Database(name="local", from_corpus=True, provider="hashing:32")
+
+    database = Database(name="local")
+    assert database.provider == "hashing:32"
+    assert [
+        doc.page_content for doc in database.vector.similarity_search("cars", k=1)
+    ] == ["electric cars"]
+
+    with pytest.raises(ValueError):
+        Database(name="local", provider="openai:text-embedding-3-small")
@@ -0,0 +1,70 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from src.data.download import DownloadTooLarge, PdfDownloader
+
+CONTENT = bytes(range(256)) * 1000
+
+
+@pytest.fixture
+def server():
+    requests_seen = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            requests_seen.append((self.path, self.headers.get("Range")))
+            start = 0
+            if self.headers.get("Range"):
+                start = int(self.headers["Range"].split("=")[1].rstrip("-"))
+                self.send_response(206)
+            else:
+                self.send_response(200)
+
+            body = CONTENT[start:]
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_port}", requests_seen
+    server.shutdown()
+
+
+def test_download_streams_and_skips_existing_files(server, tmp_path):
+    url, requests_seen = server
+    downloader = PdfDownloader(chunk_size=1024)
+
+    paths = downloader.download_many(
+        [(f"{url}/a.pdf", tmp_path / "a.pdf"), (f"{url}/b.pdf", tmp_path / "b.pdf")]
+    )
+    downloader.download(f"{url}/a.pdf", tmp_path / "a.pdf")
+
+    assert paths == [tmp_path / "a.pdf", tmp_path / "b.pdf"]
+    assert (tmp_path / "a.pdf").read_bytes() == CONTENT
+    assert len(requests_seen) == 2
+
+
+def test_download_resumes_partial_file(server, tmp_path):
+    url, requests_seen = server
+    (tmp_path / "a.pdf.part").write_bytes(CONTENT[:1000])
+
+    PdfDownloader().download(f"{url}/a.pdf", tmp_path / "a.pdf")
+
+    assert requests_seen == [("/a.pdf", "bytes=1000-")]
+    assert (tmp_path / "a.pdf").read_bytes() == CONTENT
+    assert not (tmp_path / "a.pdf.part").exists()
+
+
+def test_download_rejects_large_files(server, tmp_path):
+    url, _ = server
+
+    with pytest.raises(DownloadTooLarge):
+        PdfDownloader(max_bytes=1000).download(f"{url}/a.pdf", tmp_path / "a.pdf")
+
+    assert list(tmp_path.iterdir()) == []
@@ -0,0 +1,29 @@
+import numpy as np
+import pytest
+
+from src.data.embeddings import HashingEmbeddings, get_embeddings
+
+
+def test_hashing_embeddings_are_normalized_and_deterministic():
+    embeddings = get_embeddings("hashing:64")
+    assert isinstance(embeddings, HashingEmbeddings)
+
+    vectors = np.asarray(embeddings.embed_documents(["heat pumps", "", "heat pumps"]))
+    assert vectors.shape == (3, 64)
+    assert np.allclose(np.linalg.norm(vectors[0]), 1)
+    assert not vectors[1].any()
+    assert np.array_equal(vectors[0], vectors[2])
+    assert vectors[0].tolist() == embeddings.embed_query("heat pumps")
+
+
+def test_hashing_embeddings_rank_shared_words_higher():
+    encoder = HashingEmbeddings()
+    query, near, far = encoder.encode(
+        ["electric cars", "electric cars cut emissions", "plant based diet"]
+    )
+    assert query @ near > query @ far
+
+
+def test_unknown_provider_is_rejected():
+    with pytest.raises(ValueError):
+        get_embeddings("word2vec:300")
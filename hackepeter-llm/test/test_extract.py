@@ -0,0 +1,19 @@
+import fitz
+import pytest
+
+from src.data.extract import extract_many
+
+
+@pytest.mark.parametrize("backend", ["pymupdf", "pdfminer"])
+def test_extract_many_skips_broken_files(backend, tmp_path):
+    pdf = fitz.open()
+    pdf.new_page().insert_text((72, 72), "Speed limits reduce emissions")
+    pdf.new_page()
+    pdf.save(tmp_path / "paper.pdf")
+    (tmp_path / "broken.pdf").write_bytes(b"not a pdf")
+
+    docs = extract_many([tmp_path / "paper.pdf", tmp_path / "broken.pdf"], backend)
+
+    assert "Speed limits reduce emissions" in docs[0].page_content
+    assert docs[0].metadata["pages"] == 2
+    assert docs[1] is None
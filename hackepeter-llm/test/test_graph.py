@@ -0,0 +1,377 @@
+import asyncio
+import json
+import threading
+
+import pytest
+from fastapi.testclient import TestClient
+from starlette.requests import Request
+
+from run import app
+from src.api import endpoints
+from src.data.graph import GraphStore
+from src.utils import utils
+
+
+@pytest.fixture
+def graph(runs, monkeypatch):
+    release = threading.Event()
+    calls = []
+
+    def fake_generate_metadata(path_parts, type, previous_description=""):
+        release.wait(timeout=5)
+        calls.append((path_parts[-1], previous_description))
+        return {"description": f"about {path_parts[-1]}"}
+
+    monkeypatch.setattr(utils, "generate_metadata", fake_generate_metadata)
+    utils.initialize_graph()
+
+    yield release, calls
+    release.set()
+    utils.wait_for_metadata(timeout=5)
+
+
+def test_nodes_are_added_before_metadata_is_generated(graph):
+    release, calls = graph
+
+    utils.update_graph("Transport")
+    utils.update_graph("Transport/Cars")
+    utils.update_graph("Transport/Cars/Speed Limit")
+
+    nodes = utils.read_graph()
+    assert [node["status"] for node in nodes] == ["pending"] * 3
+    assert [node["parent_id"] for node in nodes] == [None, 1, 2]
+
+    release.set()
+    utils.wait_for_metadata(timeout=5)
+
+    nodes = utils.read_graph()
+    assert [node["status"] for node in nodes] == ["done"] * 3
+    assert nodes[2]["metadata"] == {"description": "about Speed Limit"}
+    assert ("Speed Limit", "about Cars") in calls
+
+
+def test_unknown_parent_is_rejected(graph):
+    utils.update_graph("Transport")
+
+    message = utils.update_graph("Transport/Planes/Kerosene Tax")
+
+    assert message.startswith("Parent node does not exist")
+    assert len(utils.read_graph()) == 1
+
+
+def test_action_names_are_scoped_to_their_area(graph):
+    utils.update_graph("Transport")
+    utils.update_graph("Transport/Cars")
+    utils.update_graph("Transport/Ships")
+    utils.update_graph("Transport/Cars/Electrification")
+
+    message = utils.update_graph("Transport/Ships/Electrification")
+
+    assert message == "Node 'Electrification' added to the graph."
+    ships = utils.get_store().find_path("Transport/Ships")
+    assert (
+        utils.get_store().find_path("Transport/Ships/Electrification")["parent_id"]
+        == ships["id"]
+    )
+    assert utils.update_graph("Transport/Ships/Electrification").startswith(
+        "Node already exists"
+    )
+
+
+def test_store_replays_log_and_snapshot(tmp_path):
+    store = GraphStore(tmp_path / "graph.json")
+    root = store.add("Transport", None, "root")
+    store.snapshot()
+    area = store.add("Cars", root["id"], "area", status="pending")
+    store.update(area["id"], status="done")
+
+    reloaded = GraphStore(tmp_path / "graph.json")
+
+    assert reloaded.nodes() == store.nodes()
+    assert reloaded.find(root["id"], "Cars")["status"] == "done"
+    assert [child["name"] for child in reloaded.children(root["id"])] == ["Cars"]
+    assert reloaded.add("Planes", root["id"], "area")["id"] == 3
+
+
+def test_store_reports_changes_since_version(tmp_path):
+    store = GraphStore(tmp_path / "graph.json")
+    events = []
+    store.subscribe(events.append)
+
+    root = store.add("Transport", None, "root")
+    version = store.version
+    area = store.add("Cars", root["id"], "area")
+    store.update(root["id"], status="done")
+
+    assert store.changes_since(version) == (
+        store.version,
+        [store.get(root["id"]), area],
+        False,
+    )
+    assert [event["event"] for event in events] == ["insert", "insert", "update"]
+
+    store.reset()
+    assert store.changes_since(version) == (store.version, [], True)
+
+
+def test_graph_endpoint_returns_deltas_and_not_modified(runs):
+    store = utils.get_store()
+    client = TestClient(app)
+
+    root = store.add("Transport", None, "root")
+    response = client.get("/graph")
+    version = response.json()["version"]
+
+    assert response.json()["node"] == [root]
+    assert (
+        client.get(
+            "/graph", headers={"If-None-Match": response.headers["ETag"]}
+        ).status_code
+        == 304
+    )
+
+    area = store.add("Cars", root["id"], "area")
+    delta = client.get(
+        "/graph", params={"since": version, "since_run": utils.DEFAULT_RUN}
+    ).json()
+
+    assert delta == {
+        "node": [area],
+        "version": store.version,
+        "full": False,
+        "run_id": utils.DEFAULT_RUN,
+    }
+
+
+def read_events(response, count):
+    """Parse the next `count` Server-Sent Events of a streaming response."""
+
+    async def read():
+        events = []
+        while len(events) < count:
+            message = await asyncio.wait_for(response.body_iterator.__anext__(), 5)
+            if message.startswith(":"):
+                continue
+            fields = dict(line.split(": ", 1) for line in message.strip().split("\n"))
+            events.append(
+                (fields["event"], int(fields["id"]), json.loads(fields["data"]))
+            )
+        return events
+
+    return read()
+
+
+def test_graph_stream_sends_snapshot_changes_and_resumes(graph):
+    release, _ = graph
+    utils.update_graph("Transport")
+
+    async def stream(headers=()):
+        request = Request({"type": "http", "headers": list(headers)})
+        return await endpoints.stream_graph(request)
+
+    async def follow():
+        response = await stream()
+        [snapshot] = await read_events(response, 1)
+
+        utils.update_graph("Transport/Cars")
+        release.set()
+        changes = await read_events(response, 3)
+        await response.body_iterator.aclose()
+        return snapshot, changes
+
+    snapshot, changes = asyncio.run(follow())
+
+    event, version, data = snapshot
+    assert event == "snapshot" and data["full"]
+    assert [node["name"] for node in data["node"]] == ["Transport"]
+
+    events = {(event, data["node"]["name"]) for event, _, data in changes}
+    assert events == {("insert", "Cars"), ("update", "Transport"), ("update", "Cars")}
+    assert [version for _, version, _ in changes] == sorted(
+        version for _, version, _ in changes
+    )
+
+    # Reconnecting with the id of the first change only replays what followed
+    async def resume():
+        headers = [(b"last-event-id", str(changes[0][1]).encode())]
+        response = await stream(headers)
+        [resumed] = await read_events(response, 1)
+        await response.body_iterator.aclose()
+        return resumed
+
+    event, version, data = asyncio.run(resume())
+    assert event == "snapshot" and not data["full"]
+    assert version == utils.get_store().version
+    assert {node["name"] for node in data["node"]} == {
+        data["node"]["name"] for _, _, data in changes[1:]
+    }
+
+
+def test_cursors_of_a_previous_run_resync(graph):
+    client = TestClient(app)
+    utils.update_graph("Transport")
+    utils.update_graph("Transport/Cars")
+    old = client.get("/graph")
+    old_run, version = old.json()["run_id"], old.json()["version"]
+
+    utils.create_run()
+    for name in ["Energy", "Food", "Industry"]:
+        utils.update_graph(name)
+
+    # The new run has passed the old version, but the cursor is not its own
+    response = client.get(
+        "/graph",
+        params={"since": version, "since_run": old_run},
+        headers={"If-None-Match": old.headers["ETag"]},
+    )
+    assert response.status_code == 200
+    assert response.json()["full"]
+    assert [node["name"] for node in response.json()["node"]] == [
+        "Energy",
+        "Food",
+        "Industry",
+    ]
+    assert response.json()["run_id"] != old_run
+
+
+def test_finished_runs_are_evicted_and_reloaded(graph, monkeypatch):
+    release, _ = graph
+    release.set()
+    monkeypatch.setattr(utils, "MAX_LOADED_RUNS", 2)
+
+    first = utils.create_run()
+    utils.update_graph("Transport", first)
+    utils.wait_for_metadata(first)
+    running = utils.create_run()
+    utils.get_store(running).set_progress(status="running")
+    for _ in range(3):
+        utils.create_run()
+
+    assert first not in utils._stores
+    assert running in utils._stores
+    assert utils.read_graph(first)[0]["name"] == "Transport"
+
+
+def test_runs_of_a_stopped_server_are_interrupted(graph, monkeypatch):
+    run = utils.create_run()
+    utils.get_store(run).set_progress(status="running", steps=2)
+
+    # A new process only knows the runs on disk
+    monkeypatch.setattr(utils, "_stores", {})
+    progress = utils.get_store(run).progress
+
+    assert progress["status"] == "interrupted"
+    assert progress["steps"] == 2
+    assert GraphStore(utils.get_store(run).path).progress["status"] == "interrupted"
+
+
+def test_runs_have_separate_graphs(graph):
+    release, _ = graph
+    first, second = utils.create_run(), utils.create_run()
+
+    utils.update_graph("Transport", first)
+    utils.update_graph("Buildings", second)
+    utils.update_graph("Buildings/Insulation", second)
+
+    assert [node["name"] for node in utils.read_graph(first)] == ["Transport"]
+    assert [node["id"] for node in utils.read_graph(second)] == [1, 2]
+    assert utils.read_graph() == utils.read_graph(second)
+
+    release.set()
+    utils.wait_for_metadata(first, timeout=5)
+    assert utils.read_graph(first)[0]["status"] == "done"
+
+    with pytest.raises(KeyError):
+        utils.get_store("unknown")
+
+
+def test_tree_view_lists_paths_with_children_counts(graph):
+    for path in [
+        "Transport",
+        "Transport/Cars",
+        "Transport/Cars/Speed Limit",
+        "Transport/Rail",
+        "Buildings",
+    ]:
+        utils.update_graph(path)
+
+    assert utils.read_tree().splitlines()[1:] == [
+        "1 Transport (2)",
+        "2 Transport/Cars (1)",
+        "3 Transport/Cars/Speed Limit (0)",
+        "4 Transport/Rail (0)",
+        "5 Buildings (0)",
+    ]
+    assert "description" not in utils.read_tree()
+
+    page = utils.read_tree(path="Transport", offset=1, limit=1)
+    assert page.splitlines() == [
+        "Nodes 2-2 of 3 below 'Transport' as: id path (number of children). "
+        "Use offset=2 for more.",
+        "3 Transport/Cars/Speed Limit (0)",
+    ]
+    assert utils.read_tree(depth=1).splitlines()[1:] == [
+        "1 Transport (2)",
+        "5 Buildings (0)",
+    ]
+    assert utils.read_tree(path="Nowhere") == "Node 'Nowhere' does not exist."
+
+    # Negative offsets start at the first node
+    assert utils.read_tree(offset=-4) == utils.read_tree()
+    assert utils.read_tree(path="Transport", offset=3) == (
+        "No nodes at offset 3, there are 3 nodes below 'Transport'. "
+        "Use an offset from 0 to 2."
+    )
+
+
+def test_empty_node_names_are_rejected(graph):
+    utils.update_graph("Transport")
+    utils.update_graph("Transport/Rail")
+
+    for path in ["Transport/Rail/", "/Transport", "Transport//Rail", "Transport/ "]:
+        assert utils.update_graph(path).startswith("Node names must not be empty.")
+    assert "Added 0 of 1 nodes" in utils.update_graph_many(["Transport/Rail/"])
+    assert len(utils.get_store()) == 2
+
+    # Both tools strip the same whitespace around the names
+    assert utils.update_graph(" Transport / Cars ") == "Node 'Cars' added to the graph."
+    assert utils.update_graph_many([" Transport/Cars", "Transport /Ships "]) == (
+        "Added 1 of 2 nodes to the graph.\n"
+        "Not added:\n"
+        "- Transport/Cars: Node already exists in the graph."
+    )
+
+
+def test_many_nodes_are_added_parents_first(graph):
+    release, calls = graph
+    utils.update_graph("Transport")
+
+    message = utils.update_graph_many(
+        [
+            "Transport/Cars/Speed Limit",
+            "Transport/Cars",
+            "Transport/Rail/",
+            "Transport/Cars",
+            "Transport/Ships/Sails",
+            "Transport",
+        ]
+    )
+
+    assert message.splitlines() == [
+        "Added 2 of 5 nodes to the graph.",
+        "Not added:",
+        "- Transport: Node already exists in the graph.",
+        "- Transport/Rail/: Node names must not be empty. Remove leading, trailing "
+        "and double slashes.",
+        "- Transport/Ships/Sails: Parent node does not exist. You must specify the "
+        "area first before adding an action.",
+    ]
+    assert utils.read_tree().splitlines()[1:] == [
+        "1 Transport (1)",
+        "2 Transport/Cars (1)",
+        "3 Transport/Cars/Speed Limit (0)",
+    ]
+
+    release.set()
+    utils.wait_for_metadata(timeout=5)
+    assert dict(calls)["Speed Limit"] == "about Cars"
@@ -0,0 +1,85 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from langchain_community.embeddings import DeterministicFakeEmbedding, FakeEmbeddings
+from langchain_community.vectorstores import FAISS
+
+from src.data import embeddings, loader, wrapper
+
+
+@pytest.fixture
+def vector_db(tmp_path, monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    monkeypatch.setattr(loader, "ROOT", tmp_path)
+    monkeypatch.setattr(embeddings, "CACHE_PATH", tmp_path / "embeddings.sqlite")
+    monkeypatch.setattr(embeddings, "_cache", None)
+    monkeypatch.setattr(wrapper, "_knowledge_base", None)
+
+    path = tmp_path / "database" / wrapper.DATABASE_NAME
+    FAISS.from_texts(["co2", "emissions"], FakeEmbeddings(size=8)).save_local(path)
+    return path
+
+
+def test_knowledge_base_is_loaded_once(vector_db):
+    kb = wrapper.get_knowledge_base()
+
+    assert wrapper.get_knowledge_base() is kb
+    assert kb.stats["vectors"] == 2
+    assert wrapper.reload_knowledge_base() is kb
+
+
+def test_knowledge_base_reloads_when_index_changes(vector_db):
+    kb = wrapper.get_knowledge_base()
+
+    index_file = vector_db / "index.faiss"
+    mtime = index_file.stat().st_mtime + 10
+    os.utime(index_file, (mtime, mtime))
+
+    assert wrapper.knowledge_base_stats()["stale"]
+    assert wrapper.reload_knowledge_base() is not kb
+
+
+def test_knowledge_base_options_are_passed_to_the_database(vector_db, monkeypatch):
+    monkeypatch.setenv("KNOWLEDGE_BASE_NPROBE", "4")
+    monkeypatch.setenv("KNOWLEDGE_BASE_MMAP", "true")
+    kb = wrapper.get_knowledge_base()
+
+    assert kb.options["nprobe"] == 4
+    # A flat index is read into RAM, see Database
+    assert kb.options["mmap"] and not kb.database.mmap
+    assert wrapper.reload_knowledge_base(force=True).options == kb.options
+
+    monkeypatch.setattr(wrapper, "_knowledge_base", None)
+    kb = wrapper.get_knowledge_base(ef_search=16)
+    assert kb.options["ef_search"] == 16 and not kb.options["mmap"]
+
+
+def test_batched_queries_match_similarity_search(vector_db, monkeypatch):
+    embeddings = DeterministicFakeEmbedding(size=8)
+    monkeypatch.setattr(loader, "get_embeddings", lambda provider=None: embeddings)
+    kb = wrapper.get_knowledge_base()
+    queries = ["co2", "emissions", "co2 emissions"]
+
+    with ThreadPoolExecutor(max_workers=3) as pool:
+        batched = list(
+            pool.map(lambda query: kb.query("", query, k=1, mode="vector"), queries)
+        )
+
+    expected = [kb.database.vector.similarity_search(query, k=1) for query in queries]
+    assert batched == expected
+    assert kb.query_many(queries, k=2)[0][:1] == expected[0]
+
+
+def test_keyword_and_hybrid_queries(vector_db, monkeypatch):
+    embeddings = DeterministicFakeEmbedding(size=8)
+    monkeypatch.setattr(loader, "get_embeddings", lambda provider=None: embeddings)
+    kb = wrapper.get_knowledge_base()
+
+    docs = kb.query("co2", "", k=1, mode="keyword")
+    assert [doc.page_content for doc in docs] == ["co2"]
+    assert kb.query("nothing matches", "", k=1, mode="keyword") == []
+    assert len(kb.query("co2", "emissions", k=2, mode="hybrid")) == 2
+
+    with pytest.raises(ValueError):
+        kb.query("co2", "", k=1, mode="fuzzy")
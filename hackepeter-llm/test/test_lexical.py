@@ -0,0 +1,25 @@
+from src.data.lexical import BM25Index, reciprocal_rank_fusion, tokenize
+
+
+def test_tokenize_drops_stopwords():
+    assert tokenize("The CO2 emissions of a car") == ["co2", "emissions", "car"]
+
+
+def test_bm25_ranks_matching_chunks_first():
+    index = BM25Index()
+    index.add(
+        [
+            ("heat", "heat pumps reduce heating emissions"),
+            ("cars", "electric cars reduce transport emissions"),
+            ("food", "a plant based diet"),
+        ]
+    )
+
+    results = index.search("electric cars", k=5)
+    assert [id for id, _ in results] == ["cars"]
+    assert [id for id, _ in index.search("emissions heating", k=5)][0] == "heat"
+
+
+def test_reciprocal_rank_fusion_prefers_ids_ranked_by_both():
+    fused = reciprocal_rank_fusion([["a", "b", "c"], ["c", "b", "d"]], k=2)
+    assert fused == ["c", "b"]
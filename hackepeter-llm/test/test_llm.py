@@ -0,0 +1,174 @@
+import asyncio
+import threading
+import time
+
+import httpx
+import pytest
+
+from src.utils import llm, tracing
+from src.utils.llm import (
+    PRIORITY_HEADER,
+    ScheduledTransport,
+    get_chat_model,
+    run_sync,
+)
+from src.utils.scheduler import Priority, Scheduler
+from src.utils.tracing import span
+
+
+@pytest.fixture(autouse=True)
+def registry(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    monkeypatch.setattr(llm, "_models", {})
+    monkeypatch.setattr(tracing, "_encodings", {"unknown": None, "gpt-3.5-turbo": None})
+    monkeypatch.setattr(llm, "retry_delay", lambda attempt, retry_after=None: 0.01)
+
+
+def transport(scheduler, handler):
+    return ScheduledTransport(
+        scheduler, httpx.Limits(), transport=httpx.MockTransport(handler)
+    )
+
+
+def ok(request):
+    return httpx.Response(200, content=iter([b"ok"]))
+
+
+def test_chat_models_are_shared_per_parameters():
+    a = get_chat_model("gpt-3.5-turbo", temperature=0)
+    b = get_chat_model("gpt-3.5-turbo", temperature=0)
+    c = get_chat_model("gpt-3.5-turbo", temperature=0.5)
+
+    assert a is b
+    assert a is not c
+    assert a.http_client is c.http_client
+    assert a.http_async_client is c.http_async_client
+    assert llm.llm_stats()["chat_models"] == 2
+    assert a.max_retries == 0
+
+    # All priorities share one connection pool
+    chat = get_chat_model("gpt-3.5-turbo", priority=Priority.INTERACTIVE)
+    assert chat is not a
+    assert chat.http_client is a.http_client
+    assert chat.default_headers == {PRIORITY_HEADER: "interactive"}
+
+
+def test_requests_are_scheduled_by_their_priority_header():
+    scheduler = Scheduler(concurrency=1)
+    scheduler.acquire("gpt-3.5-turbo", 10)
+    client = httpx.Client(transport=transport(scheduler, ok))
+    order, headers = [], []
+
+    def request(priority):
+        response = client.get("http://llm/", headers={PRIORITY_HEADER: priority})
+        headers.append(response.request.headers.get(PRIORITY_HEADER))
+        order.append(priority)
+        response.close()
+
+    threads = []
+    for priority in ["background", "interactive"]:
+        threads.append(threading.Thread(target=request, args=(priority,)))
+        threads[-1].start()
+        deadline = time.monotonic() + 2
+        while sum(scheduler.stats()["waiting"].values()) < len(threads):
+            assert time.monotonic() < deadline
+            time.sleep(0.005)
+
+    scheduler.release()
+    for thread in threads:
+        thread.join()
+
+    assert order == ["interactive", "background"]
+    # The header is only read by the scheduler, it is not sent upstream
+    assert headers == [None, None]
+
+
+def test_transport_limits_requests_in_flight():
+    scheduler = Scheduler(concurrency=2)
+    active, peak = [0], [0]
+    lock = threading.Lock()
+
+    def handler(request):
+        with lock:
+            active[0] += 1
+            peak[0] = max(peak[0], active[0])
+        time.sleep(0.05)
+        with lock:
+            active[0] -= 1
+        return httpx.Response(200, stream=httpx.ByteStream(b"ok"))
+
+    client = httpx.Client(transport=transport(scheduler, handler))
+
+    threads = [
+        threading.Thread(target=client.get, args=("http://llm/",)) for _ in range(6)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert peak[0] == 2
+    assert scheduler.stats()["active"] == 0
+
+
+def test_streamed_responses_hold_their_slot_until_closed():
+    scheduler = Scheduler(concurrency=1)
+    client = httpx.Client(transport=transport(scheduler, ok))
+
+    with client.stream("GET", "http://llm/") as response:
+        assert scheduler.stats()["active"] == 1
+        assert not scheduler.try_acquire("gpt-3.5-turbo", 10)
+        response.read()
+
+    assert scheduler.stats()["active"] == 0
+
+
+def test_rate_limited_and_failed_requests_are_retried():
+    scheduler = Scheduler()
+    statuses = iter([429, 503, 200])
+    retries = dict(tracing.LLM_RETRIES._values)
+
+    def handler(request):
+        return httpx.Response(next(statuses), stream=httpx.ByteStream(b"{}"))
+
+    response = httpx.Client(transport=transport(scheduler, handler)).post(
+        "http://llm/", json={"model": "gpt-3.5-turbo", "messages": []}
+    )
+
+    assert response.status_code == 200
+    assert scheduler.stats()["active"] == 0
+    for reason in ["429", "503"]:
+        key = (("model", "gpt-3.5-turbo"), ("reason", reason))
+        assert tracing.LLM_RETRIES._values[key] == retries.get(key, 0) + 1
+
+
+def test_retries_give_up_after_max_retries():
+    calls = []
+
+    def handler(request):
+        calls.append(1)
+        return httpx.Response(500, stream=httpx.ByteStream(b"{}"))
+
+    client = httpx.Client(transport=transport(Scheduler(), handler))
+
+    assert client.get("http://llm/").status_code == 500
+    assert len(calls) == llm.MAX_RETRIES + 1
+
+
+def test_run_sync_keeps_the_loop_and_the_callers_span():
+    async def current():
+        await asyncio.sleep(0)
+        return asyncio.get_running_loop(), tracing._current.get()
+
+    with span("caller") as attributes:
+        attributes["marker"] = True
+        loop, parent = run_sync(current())
+
+    assert run_sync(current())[0] is loop
+    assert parent["attributes"]["marker"] is True
+
+    async def fail():
+        raise KeyError("boom")
+
+    with pytest.raises(KeyError):
+        run_sync(fail())
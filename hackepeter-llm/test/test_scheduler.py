@@ -0,0 +1,106 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from src.utils.scheduler import (
+    RETRY_MAX,
+    Priority,
+    Scheduler,
+    parse_limits,
+    retry_delay,
+)
+
+
+def wait_for(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.005)
+
+
+def test_interactive_requests_overtake_background_requests():
+    scheduler = Scheduler(concurrency=1)
+    scheduler.acquire("gpt-3.5-turbo", 10)
+    order = []
+
+    def request(name, priority):
+        scheduler.acquire("gpt-3.5-turbo", 10, priority)
+        order.append(name)
+        scheduler.release()
+
+    background = threading.Thread(
+        target=request, args=("background", Priority.BACKGROUND)
+    )
+    background.start()
+    wait_for(lambda: scheduler.stats()["waiting"] == {"background": 1})
+
+    interactive = threading.Thread(
+        target=request, args=("interactive", Priority.INTERACTIVE)
+    )
+    interactive.start()
+    wait_for(lambda: len(scheduler.stats()["waiting"]) == 2)
+
+    scheduler.release()
+    background.join()
+    interactive.join()
+
+    assert order == ["interactive", "background"]
+    assert scheduler.stats()["active"] == 0
+
+
+def test_requests_wait_for_the_token_bucket_of_their_model():
+    # 100 tokens per second, at most 1000 at once
+    scheduler = Scheduler(limits={"slow": (6000, 6000)})
+    scheduler.acquire("slow", 1000)
+    scheduler.release()
+
+    start = time.perf_counter()
+    scheduler.acquire("slow", 20)
+    scheduler.release()
+    assert time.perf_counter() - start >= 0.15
+
+    # Other models have their own buckets
+    start = time.perf_counter()
+    assert scheduler.try_acquire("fast", 1000)
+    assert time.perf_counter() - start < 0.1
+
+
+def test_paused_models_hold_back_requests():
+    scheduler = Scheduler()
+    scheduler.pause("gpt-3.5-turbo", 0.2)
+
+    assert not scheduler.try_acquire("gpt-3.5-turbo", 10)
+    assert scheduler.stats()["models"]["gpt-3.5-turbo"]["paused"]
+
+    start = time.perf_counter()
+    scheduler.acquire("gpt-3.5-turbo", 10)
+    assert time.perf_counter() - start >= 0.15
+
+
+def test_async_acquire_waits_for_a_free_slot():
+    scheduler = Scheduler(concurrency=1)
+    scheduler.acquire("gpt-3.5-turbo", 10)
+    threading.Timer(0.05, scheduler.release).start()
+
+    async def acquire():
+        await scheduler.aacquire("gpt-3.5-turbo", 10, Priority.INTERACTIVE)
+        return scheduler.stats()["active"]
+
+    assert asyncio.run(acquire()) == 1
+
+
+def test_limits_and_retry_delays():
+    assert parse_limits("gpt-4=500:300000, gpt-3.5-turbo=3500:160000") == {
+        "gpt-4": (500, 300000),
+        "gpt-3.5-turbo": (3500, 160000),
+    }
+    assert parse_limits("") == {}
+
+    assert retry_delay(0, "2") == 2.0
+    assert retry_delay(0, "3600") == RETRY_MAX
+    assert all(0 <= retry_delay(3) <= 4 for _ in range(100))
+
+    with pytest.raises(ValueError):
+        Scheduler(concurrency=0)
@@ -0,0 +1,81 @@
+import asyncio
+import json
+import time
+
+import pytest
+from langchain_core.documents import Document
+from langchain_core.language_models import SimpleChatModel
+
+from src.utils import utils
+from src.utils.stages import Stage, StageSkipped, run_stages
+
+
+def test_independent_stages_overlap_and_failures_skip_dependents():
+    async def slow(value):
+        await asyncio.sleep(0.1)
+        return value
+
+    async def fail():
+        raise RuntimeError("boom")
+
+    async def add(a, b):
+        return a + b
+
+    stages = [
+        Stage("sum", add, after=("a", "b")),
+        Stage("a", lambda: slow(1)),
+        Stage("b", lambda: slow(2)),
+        Stage("broken", fail),
+        Stage("after_broken", lambda broken: slow(broken), after=("broken",)),
+    ]
+
+    start = time.perf_counter()
+    results = asyncio.run(run_stages(stages))
+
+    assert time.perf_counter() - start < 0.19
+    assert results["sum"] == 3
+    assert isinstance(results["broken"], RuntimeError)
+    assert isinstance(results["after_broken"], StageSkipped)
+
+
+def test_unknown_dependencies_are_rejected():
+    with pytest.raises(ValueError):
+        asyncio.run(run_stages([Stage("a", lambda missing: None, after=("missing",))]))
+
+
+class SlowChatModel(SimpleChatModel):
+    latency: float = 0.2
+
+    @property
+    def _llm_type(self) -> str:
+        return "slow"
+
+    def _call(self, messages, stop=None, run_manager=None, **kwargs):
+        time.sleep(self.latency)
+        prompt = messages[-1].content
+        if "JSON" in prompt:
+            return json.dumps(
+                {"effectiveness": 3, "scientific_concensus": 4, "realization_speed": 2}
+            )
+        return "search query" if "search query" in prompt else "text"
+
+
+class StubKnowledgeBase:
+    def query(self, keywords, query, k):
+        return [Document(page_content="doc", metadata={"title": "T", "source": "S"})]
+
+
+def test_metadata_latency_follows_the_critical_path(monkeypatch):
+    monkeypatch.setattr(
+        utils, "get_chat_model", lambda *args, **kwargs: SlowChatModel()
+    )
+    monkeypatch.setattr(utils, "get_knowledge_base", StubKnowledgeBase)
+
+    start = time.perf_counter()
+    metadata = utils.generate_metadata(["Transport", "Cars", "Speed Limit"], "action")
+
+    # description and keywords overlap: 3 LLM round trips instead of 4
+    assert time.perf_counter() - start < 0.75
+    assert metadata["keywords"] == "search query"
+    assert metadata["sources"] == {"T": "S"}
+    assert metadata["metrics"]["effectiveness"] == 3
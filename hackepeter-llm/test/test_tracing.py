@@ -0,0 +1,72 @@
+import pytest
+from fastapi.testclient import TestClient
+from langchain_core.exceptions import OutputParserException
+from langchain_core.language_models import FakeListChatModel
+
+from run import app
+from src.utils import tracing
+from src.utils.cache import DiskCache, LLMCache
+from src.utils.tracing import recent_spans, span, traced, tracing_callback
+
+
+def test_spans_are_nested_and_classify_errors():
+    with span("outer") as attributes:
+        attributes["nodes"] = 3
+        with pytest.raises(OutputParserException):
+            with span("inner"):
+                raise OutputParserException("not json")
+
+    outer, inner = recent_spans(limit=2)
+    assert outer["name"] == "outer" and outer["nodes"] == 3
+    assert outer["status"] == "ok" and outer["parent_id"] is None
+    assert inner["parent_id"] == outer["id"]
+    assert inner["trace_id"] == outer["trace_id"]
+    assert inner["status"] == "error" and inner["error"] == "parse"
+
+
+def test_llm_tokens_are_counted_on_the_enclosing_span(monkeypatch):
+    monkeypatch.setitem(tracing._encodings, "unknown", None)
+    llm = FakeListChatModel(responses=["12345678"], callbacks=[tracing_callback])
+
+    with span("stage"):
+        llm.invoke("abcdefghijkl")
+
+    stage = recent_spans(limit=1, name="stage")[0]
+    assert stage["prompt_tokens"] == 3
+    assert stage["completion_tokens"] == 2
+    assert recent_spans(limit=1, name="llm")[0]["parent_id"] == stage["id"]
+
+
+def test_cached_responses_are_not_counted_as_tokens(tmp_path, monkeypatch):
+    monkeypatch.setitem(tracing._encodings, "unknown", None)
+    llm = FakeListChatModel(
+        responses=["12345678"],
+        cache=LLMCache(DiskCache(tmp_path / "responses.sqlite")),
+        callbacks=[tracing_callback],
+    )
+    key = (("kind", "prompt"), ("model", "unknown"))
+    before = tracing.LLM_TOKENS._values.get(key, 0)
+
+    llm.invoke("abcdefghijkl")
+    llm.invoke("abcdefghijkl")
+
+    assert tracing.LLM_TOKENS._values[key] == before + 3
+    hit, call = recent_spans(limit=2, name="llm")
+    assert hit["cached"] and "cached" not in call
+
+
+def test_traced_records_one_span_per_item():
+    assert list(traced(iter("ab"), "step")) == ["a", "b"]
+    assert [s["step"] for s in recent_spans(limit=2, name="step")] == [1, 0]
+
+
+def test_metrics_endpoint_exposes_histograms():
+    with span("metrics.test"):
+        pass
+
+    response = TestClient(app).get("/metrics")
+    assert response.status_code == 200
+    assert (
+        'hackepeter_span_duration_seconds_count{span="metrics.test",status="ok"} 1'
+        in response.text
+    )